@@ -15,15 +15,15 @@ def create_app():
     
     app.config['SEND_FILE_MAX_AGE_DEFAULT'] = 0
     
+    from services.http_cache import apply_cache_policy
+    from services.route_index import rebuild_route_index
+    
     @app.after_request
     def add_header(response):
         from flask import request
         if request.path.startswith('/wm/') or request.path.startswith('/static/'):
             return response
-        response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
-        response.headers['Pragma'] = 'no-cache'
-        response.headers['Expires'] = '0'
-        return response
+        return apply_cache_policy(response)
     
     db.init_app(app)
     migrate.init_app(app, db)
@@ -43,17 +43,34 @@ def create_app():
     check_redirects(app)
     
     from cli.admin import admin_cli
+    from cli.images import images_cli
+    from cli.catalog import catalog_cli
     app.cli.add_command(admin_cli)
+    app.cli.add_command(images_cli)
+    app.cli.add_command(catalog_cli)
+    
+    from flask_migrate.cli import db as db_cli
+    from cli.db import explain_hot
+    db_cli.add_command(explain_hot)
     
     @app.context_processor
     def inject_now():
         return {'now': datetime.utcnow}
     
+    from services.watermark_cache import WIDTH_BUCKETS, snap_width
+    
     @app.template_global()
-    def watermark_url(image_type, image_id):
+    def watermark_url(image_type, image_id, width=None):
         """Generate URL for watermarked gallery image."""
+        if width:
+            return f'/wm/{image_type}/{image_id}/?w={snap_width(width)}'
         return f'/wm/{image_type}/{image_id}/'
     
+    @app.template_global()
+    def watermark_srcset(image_type, image_id):
+        """Generate srcset with resized derivatives of gallery image."""
+        return ', '.join(f'{watermark_url(image_type, image_id, w)} {w}w' for w in WIDTH_BUCKETS)
+    
     @app.errorhandler(404)
     def not_found(e):
         return render_template('public/404.html'), 404
@@ -65,6 +82,9 @@ def create_app():
     with app.app_context():
         db.create_all()
         init_default_data()
+        compile_accessory_indexes()
+        build_size_prices()
+        rebuild_route_index()
     
     return app
 
@@ -113,7 +133,8 @@ def init_default_data():
             setting = Setting(**setting_data)
             db.session.add(setting)
     
-    if not RedirectRule.query.filter_by(from_path='/catalog/*', is_pattern=True).first():
+    # Only the id column: runs before `flask db upgrade` adds new RedirectRule columns
+    if not db.session.query(RedirectRule.id).filter_by(from_path='/catalog/*', is_pattern=True).first():
         catalog_redirect = RedirectRule(
             from_path='/catalog/*',
             to_path='/*',
@@ -127,6 +148,39 @@ def init_default_data():
     db.session.commit()
 
 
+def compile_accessory_indexes():
+    """Compile table index and compatibility matrix for accessory blocks saved before they existed."""
+    from sqlalchemy.exc import SQLAlchemyError
+    from models import AccessoryBlock
+    from services.size_matcher import compile_accessory_blocks
+    from services.accessory_compat import ensure_compatibility
+    
+    try:
+        blocks = AccessoryBlock.query.filter(AccessoryBlock.table_index.is_(None)).all()
+        if blocks:
+            compiled = compile_accessory_blocks(blocks)
+            db.session.commit()
+            logger.info(f"Compiled accessory table index for {compiled} blocks")
+        ensure_compatibility()
+    except SQLAlchemyError as e:
+        # Column is missing until `flask db upgrade` runs, which itself loads the app
+        db.session.rollback()
+        logger.warning(f"Accessory table index not compiled: {e.__class__.__name__}")
+
+
+def build_size_prices():
+    """Fill the size price table on first start."""
+    from sqlalchemy.exc import SQLAlchemyError
+    from services.size_prices import ensure_size_prices
+    
+    try:
+        ensure_size_prices()
+    except SQLAlchemyError as e:
+        # size_items.sort_key is missing until `flask db upgrade` runs, which itself loads the app
+        db.session.rollback()
+        logger.warning(f"Size price table not built: {e.__class__.__name__}")
+
+
 app = create_app()
 
 if __name__ == '__main__':
@@ -1,14 +1,28 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, current_app, jsonify, Response, make_response
+from flask import Blueprint, render_template, request, redirect, url_for, flash, current_app, jsonify, Response, make_response, stream_with_context, send_file
+from sqlalchemy import select
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
 from flask_login import login_user, logout_user, login_required, current_user
 from werkzeug.utils import secure_filename
 from extensions import db, login_manager
-from models import User, Page, MenuItem, Category, ProductLine, SizeItem, News, DocumentFile, DocumentType, Lead, RedirectRule, Setting, Service, SiteSection, ServiceImage, HomeGalleryImage, ProductLineImage, AccessoryBlock, AccessoryImage
-from services.importers import import_categories_csv, import_product_lines_csv, import_size_items_csv, import_news_csv
+from models import User, Page, MenuItem, Category, ProductLine, SizeItem, News, DocumentFile, DocumentType, Lead, RedirectRule, Setting, Service, SiteSection, ServiceImage, HomeGalleryImage, ProductLineImage, AccessoryBlock, AccessoryImage, ImportJob
+from services.importers import import_redirects_csv, DRY_RUN_KINDS
+from services.import_jobs import create_import_job, get_job_status, apply_dry_run, can_apply
 from services.slug import generate_slug, is_reserved_slug, validate_slug
 from services.image_uploader import save_uploaded_image, delete_image
+from services.watermark_cache import purge_cache as purge_watermark_cache
+from services.size_matcher import compile_accessory_table
+from services.accessory_compat import (get_block_usage, refresh_blocks as refresh_compat_blocks,
+                                       refresh_size_items as refresh_compat_size_items)
+from services.size_prices import rebuild_size_prices, refresh_size_items as refresh_price_size_items
+from services.prerender_queue import enqueue_prerender
+from services.page_cache import get_page_cache_stats, clear_page_cache
+from services.redirect_stats import flush_hits as flush_redirect_hits
 from config import Config
 import os
 import bleach
+import tempfile
 
 admin_bp = Blueprint('admin', __name__, url_prefix='/admin')
 
@@ -77,6 +91,11 @@ def csv_template(template_type):
             'headers': 'category_slug;product_slug;size_text;sku;price;unit;in_stock;pipe_dxs;pressure;mass_per_m;min_bend_radius;max_len_coil;max_len_drum',
             'example': 'polietilenovye-truby;pe-100-sdr-11;32x3.0;PE100-32-3;150.00;м;1;32x3.0;1.0 МПа;0.29;0.5;200;500'
         },
+        'redirects': {
+            'filename': 'redirects_template.csv',
+            'headers': 'old_url,new_url,code,comment',
+            'example': '/catalog/izoprofleks/,/izoprofleks/,301,Старый сайт'
+        },
         'news': {
             'filename': 'news_template.csv',
             'headers': 'date;title;slug;content;seo_title;seo_description;h1;is_published',
@@ -107,158 +126,230 @@ def escape_csv_field(value):
     return s
 
 
-@admin_bp.route('/csv-export/categories/')
-@login_required
-def csv_export_categories():
-    search = request.args.get('search', '', type=str).strip().lower()
-    query = Category.query
-    if search:
-        query = query.filter(Category.name.ilike(f'%{search}%'))
-    categories = query.order_by(Category.sort_order).all()
-    lines = ['name;slug;sort_order;is_active;seo_title;seo_description;h1;seo_text_html']
-    for c in categories:
-        row = ';'.join([
-            escape_csv_field(c.name),
-            escape_csv_field(c.slug),
-            str(c.sort_order or 0),
-            '1' if c.is_active else '0',
-            escape_csv_field(c.seo_title),
-            escape_csv_field(c.seo_description),
-            escape_csv_field(c.h1),
-            escape_csv_field(c.seo_text_html)
-        ])
-        lines.append(row)
-    content = '\n'.join(lines) + '\n'
+# Rows fetched per round trip while streaming an export (server-side cursor on PostgreSQL)
+CSV_EXPORT_BATCH_SIZE = 1000
+
+
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+
+def _xlsx_cell(sheet, value):
+    if not isinstance(value, str):
+        return value
+    cell = WriteOnlyCell(sheet, ILLEGAL_CHARACTERS_RE.sub('', value))
+    # Text such as "=..." stays text instead of becoming a formula
+    cell.data_type = 's'
+    return cell
+
+
+def _iter_export_rows(statement, format_row):
+    result = db.session.execute(statement.execution_options(yield_per=CSV_EXPORT_BATCH_SIZE))
+    for rows in result.partitions():
+        yield [format_row(row) for row in rows]
+
+
+def csv_export_response(name, columns, statement, format_row):
+    """
+    Stream a CSV export row batch by row batch.
+
+    The statement selects only the exported columns; rows come as tuples
+    through yield_per, so memory does not grow with the catalog and the
+    header goes out before the query runs. format_row returns the cell values.
+    """
+    def generate():
+        yield ';'.join(columns) + '\n'
+        for rows in _iter_export_rows(statement, format_row):
+            yield ''.join(';'.join(escape_csv_field(value) for value in values) + '\n' for values in rows)
+    
     return Response(
-        content,
+        stream_with_context(generate()),
         mimetype='text/csv; charset=utf-8',
-        headers={'Content-Disposition': 'attachment; filename=categories_export.csv'}
+        headers={'Content-Disposition': f'attachment; filename={name}_export.csv'}
     )
 
 
-@admin_bp.route('/csv-export/product-lines/')
+def xlsx_export_response(name, columns, statement, format_row):
+    """
+    Same export as csv_export_response as an XLSX workbook.
+
+    A write-only workbook keeps rows in a temporary file rather than in
+    memory; the finished file is sent from disk and removed when closed.
+    """
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(name)
+    sheet.append(columns)
+    for rows in _iter_export_rows(statement, format_row):
+        for values in rows:
+            sheet.append([_xlsx_cell(sheet, value) for value in values])
+    output = tempfile.TemporaryFile()
+    workbook.save(output)
+    output.seek(0)
+    return send_file(output, mimetype=XLSX_MIMETYPE, as_attachment=True, download_name=f'{name}_export.xlsx')
+
+
+def _categories_export():
+    search = request.args.get('search', '', type=str).strip().lower()
+    query = select(
+        Category.name, Category.slug, Category.sort_order, Category.is_active,
+        Category.seo_title, Category.seo_description, Category.h1, Category.seo_text_html
+    )
+    if search:
+        query = query.where(Category.name.ilike(f'%{search}%'))
+    
+    def format_row(c):
+        return [c.name, c.slug, c.sort_order or 0, 1 if c.is_active else 0,
+                c.seo_title, c.seo_description, c.h1, c.seo_text_html]
+    
+    return (
+        'categories',
+        ['name', 'slug', 'sort_order', 'is_active', 'seo_title', 'seo_description', 'h1', 'seo_text_html'],
+        query.order_by(Category.sort_order),
+        format_row
+    )
+
+
+@admin_bp.route('/csv-export/categories/')
 @login_required
-def csv_export_product_lines():
+def csv_export_categories():
+    return csv_export_response(*_categories_export())
+
+
+@admin_bp.route('/xlsx-export/categories/')
+@login_required
+def xlsx_export_categories():
+    return xlsx_export_response(*_categories_export())
+
+
+def _product_lines_export():
     category_id = request.args.get('category_id', '', type=str)
     search = request.args.get('search', '', type=str).strip().lower()
     
-    query = ProductLine.query.join(Category)
+    query = select(
+        Category.slug.label('category_slug'), ProductLine.name, ProductLine.slug, ProductLine.sort_order,
+        ProductLine.is_active, ProductLine.seo_title, ProductLine.seo_description, ProductLine.h1,
+        ProductLine.seo_text_html
+    ).join(ProductLine.category)
     
     if category_id:
-        query = query.filter(ProductLine.category_id == int(category_id))
+        query = query.where(ProductLine.category_id == int(category_id))
     if search:
-        query = query.filter(
+        query = query.where(
             db.or_(
                 Category.name.ilike(f'%{search}%'),
                 ProductLine.name.ilike(f'%{search}%')
             )
         )
-        
-    product_lines = query.order_by(Category.sort_order, ProductLine.sort_order).all()
-    lines = ['category_slug;name;slug;sort_order;is_active;seo_title;seo_description;h1;seo_text_html']
-    for pl in product_lines:
-        row = ';'.join([
-            escape_csv_field(pl.category.slug),
-            escape_csv_field(pl.name),
-            escape_csv_field(pl.slug),
-            str(pl.sort_order or 0),
-            '1' if pl.is_active else '0',
-            escape_csv_field(pl.seo_title),
-            escape_csv_field(pl.seo_description),
-            escape_csv_field(pl.h1),
-            escape_csv_field(pl.seo_text_html)
-        ])
-        lines.append(row)
-    content = '\n'.join(lines) + '\n'
-    return Response(
-        content,
-        mimetype='text/csv; charset=utf-8',
-        headers={'Content-Disposition': 'attachment; filename=product_lines_export.csv'}
+    
+    def format_row(pl):
+        return [pl.category_slug, pl.name, pl.slug, pl.sort_order or 0, 1 if pl.is_active else 0,
+                pl.seo_title, pl.seo_description, pl.h1, pl.seo_text_html]
+    
+    return (
+        'product_lines',
+        ['category_slug', 'name', 'slug', 'sort_order', 'is_active', 'seo_title', 'seo_description', 'h1',
+         'seo_text_html'],
+        query.order_by(Category.sort_order, ProductLine.sort_order),
+        format_row
     )
 
 
-@admin_bp.route('/csv-export/size-items/')
+@admin_bp.route('/csv-export/product-lines/')
 @login_required
-def csv_export_size_items():
+def csv_export_product_lines():
+    return csv_export_response(*_product_lines_export())
+
+
+@admin_bp.route('/xlsx-export/product-lines/')
+@login_required
+def xlsx_export_product_lines():
+    return xlsx_export_response(*_product_lines_export())
+
+
+def _size_items_export():
     category_id = request.args.get('category_id', '', type=str)
     product_line_id = request.args.get('product_line_id', '', type=str)
     search = request.args.get('search', '', type=str).strip().lower()
     
-    query = SizeItem.query.join(ProductLine).join(Category)
+    query = select(
+        Category.slug.label('category_slug'), ProductLine.slug.label('product_slug'),
+        SizeItem.size_text, SizeItem.sku, SizeItem.price, SizeItem.unit, SizeItem.in_stock,
+        SizeItem.pipe_dxs, SizeItem.pressure, SizeItem.mass_per_m, SizeItem.min_bend_radius,
+        SizeItem.max_len_coil, SizeItem.max_len_drum
+    ).join(SizeItem.product_line).join(ProductLine.category)
     
     if category_id:
-        query = query.filter(ProductLine.category_id == int(category_id))
+        query = query.where(ProductLine.category_id == int(category_id))
     if product_line_id:
-        query = query.filter(SizeItem.product_line_id == int(product_line_id))
+        query = query.where(SizeItem.product_line_id == int(product_line_id))
     if search:
-        query = query.filter(
+        query = query.where(
             db.or_(
                 Category.name.ilike(f'%{search}%'),
                 ProductLine.name.ilike(f'%{search}%'),
                 SizeItem.size_text.ilike(f'%{search}%')
             )
         )
-        
-    size_items = query.order_by(
-        Category.sort_order, ProductLine.sort_order, SizeItem.size_text
-    ).all()
-    lines = ['category_slug;product_slug;size_text;sku;price;unit;in_stock;pipe_dxs;pressure;mass_per_m;min_bend_radius;max_len_coil;max_len_drum']
-    for si in size_items:
-        row = ';'.join([
-            escape_csv_field(si.product_line.category.slug),
-            escape_csv_field(si.product_line.slug),
-            escape_csv_field(si.size_text),
-            escape_csv_field(si.sku),
-            str(si.price or 0),
-            escape_csv_field(si.unit),
-            '1' if si.in_stock else '0',
-            escape_csv_field(si.pipe_dxs),
-            escape_csv_field(si.pressure),
-            escape_csv_field(si.mass_per_m),
-            escape_csv_field(si.min_bend_radius),
-            escape_csv_field(si.max_len_coil),
-            escape_csv_field(si.max_len_drum)
-        ])
-        lines.append(row)
-    content = '\n'.join(lines) + '\n'
-    return Response(
-        content,
-        mimetype='text/csv; charset=utf-8',
-        headers={'Content-Disposition': 'attachment; filename=size_items_export.csv'}
+    
+    def format_row(si):
+        return [si.category_slug, si.product_slug, si.size_text, si.sku, si.price or 0, si.unit,
+                1 if si.in_stock else 0, si.pipe_dxs, si.pressure, si.mass_per_m, si.min_bend_radius,
+                si.max_len_coil, si.max_len_drum]
+    
+    return (
+        'size_items',
+        ['category_slug', 'product_slug', 'size_text', 'sku', 'price', 'unit', 'in_stock', 'pipe_dxs', 'pressure',
+         'mass_per_m', 'min_bend_radius', 'max_len_coil', 'max_len_drum'],
+        query.order_by(Category.sort_order, ProductLine.sort_order, SizeItem.size_text),
+        format_row
     )
 
 
-@admin_bp.route('/csv-export/news/')
+@admin_bp.route('/csv-export/size-items/')
 @login_required
-def csv_export_news():
+def csv_export_size_items():
+    return csv_export_response(*_size_items_export())
+
+
+@admin_bp.route('/xlsx-export/size-items/')
+@login_required
+def xlsx_export_size_items():
+    return xlsx_export_response(*_size_items_export())
+
+
+def _news_export():
     search = request.args.get('search', '', type=str).strip().lower()
-    query = News.query
+    query = select(
+        News.date, News.title, News.slug, News.content_html, News.seo_title, News.seo_description,
+        News.h1, News.is_published
+    )
     if search:
-        query = query.filter(News.title.ilike(f'%{search}%'))
-        
-    news_list = query.order_by(News.date.desc()).all()
-    lines = ['date;title;slug;content;seo_title;seo_description;h1;is_published']
-    for n in news_list:
-        date_str = n.date.strftime('%d.%m.%Y') if n.date else ''
-        row = ';'.join([
-            date_str,
-            escape_csv_field(n.title),
-            escape_csv_field(n.slug),
-            escape_csv_field(n.content_html),
-            escape_csv_field(n.seo_title),
-            escape_csv_field(n.seo_description),
-            escape_csv_field(n.h1),
-            '1' if n.is_published else '0'
-        ])
-        lines.append(row)
-    content = '\n'.join(lines) + '\n'
-    return Response(
-        content,
-        mimetype='text/csv; charset=utf-8',
-        headers={'Content-Disposition': 'attachment; filename=news_export.csv'}
+        query = query.where(News.title.ilike(f'%{search}%'))
+    
+    def format_row(n):
+        # Text date in the format the importer reads
+        return [n.date.strftime('%d.%m.%Y') if n.date else '', n.title, n.slug, n.content_html,
+                n.seo_title, n.seo_description, n.h1, 1 if n.is_published else 0]
+    
+    return (
+        'news',
+        ['date', 'title', 'slug', 'content', 'seo_title', 'seo_description', 'h1', 'is_published'],
+        query.order_by(News.date.desc()),
+        format_row
     )
 
 
+@admin_bp.route('/csv-export/news/')
+@login_required
+def csv_export_news():
+    return csv_export_response(*_news_export())
+
+
+@admin_bp.route('/xlsx-export/news/')
+@login_required
+def xlsx_export_news():
+    return xlsx_export_response(*_news_export())
+
+
 @admin_bp.route('/')
 @login_required
 def dashboard():
@@ -273,7 +364,16 @@ def dashboard():
         'services': Service.query.count()
     }
     recent_leads = Lead.query.order_by(Lead.created_at.desc()).limit(5).all()
-    return render_template('admin/dashboard.html', stats=stats, recent_leads=recent_leads)
+    return render_template('admin/dashboard.html', stats=stats, recent_leads=recent_leads,
+                           page_cache=get_page_cache_stats())
+
+
+@admin_bp.route('/page-cache/clear/', methods=['POST'])
+@login_required
+def page_cache_clear():
+    clear_page_cache()
+    flash('Кэш страниц очищен', 'success')
+    return redirect(url_for('admin.dashboard'))
 
 
 SECTION_TITLES = {
@@ -314,6 +414,7 @@ def section_edit(section_key):
         section.seo_text_html = sanitize_html(request.form.get('seo_text_html', ''))
         section.gallery_interval = int(request.form.get('gallery_interval', 5) or 5)
         
+        new_images = []
         if section_key == 'index':
             delete_ids = request.form.getlist('delete_gallery[]')
             for del_id in delete_ids:
@@ -333,8 +434,10 @@ def section_edit(section_key):
                             sort_order=max_order + i + 1
                         )
                         db.session.add(gimg)
+                        new_images.append(gimg)
         
         db.session.commit()
+        enqueue_prerender(new_images)
         flash(f'Раздел "{section.title}" сохранен', 'success')
         return redirect(url_for('admin.section_edit', section_key=section_key))
     
@@ -377,6 +480,7 @@ def services_add():
         
         files = request.files.getlist('gallery_images')
         main_index = int(request.form.get('main_image_index', 0) or 0)
+        new_images = []
         for i, file in enumerate(files):
             if file and file.filename:
                 img_path = save_uploaded_image(file, 'services')
@@ -388,7 +492,9 @@ def services_add():
                         sort_order=i
                     )
                     db.session.add(simg)
+                    new_images.append(simg)
         db.session.commit()
+        enqueue_prerender(new_images)
         
         flash('Услуга добавлена', 'success')
         return redirect(url_for('admin.services_list'))
@@ -429,6 +535,7 @@ def services_edit(id):
         
         files = request.files.getlist('gallery_images')
         max_order = db.session.query(db.func.max(ServiceImage.sort_order)).filter_by(service_id=service.id).scalar() or 0
+        new_images = []
         for i, file in enumerate(files):
             if file and file.filename:
                 img_path = save_uploaded_image(file, 'services')
@@ -440,8 +547,10 @@ def services_edit(id):
                         sort_order=max_order + i + 1
                     )
                     db.session.add(simg)
+                    new_images.append(simg)
         
         db.session.commit()
+        enqueue_prerender(new_images)
         flash('Услуга обновлена', 'success')
         return redirect(url_for('admin.services_edit', id=service.id))
     return render_template('admin/services_form.html', service=service)
@@ -749,21 +858,51 @@ def categories_delete(id):
     return redirect(url_for('admin.categories_list'))
 
 
-@admin_bp.route('/categories/import/', methods=['GET', 'POST'])
-@login_required
-def categories_import():
+def _csv_import_view(kind, entity, back_url):
+    """
+    Upload form of a CSV import. The file is queued as an ImportJob and applied in
+    the background; the page then polls import_job_status for progress.
+    """
     if request.method == 'POST':
         file = request.files.get('csv_file')
-        if file:
-            results = import_categories_csv(file.read())
-            flash(f"Импортировано: {results['success']}. Ошибок: {len(results['errors'])}", 
-                  'success' if not results['errors'] else 'warning')
-            if results['errors']:
-                for err in results['errors'][:5]:
-                    flash(err, 'danger')
-        return redirect(url_for('admin.categories_list'))
+        if not file:
+            return redirect(back_url)
+        job = create_import_job(kind, file, dry_run=request.form.get('dry_run') == 'on')
+        args = request.args.to_dict()
+        args['job'] = job.id
+        return redirect(url_for(request.endpoint, **args))
     
-    return render_template('admin/import_csv.html', entity='категории', template_type='categories')
+    job = None
+    job_id = request.args.get('job', type=int)
+    if job_id:
+        job = ImportJob.query.filter_by(id=job_id, kind=kind).first()
+    return render_template('admin/import_csv.html', entity=entity, template_type=kind, job=job, back_url=back_url,
+                           dry_run_supported=kind in DRY_RUN_KINDS)
+
+
+@admin_bp.route('/import-jobs/<int:id>/')
+@login_required
+def import_job_status(id):
+    job = ImportJob.query.get_or_404(id)
+    return jsonify(get_job_status(job))
+
+
+@admin_bp.route('/import-jobs/<int:id>/apply/', methods=['POST'])
+@login_required
+def import_job_apply(id):
+    job = ImportJob.query.get_or_404(id)
+    if not can_apply(job):
+        flash('Проверка не завершена или файл уже удалён, загрузите файл заново', 'danger')
+        return redirect(request.referrer or url_for('admin.dashboard'))
+    applied = apply_dry_run(job)
+    endpoint = {'size_items': 'admin.size_items_import', 'product_lines': 'admin.product_lines_import'}[job.kind]
+    return redirect(url_for(endpoint, job=applied.id))
+
+
+@admin_bp.route('/categories/import/', methods=['GET', 'POST'])
+@login_required
+def categories_import():
+    return _csv_import_view('categories', 'категории', url_for('admin.categories_list'))
 
 
 @admin_bp.route('/product-lines/')
@@ -912,6 +1051,7 @@ def product_lines_edit(id):
         
         files = request.files.getlist('gallery_images')
         max_order = db.session.query(db.func.max(ProductLineImage.sort_order)).filter_by(product_line_id=pl.id).scalar() or 0
+        new_images = []
         for i, file in enumerate(files):
             if file and file.filename:
                 img_path = save_uploaded_image(file, 'products')
@@ -923,8 +1063,12 @@ def product_lines_edit(id):
                         sort_order=max_order + i + 1
                     )
                     db.session.add(pimg)
+                    new_images.append(pimg)
         
+        # Discount and hide_price of the line feed the prices of its size items
+        rebuild_size_prices([pl.id])
         db.session.commit()
+        enqueue_prerender(new_images)
         flash('Линейка обновлена', 'success')
         return redirect(url_for('admin.product_lines_edit', id=pl.id))
     
@@ -948,18 +1092,7 @@ def product_lines_delete(id):
 @admin_bp.route('/product-lines/import/', methods=['GET', 'POST'])
 @login_required
 def product_lines_import():
-    if request.method == 'POST':
-        file = request.files.get('csv_file')
-        if file:
-            results = import_product_lines_csv(file.read())
-            flash(f"Импортировано: {results['success']}. Ошибок: {len(results['errors'])}", 
-                  'success' if not results['errors'] else 'warning')
-            if results['errors']:
-                for err in results['errors'][:5]:
-                    flash(err, 'danger')
-        return redirect(url_for('admin.product_lines_list'))
-    
-    return render_template('admin/import_csv.html', entity='линейки', template_type='product_lines')
+    return _csv_import_view('product_lines', 'линейки', url_for('admin.product_lines_list'))
 
 
 @admin_bp.route('/product-line-image/<int:image_id>/rotate/', methods=['POST'])
@@ -1006,11 +1139,13 @@ def accessory_blocks_add(pl_id):
             sort_order=int(request.form.get('sort_order', 0) or 0),
             is_active=request.form.get('is_active') == 'on'
         )
+        block.table_index = compile_accessory_table(block.table_html)
         db.session.add(block)
         db.session.flush() # Get block.id
         
         # Handle gallery images
         files = request.files.getlist('gallery_images')
+        new_images = []
         for file in files:
             if file and file.filename:
                 img_path = save_uploaded_image(file, 'accessories')
@@ -1020,8 +1155,11 @@ def accessory_blocks_add(pl_id):
                         image_path=img_path
                     )
                     db.session.add(aimg)
+                    new_images.append(aimg)
         
+        refresh_compat_blocks([block])
         db.session.commit()
+        enqueue_prerender(new_images)
         flash('Блок комплектующих добавлен', 'success')
         return redirect(url_for('admin.accessory_blocks_edit', id=block.id))
     
@@ -1063,6 +1201,7 @@ def accessory_blocks_edit(id):
         block.name = request.form.get('name', '').strip()
         block.description_html = sanitize_html(request.form.get('description_html', ''))
         block.table_html = sanitize_html(request.form.get('table_html', ''))
+        block.table_index = compile_accessory_table(block.table_html)
         block.sort_order = int(request.form.get('sort_order', 0) or 0)
         block.gallery_interval = int(request.form.get('gallery_interval', 5) or 5)
         block.use_outer_diameter = request.form.get('use_outer_diameter') == 'on'
@@ -1107,6 +1246,7 @@ def accessory_blocks_edit(id):
         
         # Add new images
         files = request.files.getlist('gallery_images')
+        new_images = []
         for file in files:
             if file and file.filename:
                 img_path = save_uploaded_image(file, 'accessories')
@@ -1116,8 +1256,11 @@ def accessory_blocks_edit(id):
                         image_path=img_path
                     )
                     db.session.add(aimg)
+                    new_images.append(aimg)
         
+        refresh_compat_blocks([block])
         db.session.commit()
+        enqueue_prerender(new_images)
         flash('Блок комплектующих обновлен', 'success')
         return redirect(url_for('admin.accessory_blocks_edit', id=block.id))
     
@@ -1141,6 +1284,17 @@ def accessory_blocks_delete(id):
     return redirect(url_for('admin.accessory_blocks_list', pl_id=pl_id))
 
 
+@admin_bp.route('/accessories/<int:id>/where-used/')
+@login_required
+def accessory_blocks_where_used(id):
+    block = AccessoryBlock.query.get_or_404(id)
+    usage = get_block_usage(block)
+    return render_template('admin/accessory_blocks_where_used.html',
+                           product_line=block.product_line,
+                           block=block,
+                           usage=usage)
+
+
 @admin_bp.route('/product-lines/<int:pl_id>/accessories/copy/')
 @login_required
 def accessory_blocks_copy_select(pl_id):
@@ -1169,6 +1323,7 @@ def accessory_blocks_copy(block_id, target_pl_id):
         name=source_block.name,
         description_html=source_block.description_html,
         table_html=source_block.table_html,
+        table_index=compile_accessory_table(source_block.table_html),
         sort_order=source_block.sort_order,
         gallery_interval=source_block.gallery_interval,
         use_outer_diameter=source_block.use_outer_diameter,
@@ -1190,6 +1345,7 @@ def accessory_blocks_copy(block_id, target_pl_id):
     db.session.add(new_block)
     db.session.flush()
     
+    new_images = []
     for src_img in source_block.images.order_by(AccessoryImage.sort_order).all():
         src_path = src_img.image_path
         new_img_path = None
@@ -1217,8 +1373,11 @@ def accessory_blocks_copy(block_id, target_pl_id):
                 no_watermark=src_img.no_watermark
             )
             db.session.add(new_img)
+            new_images.append(new_img)
     
+    refresh_compat_blocks([new_block])
     db.session.commit()
+    enqueue_prerender(new_images)
     flash(f'Блок "{source_block.name}" скопирован в линейку "{target_pl.name}"', 'success')
     return redirect(url_for('admin.accessory_blocks_list', pl_id=target_pl_id))
 
@@ -1306,6 +1465,9 @@ def size_items_add():
             max_len_drum=request.form.get('max_len_drum', '')
         )
         db.session.add(si)
+        db.session.flush()
+        refresh_compat_size_items([si])
+        refresh_price_size_items([si])
         db.session.commit()
         flash('Типоразмер создан', 'success')
         
@@ -1378,6 +1540,8 @@ def size_items_edit(id):
         si.min_bend_radius = request.form.get('min_bend_radius', '')
         si.max_len_coil = request.form.get('max_len_coil', '')
         si.max_len_drum = request.form.get('max_len_drum', '')
+        refresh_compat_size_items([si])
+        refresh_price_size_items([si])
         db.session.commit()
         flash('Типоразмер обновлён', 'success')
         
@@ -1427,21 +1591,11 @@ def size_items_bulk_delete():
 @admin_bp.route('/size-items/import/', methods=['GET', 'POST'])
 @login_required
 def size_items_import():
-    if request.method == 'POST':
-        file = request.files.get('csv_file')
-        if file:
-            results = import_size_items_csv(file.read())
-            flash(f"Импортировано: {results['success']}. Ошибок: {len(results['errors'])}", 
-                  'success' if not results['errors'] else 'warning')
-            if results['errors']:
-                for err in results['errors'][:5]:
-                    flash(err, 'danger')
-        return redirect(url_for('admin.size_items_list', 
-                               category_id=request.args.get('category_id'),
-                               product_line_id=request.args.get('product_line_id'),
-                               search=request.args.get('search')))
-    
-    return render_template('admin/import_csv.html', entity='типоразмеры', template_type='size_items')
+    # Compatibility and price tables of the imported lines are rebuilt when the job finishes
+    return _csv_import_view('size_items', 'типоразмеры', url_for('admin.size_items_list',
+                                                                 category_id=request.args.get('category_id'),
+                                                                 product_line_id=request.args.get('product_line_id'),
+                                                                 search=request.args.get('search')))
 
 
 @admin_bp.route('/news/')
@@ -1525,18 +1679,7 @@ def news_delete(id):
 @admin_bp.route('/news/import/', methods=['GET', 'POST'])
 @login_required
 def news_import():
-    if request.method == 'POST':
-        file = request.files.get('csv_file')
-        if file:
-            results = import_news_csv(file.read())
-            flash(f"Импортировано: {results['success']}. Ошибок: {len(results['errors'])}", 
-                  'success' if not results['errors'] else 'warning')
-            if results['errors']:
-                for err in results['errors'][:5]:
-                    flash(err, 'danger')
-        return redirect(url_for('admin.news_list'))
-    
-    return render_template('admin/import_csv.html', entity='новости', template_type='news')
+    return _csv_import_view('news', 'новости', url_for('admin.news_list'))
 
 
 @admin_bp.route('/document-types/')
@@ -1768,8 +1911,31 @@ def leads_status(id):
 @admin_bp.route('/redirects/')
 @login_required
 def redirects_list():
-    redirects = RedirectRule.query.order_by(RedirectRule.created_at.desc()).all()
-    return render_template('admin/redirects_list.html', redirects=redirects)
+    flush_redirect_hits()
+    query = RedirectRule.query
+    unused = request.args.get('unused') == '1'
+    if unused:
+        query = query.filter(RedirectRule.hit_count == 0)
+    redirects = query.order_by(RedirectRule.created_at.desc()).all()
+    return render_template('admin/redirects_list.html', redirects=redirects, unused=unused)
+
+
+@admin_bp.route('/redirects/import/', methods=['GET', 'POST'])
+@login_required
+def redirects_import():
+    if request.method == 'POST':
+        file = request.files.get('csv_file')
+        if file:
+            results = import_redirects_csv(file.stream, collapse_chains=request.form.get('collapse_chains') == 'on')
+            flash(f"Создано: {results['created']}, обновлено: {results['updated']}, без изменений: {results['unchanged']}, "
+                  f"дублей: {results['duplicates']}, цепочек сокращено: {results['collapsed']}, циклов: {results['loops']}",
+                  'success' if not results['errors'] else 'warning')
+            if results['errors']:
+                for err in results['errors'][:5]:
+                    flash(err, 'danger')
+        return redirect(url_for('admin.redirects_list'))
+    
+    return render_template('admin/redirects_import.html')
 
 
 @admin_bp.route('/redirects/add/', methods=['GET', 'POST'])
@@ -1913,6 +2079,7 @@ def watermark_upload():
         db.session.add(setting)
     
     db.session.commit()
+    purge_watermark_cache()
     flash('Водяной знак загружен', 'success')
     return redirect(url_for('admin.settings_list'))
 
@@ -1928,6 +2095,7 @@ def watermark_delete():
             os.remove(setting.value)
         setting.value = ''
         db.session.commit()
+        purge_watermark_cache()
         flash('Водяной знак удалён', 'success')
     else:
         flash('Водяной знак не найден', 'error')
@@ -1,14 +1,24 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, abort, Response, send_file, make_response, jsonify
+from flask import Blueprint, render_template, request, redirect, url_for, flash, abort, Response, send_file, make_response, jsonify, stream_with_context
 from extensions import db
-from models import Page, MenuItem, Category, ProductLine, SizeItem, News, Lead, Setting, Service, SiteSection, HomeGalleryImage, ProductLineImage, AccessoryBlock, ServiceImage, DocumentFile, DocumentType
+from models import Page, Category, ProductLine, SizeItem, News, Lead, Service, HomeGalleryImage, AccessoryBlock, ServiceImage, DocumentFile, DocumentType, GALLERY_IMAGE_MODELS
 from services.seo import get_page_seo, get_canonical_url, get_og_tags
 from services.schema import generate_product_jsonld, generate_breadcrumb_jsonld, generate_organization_jsonld
 from services.image_utils import get_watermarked_image_bytes
+from services.watermark_cache import (render_variant, build_cache_key, get_output_format, get_watermark_settings, get_preferred_format,
+                                      snap_width, remember_validators, lookup_validators, CONTENT_TYPES as WATERMARK_CONTENT_TYPES)
 from services.email_service import send_lead_email
 from services.telegram_service import send_lead_to_telegram
 from services.captcha_service import generate_captcha, verify_captcha, check_honeypot
-from services.size_matcher import get_matching_accessories
-from config import RESERVED_SLUGS, Config
+from services.accessory_compat import get_size_item_accessories
+from services.size_prices import load_line_table
+from services.page_cache import cached_page
+from services.http_cache import cache_policy, note_modified
+from services.route_index import resolve_path
+from services.site_config import get_menu_items, get_menu_item_for_url, get_section
+from services.sitemap import (get_sitemap_state, get_cached_path, stream_and_cache, iter_shard_xml,
+                              render_index_xml, shard_count)
+from config import Config
+from sqlalchemy.orm import selectinload, joinedload
 from datetime import datetime
 import os
 import io
@@ -16,12 +26,8 @@ import io
 public_bp = Blueprint('public', __name__)
 
 
-def get_menu_items():
-    return MenuItem.query.filter_by(is_active=True).order_by(MenuItem.sort_order).all()
-
-
 def get_hero_for_url(url):
-    menu_item = MenuItem.query.filter_by(url=url, is_active=True).first()
+    menu_item = get_menu_item_for_url(url)
     if menu_item and menu_item.hero_image:
         return {
             'image': menu_item.hero_image,
@@ -32,7 +38,7 @@ def get_hero_for_url(url):
 
 
 def get_hero_for_section(section_key):
-    section = SiteSection.query.filter_by(section_key=section_key).first()
+    section = get_section(section_key)
     if section and section.hero_image:
         return {
             'image': section.hero_image,
@@ -90,12 +96,17 @@ def inject_menu():
 
 
 @public_bp.route('/')
+@cache_policy()
+@cached_page()
 def index():
     news = News.query.filter_by(is_published=True).order_by(News.date.desc()).limit(6).all()
     categories = Category.query.filter_by(is_active=True).order_by(Category.sort_order).all()
-    services = Service.query.filter_by(is_active=True).order_by(Service.sort_order).limit(4).all()
-    section = SiteSection.query.filter_by(section_key='index').first()
+    services = Service.query.filter_by(is_active=True).options(
+        selectinload(Service.gallery_images)
+    ).order_by(Service.sort_order).limit(4).all()
+    section = get_section('index')
     gallery_images = HomeGalleryImage.query.order_by(HomeGalleryImage.sort_order).all()
+    note_modified(section, *services)
     
     seo = {
         'title': section.seo_title if section and section.seo_title else f'{Config.SITE_NAME} — трубы, изоляция, комплектующие',
@@ -116,9 +127,12 @@ def index():
 
 
 @public_bp.route('/catalog/')
+@cache_policy()
+@cached_page()
 def catalog():
     categories = Category.query.filter_by(is_active=True).order_by(Category.sort_order).all()
-    section = SiteSection.query.filter_by(section_key='catalog').first()
+    section = get_section('catalog')
+    note_modified(section)
     
     seo = {
         'title': section.seo_title if section and section.seo_title else f'Каталог продукции — {Config.SITE_NAME}',
@@ -146,8 +160,13 @@ def catalog():
 
 
 @public_bp.route('/services/')
+@cache_policy()
+@cached_page()
 def services_list():
-    services = Service.query.filter_by(is_active=True).order_by(Service.sort_order).all()
+    services = Service.query.filter_by(is_active=True).options(
+        selectinload(Service.gallery_images)
+    ).order_by(Service.sort_order).all()
+    note_modified(*services)
     seo = {
         'title': f'Услуги — {Config.SITE_NAME}',
         'description': f'Услуги компании {Config.SITE_NAME}. Доставка, монтаж и другие сервисы.',
@@ -168,8 +187,11 @@ def services_list():
                          og=get_og_tags(seo['title'], seo['description']))
 
 @public_bp.route('/services/<slug>/')
+@cache_policy()
+@cached_page()
 def service_detail(slug):
     service = Service.query.filter_by(slug=slug, is_active=True).first_or_404()
+    note_modified(service)
     seo = get_page_seo(service)
     breadcrumbs = [
         {'name': 'Главная', 'url': '/'},
@@ -187,6 +209,8 @@ def service_detail(slug):
                          og=get_og_tags(seo['title'], seo['description']))
 
 @public_bp.route('/news/')
+@cache_policy()
+@cached_page()
 def news_list():
     news = News.query.filter_by(is_published=True).order_by(News.date.desc()).all()
     
@@ -214,6 +238,8 @@ def news_list():
 
 
 @public_bp.route('/news/<slug>/')
+@cache_policy()
+@cached_page()
 def news_detail(slug):
     news_item = News.query.filter_by(slug=slug, is_published=True).first_or_404()
     
@@ -235,12 +261,21 @@ def news_detail(slug):
 
 
 @public_bp.route('/<path:url_path>')
+@cache_policy()
+@cached_page('type', 'q')
 def static_page(url_path):
     url_path = '/' + url_path.strip('/')  + '/'
     
-    page = Page.query.filter_by(url_path=url_path, is_published=True).first()
+    # Unknown paths (bot scans, typos) are rejected without touching the DB
+    route = resolve_path(url_path)
+    if route is None:
+        abort(404)
+    kind, entity_id = route
+    
+    page = db.session.get(Page, entity_id) if kind == 'page' else None
     
-    if page:
+    if page and page.is_published:
+        note_modified(page)
         seo = get_page_seo(page)
         
         breadcrumbs = [
@@ -295,40 +330,25 @@ def static_page(url_path):
                              canonical=get_canonical_url(url_path),
                              og=get_og_tags(seo['title'], seo['description']))
     
-    parts = url_path.strip('/').split('/')
-    
-    if len(parts) >= 1:
-        category_slug = parts[0]
-        
-        if category_slug in RESERVED_SLUGS:
-            abort(404)
-        
-        category = Category.query.filter_by(slug=category_slug, is_active=True).first()
-        
-        if category:
-            if len(parts) == 1:
-                return render_category(category)
-            elif len(parts) == 2:
-                product_slug = parts[1]
-                product_line = ProductLine.query.filter_by(
-                    category_id=category.id, 
-                    slug=product_slug, 
-                    is_active=True
-                ).first_or_404()
-                return render_product_line(category, product_line)
-            elif len(parts) == 3:
-                product_slug = parts[1]
-                size_slug = parts[2]
-                product_line = ProductLine.query.filter_by(
-                    category_id=category.id, 
-                    slug=product_slug, 
-                    is_active=True
-                ).first_or_404()
-                size_item = SizeItem.query.filter_by(
-                    product_line_id=product_line.id, 
-                    size_slug=size_slug
-                ).first_or_404()
-                return render_size_item(category, product_line, size_item)
+    # One query per entity; is_active is rechecked in case the index predates an edit in another worker
+    if kind == 'category':
+        category = db.session.get(Category, entity_id)
+        if category and category.is_active:
+            return render_category(category)
+    elif kind == 'product_line':
+        product_line = ProductLine.query.options(
+            joinedload(ProductLine.category)
+        ).filter_by(id=entity_id).first()
+        if product_line and product_line.is_active and product_line.category.is_active:
+            return render_product_line(product_line.category, product_line)
+    elif kind == 'size_item':
+        size_item = SizeItem.query.options(
+            joinedload(SizeItem.product_line).joinedload(ProductLine.category)
+        ).filter_by(id=entity_id).first()
+        if size_item:
+            product_line = size_item.product_line
+            if product_line.is_active and product_line.category.is_active:
+                return render_size_item(product_line.category, product_line, size_item)
     
     abort(404)
 
@@ -337,6 +357,8 @@ def render_category(category):
     product_lines = ProductLine.query.filter_by(
         category_id=category.id, 
         is_active=True
+    ).options(
+        selectinload(ProductLine.gallery_images)
     ).order_by(ProductLine.sort_order).all()
     
     seo = get_page_seo(category)
@@ -359,29 +381,18 @@ def render_category(category):
                          og=get_og_tags(seo['title'], seo['description']))
 
 
-def get_size_sort_key(size_item):
-    """Extract numbers from size_text for numeric sorting (e.g., '110/145' -> (110, 145))"""
-    try:
-        parts = size_item.size_text.split('/')
-        first = int(''.join(c for c in parts[0] if c.isdigit()) or 0)
-        second = int(''.join(c for c in parts[1] if c.isdigit()) or 0) if len(parts) > 1 else 0
-        return (first, second)
-    except (ValueError, AttributeError, IndexError):
-        return (0, 0)
-
 def render_product_line(category, product_line):
-    size_items = SizeItem.query.filter_by(
-        product_line_id=product_line.id
-    ).all()
-    size_items.sort(key=get_size_sort_key)
+    size_items, size_prices = load_line_table(product_line)
+    note_modified(*size_items)
     
-    gallery_images = ProductLineImage.query.filter_by(
-        product_line_id=product_line.id
-    ).order_by(ProductLineImage.sort_order).all()
+    # Same collection backs product_line.get_main_image() in the template
+    gallery_images = product_line.gallery_images
     
     accessory_blocks = AccessoryBlock.query.filter_by(
         product_line_id=product_line.id,
         is_active=True
+    ).options(
+        selectinload(AccessoryBlock.gallery_images)
     ).order_by(AccessoryBlock.sort_order).all()
     
     seo = get_page_seo(product_line)
@@ -397,6 +408,7 @@ def render_product_line(category, product_line):
                          category=category,
                          product_line=product_line,
                          size_items=size_items,
+                         size_prices=size_prices,
                          gallery_images=gallery_images,
                          accessory_blocks=accessory_blocks,
                          seo=seo,
@@ -407,6 +419,7 @@ def render_product_line(category, product_line):
 
 
 def render_size_item(category, product_line, size_item):
+    note_modified(size_item)
     seo = {
         'title': size_item.full_name or f"{product_line.name} {size_item.size_text}",
         'description': f"Купить {size_item.full_name or product_line.name} {size_item.size_text}. Цена, характеристики, наличие. {Config.SITE_NAME}.",
@@ -428,7 +441,7 @@ def render_size_item(category, product_line, size_item):
         is_active=True
     ).order_by(AccessoryBlock.sort_order).all()
     
-    matching_accessories = get_matching_accessories(size_item, accessory_blocks)
+    matching_accessories = get_size_item_accessories(size_item, accessory_blocks)
     
     return render_template('public/size_item.html',
                          category=category,
@@ -543,6 +556,7 @@ def document_page(slug):
 
 
 @public_bp.route('/robots.txt')
+@cache_policy(max_age=86400)
 def robots():
     response = make_response(render_template('public/robots.txt'))
     response.headers['Content-Type'] = 'text/plain'
@@ -550,121 +564,140 @@ def robots():
 
 
 @public_bp.route('/sitemap.xml')
+@cache_policy(max_age=3600)
 def sitemap():
-    pages = []
-    
-    static_pages = Page.query.filter_by(is_published=True).all()
-    for page in static_pages:
-        pages.append({
-            'loc': get_canonical_url(page.url_path),
-            'lastmod': page.updated_at.strftime('%Y-%m-%d') if page.updated_at else None,
-            'priority': '0.8'
-        })
-    
-    pages.append({
-        'loc': get_canonical_url('/'),
-        'priority': '1.0'
-    })
-    pages.append({
-        'loc': get_canonical_url('/catalog/'),
-        'priority': '0.9'
-    })
-    pages.append({
-        'loc': get_canonical_url('/news/'),
-        'priority': '0.7'
-    })
-    
-    categories = Category.query.filter_by(is_active=True).all()
-    for cat in categories:
-        pages.append({
-            'loc': get_canonical_url(f'/{cat.slug}/'),
-            'priority': '0.8'
-        })
-        
-        for pl in cat.product_lines.filter_by(is_active=True):
-            pages.append({
-                'loc': get_canonical_url(f'/{cat.slug}/{pl.slug}/'),
-                'priority': '0.7'
-            })
-            
-            for si in pl.size_items:
-                pages.append({
-                    'loc': get_canonical_url(f'/{cat.slug}/{pl.slug}/{si.size_slug}/'),
-                    'lastmod': si.updated_at.strftime('%Y-%m-%d') if si.updated_at else None,
-                    'priority': '0.6'
-                })
-    
-    news = News.query.filter_by(is_published=True).all()
-    for n in news:
-        pages.append({
-            'loc': get_canonical_url(f'/news/{n.slug}/'),
-            'lastmod': n.date.strftime('%Y-%m-%d') if n.date else None,
-            'priority': '0.5'
-        })
-    
-    sitemap_xml = render_template('sitemap.xml', pages=pages)
-    return Response(sitemap_xml, mimetype='application/xml')
+    """Sitemap index pointing to the urlset shards below."""
+    signature, url_count, last_modified = get_sitemap_state()
+    note_modified(*filter(None, [last_modified]))
+    return _sitemap_response(signature, 'index.xml',
+                             lambda: iter([render_index_xml(shard_count(url_count), last_modified)]))
+
+
+@public_bp.route('/sitemap-<int:shard>.xml')
+@cache_policy(max_age=3600)
+def sitemap_shard(shard):
+    signature, url_count, last_modified = get_sitemap_state()
+    if not 1 <= shard <= shard_count(url_count):
+        abort(404)
+    note_modified(*filter(None, [last_modified]))
+    return _sitemap_response(signature, f'sitemap-{shard}.xml', lambda: iter_shard_xml(shard))
+
+
+def _sitemap_response(signature, name, render):
+    """Serve a rendered sitemap file from disk, or stream it while caching it for the next request."""
+    etag = f'{signature}-{name}'
+    cached_path = get_cached_path(signature, name)
+    if cached_path:
+        response = send_file(cached_path, mimetype='application/xml', etag=False, conditional=False)
+    else:
+        # A 304 from the after_request hook drops the generator before it runs
+        response = Response(stream_with_context(stream_and_cache(signature, name, render())),
+                            mimetype='application/xml')
+    response.set_etag(etag)
+    return response
+
+
+WATERMARK_MAX_AGE = 86400
+
+
+def _not_modified(etag, last_modified):
+    """Check the request validators against a known ETag / Last-Modified."""
+    if request.if_none_match:
+        return request.if_none_match.contains(etag)
+    if request.if_modified_since and last_modified:
+        return last_modified.replace(microsecond=0) <= request.if_modified_since
+    return False
+
+
+def _finish_image_response(response, memo_key):
+    response.vary.add('Accept')
+    if response.status_code == 200:
+        etag, _ = response.get_etag()
+        remember_validators(memo_key, etag, response.last_modified)
+    return response
+
+
+def _send_image_file(path, etag, mimetype=None):
+    return send_file(path,
+                     mimetype=mimetype,
+                     conditional=True,
+                     etag=etag,
+                     max_age=WATERMARK_MAX_AGE)
 
 
 @public_bp.route('/wm/<image_type>/<int:image_id>/')
 def watermarked_image(image_type, image_id):
     """Serve gallery image with watermark applied."""
-    from models import HomeGalleryImage, ServiceImage, ProductLineImage, AccessoryImage
-    model_map = {
-        'home': HomeGalleryImage,
-        'service': ServiceImage,
-        'product_line': ProductLineImage,
-        'accessory': AccessoryImage
-    }
-    
-    model = model_map.get(image_type)
+    model = GALLERY_IMAGE_MODELS.get(image_type)
     if not model:
         abort(404)
     
+    width = snap_width(request.args.get('w'))
+    preferred_format = get_preferred_format(request.accept_mimetypes)
+    memo_key = (image_type, image_id, width, preferred_format)
+    
+    # Browser already holds the current render: answer without touching DB or disk
+    if request.if_none_match or request.if_modified_since:
+        validators = lookup_validators(memo_key)
+        if validators and _not_modified(*validators):
+            response = make_response('', 304)
+            response.set_etag(validators[0])
+            response.cache_control.public = True
+            response.cache_control.max_age = WATERMARK_MAX_AGE
+            response.vary.add('Accept')
+            return response
+    
     img = model.query.get(image_id)
     if not img:
         abort(404)
     
+    source_format = get_output_format(img.image_path)
+    output_format = preferred_format or source_format
+    
     if img.no_watermark:
-        full_path = img.image_path.lstrip('/')
-        if os.path.exists(full_path):
-            return send_file(full_path)
-        abort(404)
+        watermark_path, opacity, engine = None, 1.0, None
+    else:
+        watermark_path, opacity, engine = get_watermark_settings()
     
-    watermark_setting = Setting.query.filter_by(key='WATERMARK_IMAGE').first()
-    if not watermark_setting or not watermark_setting.value:
-        full_path = img.image_path.lstrip('/')
+    full_path = img.image_path.lstrip('/')
+    
+    if not watermark_path and not width and output_format == source_format:
         if os.path.exists(full_path):
-            return send_file(full_path)
+            etag = build_cache_key(img.image_path, None, opacity, 0, source_format)
+            return _finish_image_response(_send_image_file(full_path, etag), memo_key)
         abort(404)
     
-    opacity_setting = Setting.query.filter_by(key='WATERMARK_OPACITY').first()
-    opacity = float(opacity_setting.value) if opacity_setting and opacity_setting.value else 1.0
-    
-    ext = os.path.splitext(img.image_path)[1].lower()
-    if ext in ('.jpg', '.jpeg'):
-        output_format = 'JPEG'
-    elif ext == '.png':
-        output_format = 'PNG'
-    elif ext == '.webp':
-        output_format = 'WEBP'
-    else:
-        output_format = 'JPEG'
-    
-    image_bytes, content_type = get_watermarked_image_bytes(
-        img.image_path, 
-        watermark_setting.value, 
+    cached_path, cache_key = render_variant(
+        img.image_path,
+        watermark_path,
+        opacity,
+        img.rotation,
         output_format,
-        opacity
+        width,
+        engine
     )
+    if cached_path:
+        response = _send_image_file(cached_path, cache_key, WATERMARK_CONTENT_TYPES[output_format])
+        return _finish_image_response(response, memo_key)
+    
+    if watermark_path:
+        image_bytes, content_type = get_watermarked_image_bytes(
+            img.image_path, 
+            watermark_path, 
+            source_format,
+            opacity,
+            max_width=width,
+            engine=engine
+        )
+        
+        if image_bytes:
+            response = make_response(image_bytes)
+            response.headers['Content-Type'] = content_type
+            response.headers['Cache-Control'] = f'public, max-age={WATERMARK_MAX_AGE}'
+            response.vary.add('Accept')
+            return response
     
-    if image_bytes:
-        response = make_response(image_bytes)
-        response.headers['Content-Type'] = content_type
-        response.headers['Cache-Control'] = 'public, max-age=86400'
-        return response
-    
-    full_path = img.image_path.lstrip('/')
     if os.path.exists(full_path):
-        return send_file(full_path)
+        etag = build_cache_key(img.image_path, None, opacity, 0, source_format)
+        return _finish_image_response(_send_image_file(full_path, etag), memo_key)
     abort(404)
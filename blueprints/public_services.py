@@ -1,4 +1,5 @@
 from flask import Blueprint, render_template, abort
+from sqlalchemy.orm import selectinload
 from blueprints.public import get_hero_for_url
 from models import Service
 from services.seo import get_page_seo, get_canonical_url, get_og_tags
@@ -8,7 +9,9 @@ public_services_bp = Blueprint('public_services', __name__)
 
 @public_services_bp.route('/services/')
 def services_list():
-    services = Service.query.filter_by(is_active=True).order_by(Service.sort_order).all()
+    services = Service.query.filter_by(is_active=True).options(
+        selectinload(Service.gallery_images)
+    ).order_by(Service.sort_order).all()
     
     seo = {
         'title': 'Услуги — ГЛАВТРУБТОРГ',
@@ -1,6 +1,10 @@
 from flask import Blueprint, request, redirect
 from models import RedirectRule
+from services.commit_hooks import invalidate_on_commit
+from services.redirect_stats import record_hit
 import re
+import time
+import threading
 
 redirects_bp = Blueprint('redirects', __name__)
 
@@ -33,33 +37,115 @@ def apply_pattern_redirect(from_pattern, to_pattern, path):
     return None
 
 
+# Requests that never carry legacy URLs
+SKIP_PREFIXES = ('/static/', '/admin/static/', '/wm/')
+
+# Rebuilt locally after commits touching RedirectRule; the TTL bounds how long
+# other worker processes keep using rules loaded before the commit.
+MATCHER_TTL = 60
+
+
+class RedirectMatcher:
+    """
+    Active redirect rules compiled for lookup without DB access.
+
+    Exact rules live in a dict. Wildcard rules are bucketed by the literal prefix
+    before their first *, so a path is only tested against rules whose prefix it
+    starts with; candidates are tried in id order, like the old per-rule loop.
+    """
+
+    def __init__(self, rules):
+        self.exact = {}
+        self.by_prefix = {}
+        for index, rule in enumerate(rules):
+            if not rule.is_pattern:
+                self.exact.setdefault(rule.from_path, (rule.to_path, rule.code, rule.id))
+            elif '*' in rule.from_path:
+                prefix = rule.from_path.split('*', 1)[0]
+                # Same regex as match_pattern, compiled once
+                regex = re.compile('^' + re.escape(rule.from_path).replace(r'\*', '(.*)') + '$')
+                self.by_prefix.setdefault(prefix, []).append((index, regex, rule.to_path, rule.code, rule.id))
+        self.prefix_lengths = sorted({len(prefix) for prefix in self.by_prefix})
+
+    def _match_pattern(self, path):
+        """Return (rule index, target, code, rule id) of the first wildcard rule matching path, or None."""
+        candidates = []
+        for length in self.prefix_lengths:
+            if length > len(path):
+                break
+            candidates.extend(self.by_prefix.get(path[:length], ()))
+        for index, regex, to_path, code, rule_id in sorted(candidates, key=lambda candidate: candidate[0]):
+            match = regex.match(path)
+            if match:
+                result = to_path.replace('*', match.group(1))
+                if not result.endswith('/') and '.' not in result.split('/')[-1]:
+                    result += '/'
+                return index, result, code, rule_id
+        return None
+
+    def resolve(self, path):
+        """Return (target, code, rule id) for path, or None when no rule applies."""
+        target = self.exact.get(path)
+        if target:
+            return target
+
+        path_with_slash = path if path.endswith('/') else path + '/'
+        if path != path_with_slash:
+            target = self.exact.get(path_with_slash)
+            if target:
+                return target
+
+        if self.by_prefix:
+            found = self._match_pattern(path)
+            if path != path_with_slash:
+                found_slash = self._match_pattern(path_with_slash)
+                # Rules are tried in order, each with and then without the slash
+                if found_slash and (not found or found_slash[0] < found[0]):
+                    found = found_slash
+            if found:
+                return found[1:]
+
+        return None
+
+
+_matcher = None
+_expires = 0.0
+_lock = threading.Lock()
+
+
+def get_redirect_matcher():
+    global _matcher, _expires
+    matcher = _matcher
+    if matcher is None or _expires < time.monotonic():
+        matcher = RedirectMatcher(RedirectRule.query.filter_by(is_active=True).order_by(RedirectRule.id).all())
+        with _lock:
+            _matcher = matcher
+            _expires = time.monotonic() + MATCHER_TTL
+    return matcher
+
+
+def invalidate_redirect_matcher():
+    global _matcher
+    with _lock:
+        _matcher = None
+
+
+invalidate_on_commit((RedirectRule,), invalidate_redirect_matcher)
+
+
 def check_redirects(app):
     @app.before_request
     def handle_redirects():
         path = request.path
         
-        if path.startswith('/static/') or path.startswith('/admin/static/'):
+        if path.startswith(SKIP_PREFIXES):
             return None
         
-        db_rule = RedirectRule.query.filter_by(from_path=path, is_active=True, is_pattern=False).first()
-        if db_rule:
-            return redirect(db_rule.to_path, code=db_rule.code)
-        
-        path_with_slash = path if path.endswith('/') else path + '/'
-        if path != path_with_slash:
-            db_rule_slash = RedirectRule.query.filter_by(from_path=path_with_slash, is_active=True, is_pattern=False).first()
-            if db_rule_slash:
-                return redirect(db_rule_slash.to_path, code=db_rule_slash.code)
-        
-        pattern_rules = RedirectRule.query.filter_by(is_active=True, is_pattern=True).all()
-        for rule in pattern_rules:
-            new_path = apply_pattern_redirect(rule.from_path, rule.to_path, path)
-            if new_path:
-                return redirect(new_path, code=rule.code)
-            if path != path_with_slash:
-                new_path = apply_pattern_redirect(rule.from_path, rule.to_path, path_with_slash)
-                if new_path:
-                    return redirect(new_path, code=rule.code)
+        target = get_redirect_matcher().resolve(path)
+        if target:
+            to_path, code, rule_id = target
+            record_hit(rule_id)
+            return redirect(to_path, code=code)
         
         if path != '/' and not path.endswith('/') and '.' not in path.split('/')[-1]:
             return redirect(path + '/', code=301)
@@ -0,0 +1,58 @@
+import logging
+import click
+from flask.cli import AppGroup
+
+logger = logging.getLogger(__name__)
+
+catalog_cli = AppGroup('catalog', help='Catalog maintenance commands')
+
+
+@catalog_cli.command('compile-accessories')
+@click.option('--all', 'compile_all', is_flag=True, help='Recompile every block, not only missing or stale indexes')
+def compile_accessories(compile_all):
+    """
+    Compile accessory tables into the row index used by size item pages.
+    Run after editing table_html directly in the database.
+    """
+    from extensions import db
+    from models import AccessoryBlock
+    from services.size_matcher import compile_accessory_blocks
+    
+    compiled = compile_accessory_blocks(AccessoryBlock.query.all(), only_missing=not compile_all)
+    db.session.commit()
+    msg = f'Compiled accessory blocks: {compiled}'
+    logger.info(msg)
+    click.echo(msg)
+
+
+@catalog_cli.command('rebuild-compat')
+@click.option('--product-line', 'product_line_ids', type=int, multiple=True, help='Only these product line ids (repeatable)')
+def rebuild_compat(product_line_ids):
+    """
+    Recompute the accessory compatibility matrix (size item <-> accessory table row).
+    """
+    from extensions import db
+    from services.accessory_compat import rebuild_compatibility
+    
+    written = rebuild_compatibility(product_line_ids or None)
+    db.session.commit()
+    msg = f'Compatibility rows: {written}'
+    logger.info(msg)
+    click.echo(msg)
+
+
+@catalog_cli.command('rebuild-prices')
+@click.option('--product-line', 'product_line_ids', type=int, multiple=True, help='Only these product line ids (repeatable)')
+def rebuild_prices(product_line_ids):
+    """
+    Recompute the size price table (effective discount, hide flag, display price).
+    Run after editing prices or discounts directly in the database.
+    """
+    from extensions import db
+    from services.size_prices import rebuild_size_prices
+    
+    written = rebuild_size_prices(product_line_ids or None)
+    db.session.commit()
+    msg = f'Size price rows: {written}'
+    logger.info(msg)
+    click.echo(msg)
@@ -0,0 +1,40 @@
+import sys
+import logging
+import click
+from flask.cli import with_appcontext
+
+logger = logging.getLogger(__name__)
+
+
+@click.command('explain-hot')
+@click.option('--verbose', '-v', is_flag=True, help='Print the full plan of every query')
+@with_appcontext
+def explain_hot(verbose):
+    """
+    EXPLAIN the hot public queries (SQLite or PostgreSQL).
+    Exits with code 1 if any of them reads a table with a full scan.
+    """
+    from services.query_audit import explain_hot_queries
+    
+    try:
+        results = explain_hot_queries()
+    except ValueError as e:
+        click.echo(f'ERROR: {e}', err=True)
+        sys.exit(2)
+    
+    failed = 0
+    for result in results:
+        if result['full_scans']:
+            failed += 1
+            click.echo(f"FULL SCAN  {result['name']}: {', '.join(result['full_scans'])}")
+        else:
+            click.echo(f"ok         {result['name']}")
+        if verbose or result['full_scans']:
+            for line in result['plan']:
+                click.echo(f'           {line}')
+    
+    msg = f'Hot queries: {len(results)}, full scans: {failed}'
+    logger.info(msg)
+    click.echo(msg)
+    if failed:
+        sys.exit(1)
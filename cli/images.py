@@ -0,0 +1,40 @@
+import logging
+import click
+from flask.cli import AppGroup
+
+logger = logging.getLogger(__name__)
+
+images_cli = AppGroup('images', help='Gallery image commands')
+
+
+@images_cli.command('prerender')
+@click.option('--workers', type=int, default=None, help='Number of worker processes (default: CPU count)')
+@click.option('--purge', is_flag=True, help='Drop cached renders before rebuilding')
+def prerender(workers, purge):
+    """
+    Rebuild watermarked variants and resized derivatives of all gallery images in parallel.
+    Run after the watermark image or opacity setting changes.
+    """
+    from services.watermark_cache import purge_cache
+    from services.prerender_queue import prerender_all
+    
+    if purge:
+        purge_cache()
+        click.echo('Watermark cache purged')
+    
+    rendered, failed = prerender_all(max_workers=workers)
+    msg = f'Prerendered: {rendered}, failed: {failed}'
+    logger.info(msg)
+    click.echo(msg)
+
+
+@images_cli.command('process-queue')
+@click.option('--workers', type=int, default=None, help='Number of worker processes')
+def process_queue(workers):
+    """
+    Render all pending jobs from the prerender queue and exit.
+    """
+    from services.prerender_queue import process_queue as drain_queue
+    
+    rendered, failed = drain_queue(max_workers=workers)
+    click.echo(f'Rendered: {rendered}, failed: {failed}')
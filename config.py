@@ -19,6 +19,23 @@ class Config:
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024
     ALLOWED_EXTENSIONS = {'pdf', 'doc', 'docx', 'xls', 'xlsx', 'png', 'jpg', 'jpeg', 'gif'}
     
+    WATERMARK_CACHE_DIR = os.environ.get('WATERMARK_CACHE_DIR', 'instance/wm_cache')
+    WATERMARK_CACHE_MAX_BYTES = int(os.environ.get('WATERMARK_CACHE_MAX_BYTES', 512 * 1024 * 1024))
+    PRERENDER_QUEUE_PATH = os.environ.get('PRERENDER_QUEUE_PATH', 'instance/prerender_queue.sqlite')
+    PRERENDER_WORKERS = int(os.environ.get('PRERENDER_WORKERS', 2))
+    SITEMAP_CACHE_DIR = os.environ.get('SITEMAP_CACHE_DIR', 'instance/sitemap_cache')
+    IMPORT_UPLOAD_DIR = os.environ.get('IMPORT_UPLOAD_DIR', 'instance/imports')
+    
+    # memory (per worker), sqlite (shared by workers on the host) or none
+    PAGE_CACHE_BACKEND = os.environ.get('PAGE_CACHE_BACKEND', 'memory')
+    PAGE_CACHE_PATH = os.environ.get('PAGE_CACHE_PATH', 'instance/page_cache.sqlite')
+    PAGE_CACHE_TTL = int(os.environ.get('PAGE_CACHE_TTL', 300))
+    PAGE_CACHE_MAX_ENTRIES = int(os.environ.get('PAGE_CACHE_MAX_ENTRIES', 1000))
+    
+    # Browser/proxy caching of public pages (see services.http_cache)
+    HTTP_CACHE_MAX_AGE = int(os.environ.get('HTTP_CACHE_MAX_AGE', 300))
+    HTTP_CACHE_STALE_WHILE_REVALIDATE = int(os.environ.get('HTTP_CACHE_STALE_WHILE_REVALIDATE', 3600))
+    
     SITE_NAME = 'ГлавТрубТорг'
     SITE_URL = os.environ.get('SITE_URL', 'https://glavtrubtorg.ru')
 
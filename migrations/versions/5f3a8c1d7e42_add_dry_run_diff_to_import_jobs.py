@@ -0,0 +1,46 @@
+"""Add dry run and diff counters to ImportJob
+
+Revision ID: 5f3a8c1d7e42
+Revises: d49b7e3c1a85
+Create Date: 2026-02-16 14:21:37.504193
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5f3a8c1d7e42'
+down_revision = 'd49b7e3c1a85'
+branch_labels = None
+depends_on = None
+
+
+COLUMNS = [
+    sa.Column('dry_run', sa.Boolean(), nullable=True),
+    sa.Column('created_count', sa.Integer(), nullable=True),
+    sa.Column('changed_count', sa.Integer(), nullable=True),
+    sa.Column('unchanged_count', sa.Integer(), nullable=True),
+    sa.Column('changes', sa.JSON(), nullable=True),
+]
+
+
+def _existing_columns():
+    return {column['name'] for column in sa.inspect(op.get_bind()).get_columns('import_jobs')}
+
+
+def upgrade():
+    # db.create_all() may have created import_jobs with these columns already
+    existing = _existing_columns()
+    with op.batch_alter_table('import_jobs', schema=None) as batch_op:
+        for column in COLUMNS:
+            if column.name not in existing:
+                batch_op.add_column(column)
+
+
+def downgrade():
+    existing = _existing_columns()
+    with op.batch_alter_table('import_jobs', schema=None) as batch_op:
+        for column in reversed(COLUMNS):
+            if column.name in existing:
+                batch_op.drop_column(column.name)
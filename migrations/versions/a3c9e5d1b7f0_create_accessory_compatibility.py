@@ -0,0 +1,38 @@
+"""Create AccessoryCompatibility table
+
+Revision ID: a3c9e5d1b7f0
+Revises: 7c3e9a1f4b2d
+Create Date: 2026-02-10 09:48:12.731905
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3c9e5d1b7f0'
+down_revision = '7c3e9a1f4b2d'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # db.create_all() runs when the app loads (also for `flask db upgrade`) and may have created it
+    op.create_table('accessory_compatibility',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('size_item_id', sa.Integer(), nullable=False),
+        sa.Column('accessory_block_id', sa.Integer(), nullable=False),
+        sa.Column('row_index', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['accessory_block_id'], ['accessory_blocks.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['size_item_id'], ['size_items.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('accessory_block_id', 'row_index', 'size_item_id', name='uq_accessory_compatibility'),
+        if_not_exists=True
+    )
+    op.create_index('ix_accessory_compatibility_size_item_id', 'accessory_compatibility', ['size_item_id'],
+                    unique=False, if_not_exists=True)
+
+
+def downgrade():
+    op.drop_index('ix_accessory_compatibility_size_item_id', table_name='accessory_compatibility', if_exists=True)
+    op.drop_table('accessory_compatibility', if_exists=True)
@@ -0,0 +1,52 @@
+"""Add numeric sort key to SizeItem
+
+Revision ID: b6d14e2f8a57
+Revises: 4e8b2d7a9c13
+Create Date: 2026-02-12 09:27:44.106392
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b6d14e2f8a57'
+down_revision = '4e8b2d7a9c13'
+branch_labels = None
+depends_on = None
+
+
+def _sort_key(size_text):
+    # Frozen copy of SizeItem.compute_sort_key as of this revision
+    try:
+        parts = size_text.split('/')
+        first = int(''.join(c for c in parts[0] if c.isdigit()) or 0)
+        second = int(''.join(c for c in parts[1] if c.isdigit()) or 0) if len(parts) > 1 else 0
+    except (ValueError, AttributeError, IndexError):
+        return 0
+    return min(first, 10 ** 12) * 10 ** 6 + min(second, 10 ** 6 - 1)
+
+
+def upgrade():
+    with op.batch_alter_table('size_items', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('sort_key', sa.BigInteger(), nullable=False, server_default='0'))
+        batch_op.create_index('ix_size_items_product_line_sort', ['product_line_id', 'sort_key'], unique=False)
+
+    conn = op.get_bind()
+    size_items = sa.table('size_items', sa.column('id', sa.Integer), sa.column('size_text', sa.String),
+                          sa.column('sort_key', sa.BigInteger))
+    rows = [
+        {'item_id': item_id, 'key': _sort_key(size_text)}
+        for item_id, size_text in conn.execute(sa.select(size_items.c.id, size_items.c.size_text))
+    ]
+    if rows:
+        conn.execute(
+            size_items.update().where(size_items.c.id == sa.bindparam('item_id')).values(sort_key=sa.bindparam('key')),
+            rows
+        )
+
+
+def downgrade():
+    with op.batch_alter_table('size_items', schema=None) as batch_op:
+        batch_op.drop_index('ix_size_items_product_line_sort')
+        batch_op.drop_column('sort_key')
@@ -0,0 +1,39 @@
+"""Create SizePrice table
+
+Revision ID: c81f4d2a6b93
+Revises: b6d14e2f8a57
+Create Date: 2026-02-12 16:35:08.219647
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c81f4d2a6b93'
+down_revision = 'b6d14e2f8a57'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # db.create_all() runs when the app loads (also for `flask db upgrade`) and may have created it;
+    # rows are filled by build_size_prices() at startup
+    op.create_table('size_prices',
+        sa.Column('size_item_id', sa.Integer(), nullable=False),
+        sa.Column('product_line_id', sa.Integer(), nullable=False),
+        sa.Column('effective_discount', sa.Float(), nullable=False),
+        sa.Column('hide_price', sa.Boolean(), nullable=False),
+        sa.Column('display_price', sa.Float(), nullable=False),
+        sa.ForeignKeyConstraint(['product_line_id'], ['product_lines.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['size_item_id'], ['size_items.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('size_item_id'),
+        if_not_exists=True
+    )
+    op.create_index('ix_size_prices_product_line_id', 'size_prices', ['product_line_id'],
+                    unique=False, if_not_exists=True)
+
+
+def downgrade():
+    op.drop_index('ix_size_prices_product_line_id', table_name='size_prices', if_exists=True)
+    op.drop_table('size_prices', if_exists=True)
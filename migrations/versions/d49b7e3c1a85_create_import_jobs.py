@@ -0,0 +1,46 @@
+"""Create ImportJob table
+
+Revision ID: d49b7e3c1a85
+Revises: e2a7c5f90d18
+Create Date: 2026-02-14 10:12:51.863024
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd49b7e3c1a85'
+down_revision = 'e2a7c5f90d18'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # db.create_all() runs when the app loads (also for `flask db upgrade`) and may have created it
+    op.create_table('import_jobs',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('kind', sa.String(length=50), nullable=False),
+        sa.Column('file_path', sa.String(length=500), nullable=False),
+        sa.Column('original_name', sa.String(length=300), nullable=True),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('total_bytes', sa.BigInteger(), nullable=True),
+        sa.Column('processed_bytes', sa.BigInteger(), nullable=True),
+        sa.Column('rows_done', sa.Integer(), nullable=True),
+        sa.Column('success', sa.Integer(), nullable=True),
+        sa.Column('error_count', sa.Integer(), nullable=True),
+        sa.Column('errors', sa.JSON(), nullable=True),
+        sa.Column('product_line_ids', sa.JSON(), nullable=True),
+        sa.Column('attempts', sa.Integer(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.Column('finished_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        if_not_exists=True
+    )
+    op.create_index('ix_import_jobs_status', 'import_jobs', ['status'], unique=False, if_not_exists=True)
+
+
+def downgrade():
+    op.drop_index('ix_import_jobs_status', table_name='import_jobs', if_exists=True)
+    op.drop_table('import_jobs', if_exists=True)
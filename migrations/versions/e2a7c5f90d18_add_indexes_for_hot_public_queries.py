@@ -0,0 +1,43 @@
+"""Add composite indexes for hot public queries
+
+Revision ID: e2a7c5f90d18
+Revises: c81f4d2a6b93
+Create Date: 2026-02-13 11:04:19.582716
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'e2a7c5f90d18'
+down_revision = 'c81f4d2a6b93'
+branch_labels = None
+depends_on = None
+
+
+# (table, index name, columns); mirrored in models.__table_args__
+INDEXES = [
+    ('menu_items', 'ix_menu_items_url_active', ['url', 'is_active']),
+    ('categories', 'ix_categories_active_sort', ['is_active', 'sort_order']),
+    ('product_lines', 'ix_product_lines_category_active_sort', ['category_id', 'is_active', 'sort_order']),
+    ('news', 'ix_news_published_date', ['is_published', 'date']),
+    ('document_files', 'ix_document_files_type_sort', ['document_type_id', 'sort_order']),
+    ('services', 'ix_services_active_sort', ['is_active', 'sort_order']),
+    ('service_images', 'ix_service_images_service_sort', ['service_id', 'sort_order']),
+    ('home_gallery_images', 'ix_home_gallery_images_sort', ['sort_order']),
+    ('redirect_rules', 'ix_redirect_rules_from_path_active', ['from_path', 'is_active', 'is_pattern']),
+    ('product_line_images', 'ix_product_line_images_line_sort', ['product_line_id', 'sort_order']),
+    ('accessory_blocks', 'ix_accessory_blocks_line_active_sort', ['product_line_id', 'is_active', 'sort_order']),
+    ('accessory_images', 'ix_accessory_images_block_sort', ['accessory_block_id', 'sort_order']),
+]
+
+
+def upgrade():
+    # Databases created by db.create_all() after this revision already have them
+    for table, name, columns in INDEXES:
+        op.create_index(name, table, columns, unique=False, if_not_exists=True)
+
+
+def downgrade():
+    for table, name, columns in reversed(INDEXES):
+        op.drop_index(name, table_name=table, if_exists=True)
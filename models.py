@@ -1,8 +1,13 @@
 from datetime import datetime
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask_login import UserMixin
+from sqlalchemy.orm import validates
 from extensions import db
 
+# SizeItem.sort_key = first * BASE + second
+SIZE_SORT_KEY_BASE = 10 ** 6
+SIZE_SORT_KEY_MAX_FIRST = 10 ** 12
+
 
 class User(UserMixin, db.Model):
     __tablename__ = 'users'
@@ -50,6 +55,10 @@ class MenuItem(db.Model):
     hero_image = db.Column(db.String(300), default='')
     hero_title = db.Column(db.String(200), default='')
     hero_subtitle = db.Column(db.String(300), default='')
+    
+    __table_args__ = (
+        db.Index('ix_menu_items_url_active', 'url', 'is_active'),
+    )
 
 
 class Category(db.Model):
@@ -70,6 +79,10 @@ class Category(db.Model):
     is_active = db.Column(db.Boolean, default=True)
     
     product_lines = db.relationship('ProductLine', backref='category', lazy='dynamic', cascade='all, delete-orphan')
+    
+    __table_args__ = (
+        db.Index('ix_categories_active_sort', 'is_active', 'sort_order'),
+    )
 
 
 class ProductLine(db.Model):
@@ -96,19 +109,18 @@ class ProductLine(db.Model):
     size_items = db.relationship('SizeItem', backref='product_line', lazy='dynamic', cascade='all, delete-orphan')
     images = db.relationship('ProductLineImage', backref='product_line', lazy='dynamic', cascade='all, delete-orphan')
     accessory_blocks = db.relationship('AccessoryBlock', backref='product_line', lazy='dynamic', cascade='all, delete-orphan')
+    # Упорядоченная галерея для чтения, подгружается selectinload в публичных view
+    gallery_images = db.relationship('ProductLineImage', order_by='(ProductLineImage.sort_order, ProductLineImage.id)', viewonly=True)
     
     def get_main_image(self):
-        images_list = self.images.order_by('sort_order').all()
-        for img in images_list:
-            if img.is_main:
-                return img.image_path
-        if images_list:
-            return images_list[0].image_path
+        main_img = self.get_main_image_object()
+        if main_img:
+            return main_img.image_path
         return self.image_path if self.image_path else ''
     
     def get_main_image_object(self):
         """Возвращает объект главного изображения галереи (для водяного знака)"""
-        images_list = self.images.order_by('sort_order').all()
+        images_list = self.gallery_images
         for img in images_list:
             if img.is_main:
                 return img
@@ -118,6 +130,7 @@ class ProductLine(db.Model):
     
     __table_args__ = (
         db.UniqueConstraint('category_id', 'slug', name='uq_productline_category_slug'),
+        db.Index('ix_product_lines_category_active_sort', 'category_id', 'is_active', 'sort_order'),
     )
 
 
@@ -146,6 +159,30 @@ class SizeItem(db.Model):
     max_len_drum = db.Column(db.String(50), default='')    # Макс. длина на барабане, м
     
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Числовой ключ сортировки по size_text, заполняется при присвоении size_text
+    sort_key = db.Column(db.BigInteger, nullable=False, default=0, server_default='0')
+    
+    compatibilities = db.relationship('AccessoryCompatibility', backref='size_item', lazy='dynamic', cascade='all, delete-orphan')
+    price_row = db.relationship('SizePrice', uselist=False, cascade='all, delete-orphan')
+    
+    @staticmethod
+    def compute_sort_key(size_text):
+        """
+        Числовой ключ для сортировки по размеру ('110/145' -> 110 * 10^6 + 145).
+        Порядок совпадает с сортировкой по паре (первое число, второе число).
+        """
+        try:
+            parts = size_text.split('/')
+            first = int(''.join(c for c in parts[0] if c.isdigit()) or 0)
+            second = int(''.join(c for c in parts[1] if c.isdigit()) or 0) if len(parts) > 1 else 0
+        except (ValueError, AttributeError, IndexError):
+            return 0
+        return min(first, SIZE_SORT_KEY_MAX_FIRST) * SIZE_SORT_KEY_BASE + min(second, SIZE_SORT_KEY_BASE - 1)
+    
+    @validates('size_text')
+    def _fill_sort_key(self, key, size_text):
+        self.sort_key = self.compute_sort_key(size_text)
+        return size_text
     
     def get_effective_discount(self):
         """Возвращает эффективную скидку (из типоразмера или линейки)"""
@@ -171,9 +208,20 @@ class SizeItem(db.Model):
     
     __table_args__ = (
         db.UniqueConstraint('product_line_id', 'size_slug', name='uq_sizeitem_productline_slug'),
+        db.Index('ix_size_items_product_line_sort', 'product_line_id', 'sort_key'),
     )
 
 
+class SizePrice(db.Model):
+    """Эффективная цена типоразмера с учётом скидки и скрытия из линейки (пересчитывается при сохранении)."""
+    __tablename__ = 'size_prices'
+    size_item_id = db.Column(db.Integer, db.ForeignKey('size_items.id', ondelete='CASCADE'), primary_key=True)
+    product_line_id = db.Column(db.Integer, db.ForeignKey('product_lines.id', ondelete='CASCADE'), nullable=False, index=True)
+    effective_discount = db.Column(db.Float, nullable=False, default=0.0)
+    hide_price = db.Column(db.Boolean, nullable=False, default=False)
+    display_price = db.Column(db.Float, nullable=False, default=0.0)
+
+
 class News(db.Model):
     __tablename__ = 'news'
     id = db.Column(db.Integer, primary_key=True)
@@ -187,6 +235,36 @@ class News(db.Model):
     seo_text_html = db.Column(db.Text, default='')
     is_published = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('ix_news_published_date', 'is_published', 'date'),
+    )
+
+
+class ImportJob(db.Model):
+    """Фоновый импорт CSV: файл читается потоком, прогресс сохраняется после каждой порции строк."""
+    __tablename__ = 'import_jobs'
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)  # categories, product_lines, size_items, news
+    file_path = db.Column(db.String(500), nullable=False)
+    original_name = db.Column(db.String(300), default='')
+    status = db.Column(db.String(20), nullable=False, default='pending', index=True)  # pending, running, done, failed
+    total_bytes = db.Column(db.BigInteger, default=0)
+    processed_bytes = db.Column(db.BigInteger, default=0)
+    rows_done = db.Column(db.Integer, default=0)  # Номер последней применённой строки CSV (контрольная точка)
+    success = db.Column(db.Integer, default=0)
+    error_count = db.Column(db.Integer, default=0)
+    errors = db.Column(db.JSON, default=list)  # Первые ошибки, полный счёт в error_count
+    product_line_ids = db.Column(db.JSON, default=list)
+    dry_run = db.Column(db.Boolean, default=False)  # Только сравнение с текущими данными, без записи
+    created_count = db.Column(db.Integer, default=0)
+    changed_count = db.Column(db.Integer, default=0)
+    unchanged_count = db.Column(db.Integer, default=0)
+    changes = db.Column(db.JSON, default=list)  # Первые отличия: строка, ключ, поля [было, стало]
+    attempts = db.Column(db.Integer, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)  # Обновляется после каждой порции
+    finished_at = db.Column(db.DateTime, nullable=True)
 
 
 class DocumentType(db.Model):
@@ -220,6 +298,10 @@ class DocumentFile(db.Model):
     seo_text_html = db.Column(db.Text, default='')
     sort_order = db.Column(db.Integer, default=0)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('ix_document_files_type_sort', 'document_type_id', 'sort_order'),
+    )
 
 
 class Lead(db.Model):
@@ -254,15 +336,20 @@ class Service(db.Model):
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     images = db.relationship('ServiceImage', backref='service', lazy='dynamic', cascade='all, delete-orphan')
+    gallery_images = db.relationship('ServiceImage', order_by='(ServiceImage.sort_order, ServiceImage.id)', viewonly=True)
     
     def get_main_image(self):
-        main = ServiceImage.query.filter_by(service_id=self.id, is_main=True).first()
-        if main:
-            return main.image_path
-        first = ServiceImage.query.filter_by(service_id=self.id).order_by(ServiceImage.sort_order).first()
-        if first:
-            return first.image_path
+        images_list = self.gallery_images
+        for img in images_list:
+            if img.is_main:
+                return img.image_path
+        if images_list:
+            return images_list[0].image_path
         return self.image_path if self.image_path else ''
+    
+    __table_args__ = (
+        db.Index('ix_services_active_sort', 'is_active', 'sort_order'),
+    )
 
 
 class ServiceImage(db.Model):
@@ -278,6 +365,10 @@ class ServiceImage(db.Model):
     rotation = db.Column(db.Integer, default=0)  # 0, 90, 180, 270 degrees
     no_watermark = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('ix_service_images_service_sort', 'service_id', 'sort_order'),
+    )
 
 
 class HomeGalleryImage(db.Model):
@@ -291,6 +382,10 @@ class HomeGalleryImage(db.Model):
     rotation = db.Column(db.Integer, default=0)
     no_watermark = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('ix_home_gallery_images_sort', 'sort_order'),
+    )
 
 
 class RedirectRule(db.Model):
@@ -302,8 +397,15 @@ class RedirectRule(db.Model):
     is_active = db.Column(db.Boolean, default=True)
     is_pattern = db.Column(db.Boolean, default=False)
     comment = db.Column(db.String(300), default='')
+    # Updated in batches by services.redirect_stats, not on every request
+    hit_count = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+    last_hit_at = db.Column(db.DateTime, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('ix_redirect_rules_from_path_active', 'from_path', 'is_active', 'is_pattern'),
+    )
 
 
 class Setting(db.Model):
@@ -344,6 +446,10 @@ class ProductLineImage(db.Model):
     rotation = db.Column(db.Integer, default=0)
     no_watermark = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('ix_product_line_images_line_sort', 'product_line_id', 'sort_order'),
+    )
 
 
 class AccessoryBlock(db.Model):
@@ -354,6 +460,7 @@ class AccessoryBlock(db.Model):
     description_html = db.Column(db.Text, default='')
     image_path = db.Column(db.String(300), default='')
     table_html = db.Column(db.Text, default='')
+    table_index = db.Column(db.Text, nullable=True)
     sort_order = db.Column(db.Integer, default=0)
     gallery_interval = db.Column(db.Integer, default=5)
     use_outer_diameter = db.Column(db.Boolean, default=False)
@@ -361,15 +468,34 @@ class AccessoryBlock(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     images = db.relationship('AccessoryImage', backref='accessory_block', lazy='dynamic', cascade='all, delete-orphan')
+    compatibilities = db.relationship('AccessoryCompatibility', backref='accessory_block', lazy='dynamic', cascade='all, delete-orphan')
+    gallery_images = db.relationship('AccessoryImage', order_by='(AccessoryImage.sort_order, AccessoryImage.id)', viewonly=True)
 
     def get_main_image(self):
-        main_img = self.images.filter_by(is_main=True).first()
-        if main_img:
-            return main_img.image_path
-        first_img = self.images.order_by(AccessoryImage.sort_order.asc()).first()
-        if first_img:
-            return first_img.image_path
+        images_list = self.gallery_images
+        for img in images_list:
+            if img.is_main:
+                return img.image_path
+        if images_list:
+            return images_list[0].image_path
         return self.image_path
+    
+    __table_args__ = (
+        db.Index('ix_accessory_blocks_line_active_sort', 'product_line_id', 'is_active', 'sort_order'),
+    )
+
+
+class AccessoryCompatibility(db.Model):
+    """Row of an accessory block table that fits a size item (precomputed matching)."""
+    __tablename__ = 'accessory_compatibility'
+    id = db.Column(db.Integer, primary_key=True)
+    size_item_id = db.Column(db.Integer, db.ForeignKey('size_items.id', ondelete='CASCADE'), nullable=False, index=True)
+    accessory_block_id = db.Column(db.Integer, db.ForeignKey('accessory_blocks.id', ondelete='CASCADE'), nullable=False)
+    row_index = db.Column(db.Integer, nullable=False)  # Номер строки в AccessoryBlock.table_index
+    
+    __table_args__ = (
+        db.UniqueConstraint('accessory_block_id', 'row_index', 'size_item_id', name='uq_accessory_compatibility'),
+    )
 
 
 class AccessoryImage(db.Model):
@@ -385,3 +511,15 @@ class AccessoryImage(db.Model):
     is_main = db.Column(db.Boolean, default=False)
     no_watermark = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('ix_accessory_images_block_sort', 'accessory_block_id', 'sort_order'),
+    )
+
+
+GALLERY_IMAGE_MODELS = {
+    'home': HomeGalleryImage,
+    'service': ServiceImage,
+    'product_line': ProductLineImage,
+    'accessory': AccessoryImage
+}
@@ -0,0 +1,191 @@
+import json
+import logging
+from collections import defaultdict
+from extensions import db
+from models import SizeItem, AccessoryBlock, AccessoryCompatibility
+from services.size_matcher import (parse_size_spec, compile_accessory_table, load_table_index,
+                                   match_compiled_rows, render_compiled_rows, filter_accessory_table)
+
+logger = logging.getLogger(__name__)
+
+
+def _block_index(block):
+    """Compiled index of a block, compiling in memory if the stored one is missing or stale."""
+    index = load_table_index(block.table_html, block.table_index)
+    if index is None and block.table_html:
+        index = json.loads(compile_accessory_table(block.table_html))
+    return index
+
+
+def _compute_rows(blocks, size_items):
+    """
+    Match every size item against every block of the same product line.
+
+    Each size_text and each table is parsed once.
+
+    Returns:
+        List of dicts ready for bulk insert into accessory_compatibility
+    """
+    items_by_line = defaultdict(list)
+    for size_item in size_items:
+        spec = parse_size_spec(size_item.size_text)
+        if spec.inner_diameters or spec.outer_diameter:
+            items_by_line[size_item.product_line_id].append((size_item.id, spec))
+
+    rows = []
+    for block in blocks:
+        line_items = items_by_line.get(block.product_line_id)
+        if not line_items:
+            continue
+        index = _block_index(block)
+        if not index:
+            continue
+        for size_item_id, spec in line_items:
+            for row_index in match_compiled_rows(index, spec, block.use_outer_diameter):
+                rows.append({
+                    'size_item_id': size_item_id,
+                    'accessory_block_id': block.id,
+                    'row_index': row_index,
+                })
+    return rows
+
+
+def _insert_rows(rows):
+    if rows:
+        db.session.execute(AccessoryCompatibility.__table__.insert(), rows)
+    return len(rows)
+
+
+def rebuild_compatibility(product_line_ids=None):
+    """
+    Recompute the compatibility matrix for the given product lines (all if None).
+
+    Caller commits.
+
+    Returns:
+        Number of compatibility rows written
+    """
+    delete_query = AccessoryCompatibility.query
+    blocks_query = AccessoryBlock.query
+    items_query = SizeItem.query
+    if product_line_ids is not None:
+        product_line_ids = list(product_line_ids)
+        if not product_line_ids:
+            return 0
+        block_ids = db.session.query(AccessoryBlock.id).filter(AccessoryBlock.product_line_id.in_(product_line_ids))
+        delete_query = delete_query.filter(AccessoryCompatibility.accessory_block_id.in_(block_ids))
+        blocks_query = blocks_query.filter(AccessoryBlock.product_line_id.in_(product_line_ids))
+        items_query = items_query.filter(SizeItem.product_line_id.in_(product_line_ids))
+
+    delete_query.delete(synchronize_session=False)
+    return _insert_rows(_compute_rows(blocks_query.all(), items_query.all()))
+
+
+def refresh_size_items(size_items):
+    """Recompute compatibility of changed size items against the blocks of their lines. Caller commits."""
+    size_items = [si for si in size_items if si and si.id]
+    if not size_items:
+        return 0
+
+    AccessoryCompatibility.query.filter(
+        AccessoryCompatibility.size_item_id.in_([si.id for si in size_items])
+    ).delete(synchronize_session=False)
+
+    line_ids = {si.product_line_id for si in size_items}
+    blocks = AccessoryBlock.query.filter(AccessoryBlock.product_line_id.in_(line_ids)).all()
+    return _insert_rows(_compute_rows(blocks, size_items))
+
+
+def refresh_blocks(blocks):
+    """Recompute compatibility of changed accessory blocks against the size items of their lines. Caller commits."""
+    blocks = [block for block in blocks if block and block.id]
+    if not blocks:
+        return 0
+
+    AccessoryCompatibility.query.filter(
+        AccessoryCompatibility.accessory_block_id.in_([block.id for block in blocks])
+    ).delete(synchronize_session=False)
+
+    line_ids = {block.product_line_id for block in blocks}
+    size_items = SizeItem.query.filter(SizeItem.product_line_id.in_(line_ids)).all()
+    return _insert_rows(_compute_rows(blocks, size_items))
+
+
+def get_size_item_accessories(size_item, accessory_blocks):
+    """
+    Accessory tables for a size item page, read from the compatibility matrix.
+
+    Blocks whose stored index does not match table_html (edited outside the admin)
+    are filtered the slow way so the page is never wrong.
+
+    Args:
+        size_item: SizeItem model instance
+        accessory_blocks: active AccessoryBlock instances of the product line, in display order
+
+    Returns:
+        List of dicts with 'block' and 'filtered_table', same as get_matching_accessories
+    """
+    if not size_item or not accessory_blocks:
+        return []
+
+    rows_by_block = defaultdict(list)
+    for block_id, row_index in db.session.query(
+        AccessoryCompatibility.accessory_block_id, AccessoryCompatibility.row_index
+    ).filter(AccessoryCompatibility.size_item_id == size_item.id).order_by(AccessoryCompatibility.row_index):
+        rows_by_block[block_id].append(row_index)
+
+    results = []
+    for block in accessory_blocks:
+        if not block.is_active or not block.table_html:
+            continue
+
+        index = load_table_index(block.table_html, block.table_index)
+        if index is not None:
+            filtered = render_compiled_rows(index, rows_by_block.get(block.id))
+        else:
+            filtered = filter_accessory_table(block.table_html, parse_size_spec(size_item.size_text),
+                                              use_outer_diameter=block.use_outer_diameter)
+
+        if filtered:
+            results.append({
+                'block': block,
+                'filtered_table': filtered
+            })
+
+    return results
+
+
+def get_block_usage(block):
+    """
+    "Where used" data for an accessory block: every table row with the size items it fits.
+
+    Returns:
+        List of dicts with 'row_index', 'row_html' and 'size_items' (ordered by size text)
+    """
+    index = _block_index(block)
+    if not index:
+        return []
+
+    size_items_by_row = defaultdict(list)
+    compat = db.session.query(AccessoryCompatibility.row_index, SizeItem).join(
+        SizeItem, SizeItem.id == AccessoryCompatibility.size_item_id
+    ).filter(AccessoryCompatibility.accessory_block_id == block.id).order_by(SizeItem.size_text)
+    for row_index, size_item in compat:
+        size_items_by_row[row_index].append(size_item)
+
+    return [
+        {'row_index': row_index, 'row_html': row_html, 'size_items': size_items_by_row.get(row_index, [])}
+        for row_index, row_html in enumerate(index['rows'])
+    ]
+
+
+def ensure_compatibility():
+    """Build the matrix on first start (table created empty by migration or create_all)."""
+    if AccessoryCompatibility.query.first() is not None:
+        return 0
+    if not AccessoryBlock.query.filter(AccessoryBlock.table_html != '').first():
+        return 0
+    written = rebuild_compatibility()
+    db.session.commit()
+    logger.info(f"Accessory compatibility matrix built: {written} rows")
+    return written
@@ -4,8 +4,11 @@ from extensions import db
 from models import (
     User, Page, MenuItem, Category, ProductLine, SizeItem, News, DocumentFile, DocumentType,
     Lead, Service, ServiceImage, HomeGalleryImage, RedirectRule, Setting,
-    SiteSection, ProductLineImage, AccessoryBlock, AccessoryImage
+    SiteSection, ProductLineImage, AccessoryBlock, AccessoryImage, AccessoryCompatibility, SizePrice
 )
+from services.size_matcher import compile_accessory_blocks
+from services.accessory_compat import rebuild_compatibility
+from services.size_prices import rebuild_size_prices
 
 
 def serialize_value(value):
@@ -137,6 +140,8 @@ def import_database(json_data, clear_existing=False):
     
     try:
         if clear_existing:
+            AccessoryCompatibility.query.delete()
+            SizePrice.query.delete()
             AccessoryImage.query.delete()
             AccessoryBlock.query.delete()
             ProductLineImage.query.delete()
@@ -207,6 +212,7 @@ def import_database(json_data, clear_existing=False):
         
         if 'accessory_blocks' in tables:
             imported, updated = import_table(AccessoryBlock, tables['accessory_blocks'], datetime_fields=['created_at'])
+            compile_accessory_blocks(AccessoryBlock.query.all(), only_missing=True)
             results['accessory_blocks'] = {'imported': imported, 'updated': updated}
         
         if 'accessory_images' in tables:
@@ -233,6 +239,8 @@ def import_database(json_data, clear_existing=False):
             imported, updated = import_table(RedirectRule, tables['redirect_rules'], datetime_fields=['created_at', 'updated_at'])
             results['redirect_rules'] = {'imported': imported, 'updated': updated}
         
+        rebuild_compatibility()
+        rebuild_size_prices()
         db.session.commit()
         
         reset_sequences()
@@ -0,0 +1,37 @@
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+
+def invalidate_on_commit(models, callback):
+    """
+    Call callback() after every commit that inserted, updated or deleted rows of models.
+
+    Covers ORM flushes and bulk Query.update()/delete() and ORM-enabled INSERT
+    statements (bulk upserts), which bypass the flush.
+    Rolled back changes do not trigger it.
+    """
+    models = tuple(models)
+    flag = f'stale:{callback.__module__}.{callback.__qualname__}'
+
+    @event.listens_for(Session, 'after_flush')
+    def mark_on_flush(session, flush_context):
+        for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+            if isinstance(obj, models):
+                session.info[flag] = True
+                return
+
+    @event.listens_for(Session, 'do_orm_execute')
+    def mark_on_bulk(orm_execute_state):
+        if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+            mapper = orm_execute_state.bind_mapper
+            if mapper is not None and issubclass(mapper.class_, models):
+                orm_execute_state.session.info[flag] = True
+
+    @event.listens_for(Session, 'after_commit')
+    def run_on_commit(session):
+        if session.info.pop(flag, False):
+            callback()
+
+    @event.listens_for(Session, 'after_rollback')
+    def reset_on_rollback(session):
+        session.info.pop(flag, None)
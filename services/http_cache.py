@@ -0,0 +1,95 @@
+from datetime import datetime, timezone
+from dataclasses import dataclass
+from flask import request, session, g, current_app
+from config import Config
+
+
+@dataclass(frozen=True, slots=True)
+class CachePolicy:
+    scope: str
+    max_age: int
+    stale_while_revalidate: int = 0
+
+
+def cache_policy(scope='public', max_age=None, stale_while_revalidate=None):
+    """
+    Declare how browsers and proxies may cache a view's responses.
+
+    Views without a policy are sent with no-store, as are admin pages, responses that
+    change the session (flash messages, new CSRF cookie) and sessions holding captcha
+    state. Pages that embed the session's CSRF token are downgraded to private.
+    """
+    policy = CachePolicy(
+        scope=scope,
+        max_age=Config.HTTP_CACHE_MAX_AGE if max_age is None else max_age,
+        stale_while_revalidate=(Config.HTTP_CACHE_STALE_WHILE_REVALIDATE
+                                if stale_while_revalidate is None else stale_while_revalidate),
+    )
+
+    def decorator(view):
+        view.cache_policy = policy
+        return view
+    return decorator
+
+
+def note_modified(*items):
+    """
+    Record rendered entities (or datetimes) for the Last-Modified header.
+
+    Entities without an updated_at column are skipped; the ETag still covers them.
+    """
+    for item in items:
+        value = item if isinstance(item, datetime) else getattr(item, 'updated_at', None)
+        if value is None:
+            continue
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        last_modified = g.get('last_modified')
+        if last_modified is None or value > last_modified:
+            g.last_modified = value
+
+
+def _no_store(response):
+    response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
+    response.headers['Pragma'] = 'no-cache'
+    response.headers['Expires'] = '0'
+    return response
+
+
+def _get_policy():
+    if request.blueprint == 'admin' or request.endpoint is None:
+        return None
+    view = current_app.view_functions.get(request.endpoint)
+    return getattr(view, 'cache_policy', None)
+
+
+def apply_cache_policy(response):
+    """after_request hook: Cache-Control, ETag and Last-Modified for the current view."""
+    policy = _get_policy()
+    if (policy is None
+            or request.method not in ('GET', 'HEAD')
+            or response.status_code != 200
+            or session.modified
+            or 'captcha_token' in session):
+        return _no_store(response)
+
+    if not response.get_etag()[0] and not (response.is_streamed or response.direct_passthrough):
+        # Streamed and file responses set their own ETag; hashing would read the whole body
+        response.add_etag()
+    last_modified = g.get('last_modified')
+    if last_modified is not None:
+        response.last_modified = last_modified
+
+    if g.get('csrf_token'):
+        # Body carries this session's CSRF token: the browser may keep it, shared caches may not
+        response.headers['Cache-Control'] = 'private, no-cache'
+    else:
+        directives = [policy.scope, f'max-age={policy.max_age}']
+        if policy.stale_while_revalidate:
+            directives.append(f'stale-while-revalidate={policy.stale_while_revalidate}')
+        response.headers['Cache-Control'] = ', '.join(directives)
+
+    if response.is_streamed:
+        # Otherwise make_conditional buffers the whole body to compute Content-Length
+        response.implicit_sequence_conversion = False
+    return response.make_conditional(request)
@@ -1,7 +1,16 @@
 import os
+import logging
+from functools import lru_cache
 from PIL import Image
 from werkzeug.utils import secure_filename
 
+try:
+    import numpy as np
+except ImportError:  # numpy engine is optional, Pillow engine always works
+    np = None
+
+logger = logging.getLogger(__name__)
+
 
 def get_image_info(image_path):
     """Get image file size and dimensions."""
@@ -124,7 +133,131 @@ def rename_image_file(image_path, new_name):
         return None, str(e)
 
 
-def apply_watermark(image_path, watermark_path, opacity=0.4, scale=0.15):
+WATERMARK_WIDTH_STEP = 16
+
+# Compositing engines for apply_watermark; both produce identical pixels
+WATERMARK_ENGINES = ('pillow', 'numpy')
+DEFAULT_WATERMARK_ENGINE = 'pillow'
+
+
+@lru_cache(maxsize=64)
+def _load_watermark_tile(wm_full_path, mtime_ns, opacity, target_width):
+    """Load, resize and fade watermark once per (file version, opacity, width bucket)."""
+    with Image.open(wm_full_path) as source:
+        watermark = source.convert('RGBA')
+    
+    wm_width, wm_height = watermark.size
+    ratio = target_width / wm_width
+    target_height = max(1, int(wm_height * ratio))
+    watermark = watermark.resize((target_width, target_height), Image.LANCZOS)
+    
+    if opacity < 1.0:
+        alpha_lut = [int(p * opacity) for p in range(256)]
+        watermark.putalpha(watermark.getchannel('A').point(alpha_lut))
+    
+    return watermark
+
+
+@lru_cache(maxsize=64)
+def _load_watermark_layer(wm_full_path, mtime_ns, opacity, target_width):
+    """
+    Blend terms of a tile for the NumPy engine.
+    
+    Returns (layer, coef, offset): layer is the tile as it ends up on the transparent
+    layer after paste(tile, box, tile), i.e. DIV255(value * alpha) on every channel.
+    coef and offset turn alpha_composite over an opaque pixel into (dst * coef + offset).
+    """
+    tile = np.asarray(_load_watermark_tile(wm_full_path, mtime_ns, opacity, target_width), dtype=np.uint32)
+    layer = tile * tile[..., 3:4] + 128
+    layer = ((layer >> 8) + layer) >> 8
+    
+    # alpha_composite with dst alpha 255: coef1 = src_alpha << 7, coef2 = (255 << 7) - coef1
+    coef1 = np.repeat(layer[..., 3:4] << 7, 4, axis=2)
+    source = layer.copy()
+    source[..., 3] = 255
+    offset = source * coef1 + (0x80 << 7)
+    coef = (255 << 7) - coef1
+    
+    for array in (layer, coef, offset):
+        array.setflags(write=False)
+    return layer, coef, offset
+
+
+def _watermark_tile_args(watermark_path, image_width, opacity, scale):
+    wm_full_path = watermark_path.lstrip('/')
+    target_width = max(50, int(image_width * scale))
+    target_width = max(50, int(round(target_width / WATERMARK_WIDTH_STEP)) * WATERMARK_WIDTH_STEP)
+    mtime_ns = os.stat(wm_full_path).st_mtime_ns
+    return wm_full_path, mtime_ns, round(float(opacity), 3), target_width
+
+
+def get_watermark_tile(watermark_path, image_width, opacity=1.0, scale=0.15):
+    """
+    Get prepared watermark tile for an image of the given width.
+    
+    Target width is snapped to WATERMARK_WIDTH_STEP so images of similar size share a tile.
+    The returned image is cached and must not be modified.
+    """
+    return _load_watermark_tile(*_watermark_tile_args(watermark_path, image_width, opacity, scale))
+
+
+def _blend_region(dst, layer):
+    """alpha_composite(dst, layer) in integer math (7 extra precision bits, rounded /255)."""
+    dst = dst.astype(np.uint32)
+    src_a = layer[..., 3]
+    dst_a = dst[..., 3]
+    outa255 = src_a * 255 + dst_a * (255 - src_a)
+    coef1 = (src_a * (255 * 255 << 7)) // np.maximum(outa255, 1)
+    coef2 = (255 << 7) - coef1
+    
+    rgb = layer[..., :3] * coef1[..., None] + dst[..., :3] * coef2[..., None] + (0x80 << 7)
+    rgb = (((rgb >> 8) + rgb) >> 8) >> 7
+    alpha = outa255 + 0x80
+    alpha = ((alpha >> 8) + alpha) >> 8
+    
+    out = np.concatenate((rgb, alpha[..., None]), axis=2)
+    return np.where(src_a[..., None] == 0, dst, out).astype(np.uint8)
+
+
+def _composite_tiles_numpy(base_image, blend_terms, positions):
+    """
+    Blend pasted tile regions into base_image in place.
+    
+    Reproduces Image.alpha_composite pixel for pixel on the tile boxes only, so no
+    full-frame layer is allocated. Opaque regions (the usual case for photos) take a
+    single multiply-add; tiles never overlap (rows are spaced by 2.5 tile heights).
+    """
+    layer, coef, offset = blend_terms
+    img_width, img_height = base_image.size
+    for x, y in positions:
+        box = (x, y, min(x + layer.shape[1], img_width), min(y + layer.shape[0], img_height))
+        if box[2] <= box[0] or box[3] <= box[1]:
+            continue
+        h, w = box[3] - y, box[2] - x
+        dst = np.asarray(base_image.crop(box))
+        
+        if dst[..., 3].min() == 255:
+            out = np.multiply(dst, coef[:h, :w], dtype=np.uint32)
+            out += offset[:h, :w]
+            out += out >> 8
+            out >>= 15
+            out = out.astype(np.uint8)
+        else:
+            out = _blend_region(dst, layer[:h, :w])
+        
+        base_image.paste(Image.fromarray(out, 'RGBA'), box)
+    return base_image
+
+
+def resize_to_width(image, max_width):
+    """Downscale image proportionally so it is not wider than max_width."""
+    if max_width and image.width > max_width:
+        ratio = max_width / image.width
+        image = image.resize((max_width, max(1, int(image.height * ratio))), Image.LANCZOS)
+    return image
+
+
+def apply_watermark(image_path, watermark_path, opacity=0.4, scale=0.15, max_width=None, engine=None):
     """
     Apply soft watermark pattern - one watermark per row at random position.
     
@@ -133,6 +266,8 @@ def apply_watermark(image_path, watermark_path, opacity=0.4, scale=0.15):
         watermark_path: Path to the watermark image (PNG with transparency recommended)
         opacity: Opacity of the watermark (0.0 - 1.0)
         scale: Scale factor for watermark relative to image width (0.1 - 0.5)
+        max_width: Downscale image to this width before watermarking (None - keep size)
+        engine: 'pillow' (full-frame alpha_composite) or 'numpy' (tile regions only)
     
     Returns:
         PIL Image object with watermark applied, or None on error
@@ -151,46 +286,44 @@ def apply_watermark(image_path, watermark_path, opacity=0.4, scale=0.15):
     
     try:
         base_image = Image.open(img_full_path)
-        watermark = Image.open(wm_full_path)
         
         if base_image.mode != 'RGBA':
             base_image = base_image.convert('RGBA')
-        if watermark.mode != 'RGBA':
-            watermark = watermark.convert('RGBA')
         
+        base_image = resize_to_width(base_image, max_width)
         img_width, img_height = base_image.size
-        wm_width, wm_height = watermark.size
         
-        target_width = int(img_width * scale)
-        if target_width < 50:
-            target_width = 50
-        ratio = target_width / wm_width
-        target_height = int(wm_height * ratio)
-        watermark = watermark.resize((target_width, target_height), Image.LANCZOS)
+        tile_args = _watermark_tile_args(watermark_path, img_width, opacity, scale)
+        watermark = _load_watermark_tile(*tile_args)
         wm_width, wm_height = watermark.size
         
-        if opacity < 1.0:
-            alpha = watermark.split()[3]
-            alpha = alpha.point(lambda p: int(p * opacity))
-            watermark.putalpha(alpha)
-        
-        transparent_layer = Image.new('RGBA', base_image.size, (0, 0, 0, 0))
-        
         seed = int(hashlib.md5(image_path.encode()).hexdigest()[:8], 16)
-        random.seed(seed)
+        rng = random.Random(seed)
         
         spacing_y = int(wm_height * 2.5)
         
+        positions = []
         y = wm_height // 2
         while y < img_height - wm_height // 2:
             max_x = img_width - wm_width
             if max_x > 0:
-                x = random.randint(0, max_x)
+                x = rng.randint(0, max_x)
             else:
                 x = 0
-            transparent_layer.paste(watermark, (x, y), watermark)
+            positions.append((x, y))
             y += spacing_y
         
+        if engine == 'numpy':
+            if np is not None:
+                if base_image.readonly:
+                    base_image = base_image.copy()
+                return _composite_tiles_numpy(base_image, _load_watermark_layer(*tile_args), positions)
+            logger.warning("numpy is not installed, falling back to Pillow watermark engine")
+        
+        transparent_layer = Image.new('RGBA', base_image.size, (0, 0, 0, 0))
+        for x, y in positions:
+            transparent_layer.paste(watermark, (x, y), watermark)
+        
         result = Image.alpha_composite(base_image, transparent_layer)
         
         return result
@@ -198,30 +331,20 @@ def apply_watermark(image_path, watermark_path, opacity=0.4, scale=0.15):
         return None
 
 
-def get_watermarked_image_bytes(image_path, watermark_path, output_format='JPEG', opacity=1.0):
+def encode_image(result, output_format='JPEG'):
     """
-    Get watermarked image as bytes for serving via Flask.
-    
-    Args:
-        image_path: Path to the original image
-        watermark_path: Path to the watermark image
-        output_format: Output format ('JPEG', 'PNG', 'WEBP')
-        opacity: Opacity of the watermark (0.1 - 1.0)
+    Encode PIL image for serving via Flask.
     
     Returns:
         Tuple of (bytes, content_type) or (None, None) on error
     """
     import io
     
-    result = apply_watermark(image_path, watermark_path, opacity=opacity)
-    if result is None:
-        return None, None
-    
     try:
         output = io.BytesIO()
         
         if output_format.upper() == 'JPEG':
-            if result.mode == 'RGBA':
+            if result.mode not in ('RGB', 'L'):
                 result = result.convert('RGB')
             result.save(output, 'JPEG', quality=90, optimize=True)
             content_type = 'image/jpeg'
@@ -231,8 +354,13 @@ def get_watermarked_image_bytes(image_path, watermark_path, output_format='JPEG'
         elif output_format.upper() == 'WEBP':
             result.save(output, 'WEBP', quality=90, optimize=True)
             content_type = 'image/webp'
+        elif output_format.upper() == 'AVIF':
+            if result.mode not in ('RGB', 'RGBA'):
+                result = result.convert('RGBA')
+            result.save(output, 'AVIF', quality=70)
+            content_type = 'image/avif'
         else:
-            if result.mode == 'RGBA':
+            if result.mode not in ('RGB', 'L'):
                 result = result.convert('RGB')
             result.save(output, 'JPEG', quality=90)
             content_type = 'image/jpeg'
@@ -241,3 +369,49 @@ def get_watermarked_image_bytes(image_path, watermark_path, output_format='JPEG'
         return output.getvalue(), content_type
     except Exception:
         return None, None
+
+
+def get_watermarked_image_bytes(image_path, watermark_path, output_format='JPEG', opacity=1.0, max_width=None, engine=None):
+    """
+    Get watermarked image as bytes for serving via Flask.
+    
+    Args:
+        image_path: Path to the original image
+        watermark_path: Path to the watermark image
+        output_format: Output format ('JPEG', 'PNG', 'WEBP', 'AVIF')
+        opacity: Opacity of the watermark (0.1 - 1.0)
+        max_width: Downscale image to this width before watermarking (None - keep size)
+        engine: Compositing engine from WATERMARK_ENGINES (None - Pillow)
+    
+    Returns:
+        Tuple of (bytes, content_type) or (None, None) on error
+    """
+    result = apply_watermark(image_path, watermark_path, opacity=opacity, max_width=max_width, engine=engine)
+    if result is None:
+        return None, None
+    
+    return encode_image(result, output_format)
+
+
+def get_resized_image_bytes(image_path, output_format='JPEG', max_width=None):
+    """
+    Get image downscaled to max_width (without watermark) as bytes.
+    
+    Returns:
+        Tuple of (bytes, content_type) or (None, None) on error
+    """
+    if not image_path:
+        return None, None
+    
+    full_path = image_path.lstrip('/')
+    if not os.path.exists(full_path):
+        return None, None
+    
+    try:
+        with Image.open(full_path) as img:
+            img.load()
+            result = resize_to_width(img, max_width)
+    except Exception:
+        return None, None
+    
+    return encode_image(result, output_format)
@@ -0,0 +1,313 @@
+import os
+import uuid
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from itertools import islice
+from flask import current_app
+from sqlalchemy import update, select, or_, and_
+from extensions import db
+from config import Config
+from models import ImportJob
+from services.importers import (IMPORT_KINDS, DRY_RUN_KINDS, new_import_results, iter_csv_rows, open_csv_stream,
+                                is_xlsx, open_xlsx, iter_xlsx_rows, prepare_import, apply_import_rows)
+from services.accessory_compat import rebuild_compatibility
+from services.size_prices import rebuild_size_prices
+
+logger = logging.getLogger(__name__)
+
+# Rows applied and committed together with the job checkpoint
+IMPORT_CHUNK_ROWS = 1000
+MAX_ATTEMPTS = 3
+# Running jobs without a checkpoint for this long are considered lost (process died)
+STALE_RUNNING_SECONDS = 300
+# Errors kept for display; error_count has the full number
+MAX_STORED_ERRORS = 500
+# Row diffs kept for display; the counters cover every row
+MAX_STORED_CHANGES = 500
+# Files of dry runs that were not applied are removed after this
+DRY_RUN_KEEP_SECONDS = 24 * 3600
+
+_worker_thread = None
+_worker_lock = threading.Lock()
+
+
+def get_upload_dir():
+    return os.path.abspath(Config.IMPORT_UPLOAD_DIR)
+
+
+def _queue_job(kind, file_path, original_name, dry_run):
+    job = ImportJob(
+        kind=kind,
+        file_path=file_path,
+        original_name=original_name,
+        status='pending',
+        dry_run=dry_run,
+        total_bytes=os.path.getsize(file_path),
+    )
+    db.session.add(job)
+    db.session.commit()
+
+    ensure_worker(current_app._get_current_object())
+    return job
+
+
+def create_import_job(kind, file_storage, dry_run=False):
+    """
+    Save an uploaded CSV or XLSX file to disk and queue it for the background importer.
+
+    The request only writes the file; rows are read and applied by the worker
+    thread in chunks of IMPORT_CHUNK_ROWS, each committed with its checkpoint.
+    A dry run only compares the file with current data; its file is kept
+    for apply_dry_run.
+    """
+    if kind not in IMPORT_KINDS:
+        raise ValueError(f'Unknown import kind: {kind}')
+    if dry_run and kind not in DRY_RUN_KINDS:
+        raise ValueError(f'Dry run is not supported for {kind}')
+
+    _prune_dry_run_files()
+    upload_dir = get_upload_dir()
+    os.makedirs(upload_dir, exist_ok=True)
+    extension = '.xlsx' if is_xlsx(file_storage.filename) else '.csv'
+    file_path = os.path.join(upload_dir, f'{kind}-{uuid.uuid4().hex}{extension}')
+    file_storage.save(file_path)
+    return _queue_job(kind, file_path, file_storage.filename or '', dry_run)
+
+
+def can_apply(job):
+    return job.dry_run and job.status == 'done' and os.path.exists(job.file_path)
+
+
+def apply_dry_run(job):
+    """Queue the real import of a finished dry run from the same file."""
+    if not can_apply(job):
+        raise ValueError(f'Import job {job.id} is not a finished dry run with its file')
+    return _queue_job(job.kind, job.file_path, job.original_name, False)
+
+
+def _prune_dry_run_files():
+    """Remove files of old dry runs unless an import queued from them still needs the file."""
+    expired = ImportJob.query.filter(
+        ImportJob.dry_run == True, ImportJob.status == 'done',
+        ImportJob.finished_at < datetime.utcnow() - timedelta(seconds=DRY_RUN_KEEP_SECONDS),
+    ).all()
+    if not expired:
+        return
+    in_use = {path for (path,) in db.session.query(ImportJob.file_path).filter(
+        ImportJob.status.in_(['pending', 'running']),
+        ImportJob.file_path.in_([job.file_path for job in expired]),
+    )}
+    for job in expired:
+        if job.file_path not in in_use and os.path.exists(job.file_path):
+            os.remove(job.file_path)
+
+
+def _stale_before():
+    return datetime.utcnow() - timedelta(seconds=STALE_RUNNING_SECONDS)
+
+
+def _claimable():
+    return or_(
+        ImportJob.status == 'pending',
+        and_(ImportJob.status == 'running', ImportJob.updated_at < _stale_before()),
+    )
+
+
+def is_claimable(job):
+    return job.status == 'pending' or (job.status == 'running' and job.updated_at < _stale_before())
+
+
+def _claim_job(job_id):
+    """Mark a pending or abandoned job as running; False if another worker got it first."""
+    claimed = db.session.execute(
+        update(ImportJob)
+        .where(ImportJob.id == job_id, _claimable())
+        .values(status='running', attempts=ImportJob.attempts + 1, updated_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.session.commit()
+    return claimed == 1
+
+
+def _next_job_id():
+    return db.session.execute(
+        select(ImportJob.id).where(_claimable()).order_by(ImportJob.id).limit(1)
+    ).scalar()
+
+
+def _add_chunk_results(job, results, position):
+    job.rows_done = position[0]
+    job.processed_bytes = position[1]
+    job.success += results['success']
+    job.error_count += len(results['errors'])
+    if len(job.errors) < MAX_STORED_ERRORS:
+        job.errors = (job.errors + results['errors'])[:MAX_STORED_ERRORS]
+    if results['product_line_ids']:
+        job.product_line_ids = sorted(set(job.product_line_ids) | results['product_line_ids'])
+    # Counters are NULL on jobs queued before the diff columns were added
+    job.created_count = (job.created_count or 0) + results['created']
+    job.changed_count = (job.changed_count or 0) + results['changed']
+    job.unchanged_count = (job.unchanged_count or 0) + results['unchanged']
+    changes = job.changes or []
+    if results['changes'] and len(changes) < MAX_STORED_CHANGES:
+        job.changes = (changes + results['changes'])[:MAX_STORED_CHANGES]
+    job.updated_at = datetime.utcnow()
+
+
+def _rebuild_derived(job, product_line_ids):
+    """Recompute price and compatibility rows of lines whose items the chunk wrote. Caller commits."""
+    if job.kind == 'size_items' and not job.dry_run and product_line_ids:
+        rebuild_compatibility(product_line_ids)
+        rebuild_size_prices(product_line_ids)
+
+
+def _finish_job(job):
+    job.status = 'done'
+    job.processed_bytes = job.total_bytes
+    job.finished_at = job.updated_at = datetime.utcnow()
+    db.session.commit()
+    if job.dry_run:
+        return
+    try:
+        os.remove(job.file_path)
+    except OSError:
+        pass
+
+
+@contextmanager
+def _job_rows(job):
+    """Rows of the job file after its checkpoint, and a function of the last row giving bytes processed."""
+    start_after = job.rows_done or 0
+    if is_xlsx(job.file_path):
+        workbook = open_xlsx(job.file_path)
+        try:
+            sheet = workbook.active
+            total_rows = sheet.max_row or 0
+            # A sheet is compressed inside the workbook, so progress is estimated from row numbers
+            yield (iter_xlsx_rows(sheet, start_after=start_after),
+                   lambda row_num: int(job.total_bytes * min(row_num / total_rows, 1)) if total_rows else 0)
+        finally:
+            workbook.close()
+    else:
+        with open(job.file_path, 'rb') as raw:
+            # Keep the text wrapper referenced: when collected it closes raw, which tell() still reads
+            stream = open_csv_stream(raw)
+            try:
+                # Read-ahead of the text buffer makes the byte position approximate
+                yield (iter_csv_rows(stream, start_after=start_after),
+                       lambda row_num: min(raw.tell(), job.total_bytes))
+            finally:
+                stream.detach()
+
+
+def process_job(job_id):
+    """
+    Apply a claimed job from its last checkpoint to the end of the file.
+
+    Rows up to rows_done are parsed but skipped, so a job interrupted by a
+    crash or restart resumes without applying any chunk twice. A dry run
+    goes through the same chunks and only stores the diff; a size repeated
+    in another chunk is then counted again.
+
+    Prices and accessory compatibility of the touched lines are rebuilt in
+    each chunk's transaction, so pages never show items with stale derived
+    rows, also when the job later fails.
+    """
+    job = db.session.get(ImportJob, job_id)
+    context = prepare_import(job.kind)
+
+    with _job_rows(job) as (rows, bytes_done):
+        while True:
+            chunk = list(islice(rows, IMPORT_CHUNK_ROWS))
+            if not chunk:
+                break
+            results = new_import_results()
+            apply_import_rows(job.kind, context, chunk, results, dry_run=bool(job.dry_run))
+            _rebuild_derived(job, results['product_line_ids'])
+            _add_chunk_results(job, results, (chunk[-1][0], bytes_done(chunk[-1][0])))
+            db.session.commit()
+
+    _finish_job(job)
+    logger.info(f"Import job {job.id} ({job.kind}): {job.success} imported, {job.error_count} errors")
+
+
+def _fail_attempt(job_id, error):
+    db.session.rollback()
+    job = db.session.get(ImportJob, job_id)
+    if job is None:
+        return
+    job.errors = (job.errors or []) + [f"Ошибка импорта: {error}"]
+    job.error_count = (job.error_count or 0) + 1
+    job.updated_at = datetime.utcnow()
+    if job.attempts >= MAX_ATTEMPTS or not os.path.exists(job.file_path):
+        job.status = 'failed'
+        job.finished_at = job.updated_at
+    else:
+        job.status = 'pending'
+    db.session.commit()
+
+
+def run_pending_jobs():
+    """
+    Process queued and abandoned jobs one at a time until none are left.
+
+    Returns:
+        Number of jobs processed
+    """
+    processed = 0
+    while True:
+        job_id = _next_job_id()
+        if job_id is None:
+            return processed
+        if not _claim_job(job_id):
+            continue
+        try:
+            process_job(job_id)
+        except Exception as e:
+            logger.error(f"Import job {job_id} failed: {e}")
+            _fail_attempt(job_id, e)
+        processed += 1
+
+
+def _worker_loop(app):
+    with app.app_context():
+        try:
+            run_pending_jobs()
+        except Exception as e:
+            logger.error(f"Import worker error: {e}")
+
+
+def ensure_worker(app):
+    """Start the import thread for this process if it is not running; it exits when the queue is empty."""
+    global _worker_thread
+    with _worker_lock:
+        if _worker_thread is None or not _worker_thread.is_alive():
+            _worker_thread = threading.Thread(target=_worker_loop, args=(app,), name='import-worker', daemon=True)
+            _worker_thread.start()
+
+
+def get_job_status(job):
+    """Progress of a job for the admin page (JSON)."""
+    if is_claimable(job):
+        # Resume jobs left by a restarted or crashed process
+        ensure_worker(current_app._get_current_object())
+    percent = 100 if job.status == 'done' else int(job.processed_bytes * 100 / job.total_bytes) if job.total_bytes else 0
+    return {
+        'id': job.id,
+        'kind': job.kind,
+        'file_name': job.original_name,
+        'status': job.status,
+        'percent': percent,
+        'rows_done': max((job.rows_done or 0) - 1, 0),
+        'success': job.success,
+        'error_count': job.error_count,
+        'errors': (job.errors or [])[:20],
+        'dry_run': bool(job.dry_run),
+        'created': job.created_count or 0,
+        'changed': job.changed_count or 0,
+        'unchanged': job.unchanged_count or 0,
+        'changes': [change for change in (job.changes or []) if change['action'] == 'update'][:100],
+        'can_apply': can_apply(job),
+    }
@@ -1,292 +1,661 @@
 import csv
 import io
-from datetime import datetime
+import os
+from datetime import datetime, date
+from urllib.parse import urlsplit
+from sqlalchemy import select, update, tuple_
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from openpyxl import load_workbook
 from extensions import db
-from models import Category, ProductLine, SizeItem, News
+from models import Category, ProductLine, SizeItem, News, RedirectRule
 from services.slug import generate_slug, make_unique_slug
 
 
-def decode_csv_content(file_content):
-    """Decode CSV content trying UTF-8 first, then Windows-1251"""
-    try:
-        return file_content.decode('utf-8-sig')
-    except UnicodeDecodeError:
-        pass
-    try:
-        return file_content.decode('cp1251')
-    except UnicodeDecodeError:
-        pass
-    return file_content.decode('utf-8', errors='replace')
+IMPORT_KINDS = ('categories', 'product_lines', 'size_items', 'news')
+# Kinds that can compute a diff without writing (dry_run=True)
+DRY_RUN_KINDS = ('product_lines', 'size_items')
+
+
+def new_import_results():
+    """
+    Counters of an import run.
+
+    For DRY_RUN_KINDS valid rows are also split into created / changed /
+    unchanged, and 'changes' lists what differs ({'row', 'key', 'action', 'fields'}).
+    """
+    return {'success': 0, 'errors': [], 'product_line_ids': set(),
+            'created': 0, 'changed': 0, 'unchanged': 0, 'changes': []}
+
+
+def _same_value(current, value):
+    # Empty text written by the importer and NULL left by older rows are the same thing
+    if isinstance(value, str) and current is None:
+        return value == ''
+    return current == value
+
+
+def diff_values(current, values):
+    """Columns whose new value differs from current: {name: [old, new]}."""
+    return {name: [current.get(name), value] for name, value in values.items()
+            if not _same_value(current.get(name), value)}
+
+
+def _record_change(results, row_num, key, fields=None):
+    if fields is None:
+        results['created'] += 1
+        results['changes'].append({'row': row_num, 'key': key, 'action': 'create', 'fields': {}})
+    elif fields:
+        results['changed'] += 1
+        results['changes'].append({'row': row_num, 'key': key, 'action': 'update', 'fields': fields})
+    else:
+        results['unchanged'] += 1
+
+
+def iter_csv_rows(stream, start_after=0):
+    """
+    (row_num, row) pairs of a ;-delimited CSV with a header line.
+
+    Row numbers count the header as line 1, as in error messages. Rows up to
+    start_after are skipped (resuming an interrupted import).
+    """
+    reader = csv.DictReader(stream, delimiter=';')
+    for row_num, row in enumerate(reader, 2):
+        if row_num > start_after:
+            yield row_num, row
 
 
-def import_categories_csv(file_content):
-    results = {'success': 0, 'errors': []}
+def is_xlsx(filename):
+    return os.path.splitext(filename or '')[1].lower() == '.xlsx'
+
+
+def open_xlsx(file):
+    """
+    Open a workbook for streaming reads (path or binary file).
+
+    Read-only mode parses the sheet XML row by row instead of loading it;
+    the caller closes the workbook.
+    """
+    return load_workbook(file, read_only=True, data_only=True)
+
+
+def _xlsx_cell_text(value):
+    # Cells are turned into the text the CSV importers expect
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    if isinstance(value, (datetime, date)):
+        return value.strftime('%d.%m.%Y')
+    return str(value)
+
+
+def iter_xlsx_rows(sheet, start_after=0):
+    """
+    (row_num, row) pairs of a worksheet whose first row holds the column names.
+
+    Same contract as iter_csv_rows: row numbers are sheet row numbers, empty
+    rows are skipped like blank CSV lines.
+    """
+    rows = sheet.iter_rows(values_only=True)
+    header = next(rows, None)
+    if header is None:
+        return
+    columns = [_xlsx_cell_text(name).strip() for name in header]
+    for row_num, values in enumerate(rows, 2):
+        if row_num <= start_after or all(value is None for value in values):
+            continue
+        yield row_num, {name: _xlsx_cell_text(value) for name, value in zip(columns, values) if name}
+
+
+def _import_category_row(context, row_num, row, results):
+    slug = row.get('slug', '').strip()
+    name = row.get('name', '').strip()
     
-    try:
-        stream = io.StringIO(decode_csv_content(file_content))
-        reader = csv.DictReader(stream, delimiter=';')
-        
-        for row_num, row in enumerate(reader, 2):
-            try:
-                slug = row.get('slug', '').strip()
-                name = row.get('name', '').strip()
-                
-                if not slug and name:
-                    slug = generate_slug(name)
-                
-                if not slug or not name:
-                    results['errors'].append(f"Строка {row_num}: пустой slug или name")
-                    continue
-                
-                existing = Category.query.filter_by(slug=slug).first()
-                if existing:
-                    existing.name = name
-                    existing.description_html = row.get('description_html', '')
-                    existing.image_path = row.get('image_path', '')
-                    existing.seo_title = row.get('seo_title', '')
-                    existing.seo_description = row.get('seo_description', '')
-                    existing.h1 = row.get('h1', '')
-                    existing.seo_text_html = row.get('seo_text_html', '')
-                    existing.sort_order = int(row.get('sort_order', 0) or 0)
-                    existing.is_active = row.get('is_active', '1').lower() in ['1', 'true', 'yes']
-                else:
-                    cat = Category(
-                        slug=slug,
-                        name=name,
-                        description_html=row.get('description_html', ''),
-                        image_path=row.get('image_path', ''),
-                        seo_title=row.get('seo_title', ''),
-                        seo_description=row.get('seo_description', ''),
-                        h1=row.get('h1', ''),
-                        seo_text_html=row.get('seo_text_html', ''),
-                        sort_order=int(row.get('sort_order', 0) or 0),
-                        is_active=row.get('is_active', '1').lower() in ['1', 'true', 'yes']
-                    )
-                    db.session.add(cat)
-                
-                results['success'] += 1
-            except Exception as e:
-                results['errors'].append(f"Строка {row_num}: {str(e)}")
-        
-        db.session.commit()
-    except Exception as e:
-        results['errors'].append(f"Ошибка парсинга CSV: {str(e)}")
+    if not slug and name:
+        slug = generate_slug(name)
     
-    return results
+    if not slug or not name:
+        results['errors'].append(f"Строка {row_num}: пустой slug или name")
+        return
+    
+    existing = Category.query.filter_by(slug=slug).first()
+    if existing:
+        existing.name = name
+        existing.description_html = row.get('description_html', '')
+        existing.image_path = row.get('image_path', '')
+        existing.seo_title = row.get('seo_title', '')
+        existing.seo_description = row.get('seo_description', '')
+        existing.h1 = row.get('h1', '')
+        existing.seo_text_html = row.get('seo_text_html', '')
+        existing.sort_order = int(row.get('sort_order', 0) or 0)
+        existing.is_active = row.get('is_active', '1').lower() in ['1', 'true', 'yes']
+    else:
+        cat = Category(
+            slug=slug,
+            name=name,
+            description_html=row.get('description_html', ''),
+            image_path=row.get('image_path', ''),
+            seo_title=row.get('seo_title', ''),
+            seo_description=row.get('seo_description', ''),
+            h1=row.get('h1', ''),
+            seo_text_html=row.get('seo_text_html', ''),
+            sort_order=int(row.get('sort_order', 0) or 0),
+            is_active=row.get('is_active', '1').lower() in ['1', 'true', 'yes']
+        )
+        db.session.add(cat)
+    
+    results['success'] += 1
 
 
-def import_product_lines_csv(file_content):
-    results = {'success': 0, 'errors': []}
+def _import_product_line_row(context, row_num, row, results, dry_run=False):
+    """Create or update one product line; only columns that differ are assigned."""
+    category_slug = row.get('category_slug', '').strip()
+    slug = row.get('slug', '').strip()
+    name = row.get('name', '').strip()
     
-    try:
-        stream = io.StringIO(decode_csv_content(file_content))
-        reader = csv.DictReader(stream, delimiter=';')
-        
-        for row_num, row in enumerate(reader, 2):
-            try:
-                category_slug = row.get('category_slug', '').strip()
-                slug = row.get('slug', '').strip()
-                name = row.get('name', '').strip()
-                
-                if not slug and name:
-                    slug = generate_slug(name)
-                
-                if not category_slug or not slug or not name:
-                    results['errors'].append(f"Строка {row_num}: пустые обязательные поля")
-                    continue
-                
-                category = Category.query.filter_by(slug=category_slug).first()
-                if not category:
-                    results['errors'].append(f"Строка {row_num}: категория {category_slug} не найдена")
-                    continue
-                
-                existing = ProductLine.query.filter_by(category_id=category.id, slug=slug).first()
-                if existing:
-                    existing.name = name
-                    existing.description_html = row.get('description_html', '')
-                    existing.image_path = row.get('image_path', '')
-                    existing.seo_title = row.get('seo_title', '')
-                    existing.seo_description = row.get('seo_description', '')
-                    existing.h1 = row.get('h1', '')
-                    existing.seo_text_html = row.get('seo_text_html', '')
-                    existing.sort_order = int(row.get('sort_order', 0) or 0)
-                    existing.is_active = row.get('is_active', '1').lower() in ['1', 'true', 'yes']
-                else:
-                    pl = ProductLine(
-                        category_id=category.id,
-                        slug=slug,
-                        name=name,
-                        description_html=row.get('description_html', ''),
-                        image_path=row.get('image_path', ''),
-                        seo_title=row.get('seo_title', ''),
-                        seo_description=row.get('seo_description', ''),
-                        h1=row.get('h1', ''),
-                        seo_text_html=row.get('seo_text_html', ''),
-                        sort_order=int(row.get('sort_order', 0) or 0),
-                        is_active=row.get('is_active', '1').lower() in ['1', 'true', 'yes']
-                    )
-                    db.session.add(pl)
-                
-                results['success'] += 1
-            except Exception as e:
-                results['errors'].append(f"Строка {row_num}: {str(e)}")
-        
-        db.session.commit()
-    except Exception as e:
-        results['errors'].append(f"Ошибка парсинга CSV: {str(e)}")
+    if not slug and name:
+        slug = generate_slug(name)
     
-    return results
+    if not category_slug or not slug or not name:
+        results['errors'].append(f"Строка {row_num}: пустые обязательные поля")
+        return
+    
+    category = Category.query.filter_by(slug=category_slug).first()
+    if not category:
+        results['errors'].append(f"Строка {row_num}: категория {category_slug} не найдена")
+        return
+    
+    values = {
+        'name': name,
+        'description_html': row.get('description_html', ''),
+        'image_path': row.get('image_path', ''),
+        'seo_title': row.get('seo_title', ''),
+        'seo_description': row.get('seo_description', ''),
+        'h1': row.get('h1', ''),
+        'seo_text_html': row.get('seo_text_html', ''),
+        'sort_order': int(row.get('sort_order', 0) or 0),
+        'is_active': row.get('is_active', '1').lower() in ['1', 'true', 'yes'],
+    }
+    key = f"{category_slug}/{slug}"
+    
+    existing = ProductLine.query.filter_by(category_id=category.id, slug=slug).first()
+    if existing:
+        changed = diff_values({name: getattr(existing, name) for name in values}, values)
+        _record_change(results, row_num, key, changed)
+        if not dry_run:
+            for name in changed:
+                setattr(existing, name, values[name])
+    else:
+        _record_change(results, row_num, key)
+        if not dry_run:
+            db.session.add(ProductLine(category_id=category.id, slug=slug, **values))
+    
+    results['success'] += 1
+
 
+def _prepare_news_import():
+    return [n.slug for n in News.query.all()]
 
-def import_size_items_csv(file_content):
-    results = {'success': 0, 'errors': []}
+
+def _import_news_row(existing_slugs, row_num, row, results):
+    content = row.get('content', '').strip()
+    date_str = row.get('date', '').strip()
+    title = row.get('title', '').strip()
+    slug = row.get('slug', '').strip()
+    
+    if not content:
+        results['errors'].append(f"Строка {row_num}: пустой контент")
+        return
+    
+    if not title:
+        title = content[:50] + '...' if len(content) > 50 else content
+    
+    if not slug:
+        slug = generate_slug(title)
+        slug = make_unique_slug(slug, existing_slugs)
     
     try:
-        stream = io.StringIO(decode_csv_content(file_content))
-        reader = csv.DictReader(stream, delimiter=';')
-        
-        for row_num, row in enumerate(reader, 2):
+        if date_str:
+            date = datetime.strptime(date_str, '%d.%m.%Y').date()
+        else:
+            date = datetime.utcnow().date()
+    except:
+        date = datetime.utcnow().date()
+    
+    existing = News.query.filter_by(slug=slug).first()
+    if existing:
+        existing.title = title
+        existing.date = date
+        existing.content_html = content
+        existing.seo_title = row.get('seo_title', '')
+        existing.seo_description = row.get('seo_description', '')
+        existing.h1 = row.get('h1', '')
+        existing.is_published = row.get('is_published', '1').lower() in ['1', 'true', 'yes']
+    else:
+        news = News(
+            title=title,
+            slug=slug,
+            date=date,
+            content_html=content,
+            seo_title=row.get('seo_title', ''),
+            seo_description=row.get('seo_description', ''),
+            h1=row.get('h1', ''),
+            is_published=row.get('is_published', '1').lower() in ['1', 'true', 'yes']
+        )
+        db.session.add(news)
+        existing_slugs.append(slug)
+    
+    results['success'] += 1
+
+
+def _apply_rows_one_by_one(import_row):
+    def apply_rows(context, rows, results, **options):
+        for row_num, row in rows:
             try:
-                category_slug = row.get('category_slug', '').strip()
-                product_slug = row.get('product_slug', '').strip()
-                size_text = row.get('size_text', '').strip()
-                size_slug = row.get('size_slug', '').strip()
-                
-                if not size_slug and size_text:
-                    size_slug = size_text.replace('/', '_').replace(' ', '_')
-                
-                if not category_slug or not product_slug or not size_text or not size_slug:
-                    results['errors'].append(f"Строка {row_num}: пустые обязательные поля")
-                    continue
-                
-                category = Category.query.filter_by(slug=category_slug).first()
-                if not category:
-                    results['errors'].append(f"Строка {row_num}: категория {category_slug} не найдена")
-                    continue
-                
-                product_line = ProductLine.query.filter_by(category_id=category.id, slug=product_slug).first()
-                if not product_line:
-                    results['errors'].append(f"Строка {row_num}: линейка {product_slug} не найдена")
-                    continue
-                
-                price_str = row.get('price', '0').strip().replace(',', '.')
-                try:
-                    price = float(price_str) if price_str else 0.0
-                except:
-                    price = 0.0
-                
-                existing = SizeItem.query.filter_by(product_line_id=product_line.id, size_slug=size_slug).first()
-                if existing:
-                    existing.size_text = size_text
-                    existing.full_name = f"{product_line.name} {size_text}"
-                    existing.sku = row.get('sku', '')
-                    existing.price = price
-                    existing.currency = row.get('currency', 'RUB')
-                    existing.unit = row.get('unit', 'шт')
-                    existing.in_stock = row.get('in_stock', '1').lower() in ['1', 'true', 'yes']
-                    existing.image_path = row.get('image_path', '')
-                    existing.pipe_dxs = row.get('pipe_dxs', '')
-                    existing.pressure = row.get('pressure', '')
-                    existing.mass_per_m = row.get('mass_per_m', '')
-                    existing.min_bend_radius = row.get('min_bend_radius', '')
-                    existing.max_len_coil = row.get('max_len_coil', '')
-                    existing.max_len_drum = row.get('max_len_drum', '')
-                else:
-                    si = SizeItem(
-                        product_line_id=product_line.id,
-                        size_text=size_text,
-                        size_slug=size_slug,
-                        full_name=f"{product_line.name} {size_text}",
-                        sku=row.get('sku', ''),
-                        price=price,
-                        currency=row.get('currency', 'RUB'),
-                        unit=row.get('unit', 'шт'),
-                        in_stock=row.get('in_stock', '1').lower() in ['1', 'true', 'yes'],
-                        image_path=row.get('image_path', ''),
-                        pipe_dxs = row.get('pipe_dxs', ''),
-                        pressure = row.get('pressure', ''),
-                        mass_per_m = row.get('mass_per_m', ''),
-                        min_bend_radius = row.get('min_bend_radius', ''),
-                        max_len_coil = row.get('max_len_coil', ''),
-                        max_len_drum = row.get('max_len_drum', '')
-                    )
-                    db.session.add(si)
-                
-                results['success'] += 1
+                import_row(context, row_num, row, results, **options)
             except Exception as e:
                 results['errors'].append(f"Строка {row_num}: {str(e)}")
-        
-        db.session.commit()
-    except Exception as e:
-        results['errors'].append(f"Ошибка парсинга CSV: {str(e)}")
-    
-    return results
+    return apply_rows
+
+
+SIZE_ITEM_BATCH_SIZE = 1000
+SIZE_ITEM_UPDATE_COLUMNS = (
+    'size_text', 'sort_key', 'full_name', 'sku', 'price', 'currency', 'unit', 'in_stock', 'image_path',
+    'pipe_dxs', 'pressure', 'mass_per_m', 'min_bend_radius', 'max_len_coil', 'max_len_drum', 'updated_at',
+)
+SIZE_ITEM_DIFF_COLUMNS = tuple(name for name in SIZE_ITEM_UPDATE_COLUMNS if name != 'updated_at')
+UPSERT_INSERTS = {
+    'sqlite': sqlite_insert,
+    'postgresql': postgresql_insert,
+}
+
+
+def bulk_upsert(model, rows, conflict_columns, update_columns, batch_size):
+    """
+    INSERT ... ON CONFLICT (conflict_columns) DO UPDATE in batches (SQLite and PostgreSQL).
+
+    Rows must be unique on conflict_columns: PostgreSQL rejects a statement
+    that touches the same row twice. Caller commits.
+    """
+    insert = UPSERT_INSERTS.get(db.session.get_bind().dialect.name)
+    if insert is None:
+        raise ValueError(f'Bulk upsert is not supported for {db.session.get_bind().dialect.name}')
+    statement = insert(model)
+    statement = statement.on_conflict_do_update(
+        index_elements=list(conflict_columns),
+        set_={name: getattr(statement.excluded, name) for name in update_columns},
+    )
+    for start in range(0, len(rows), batch_size):
+        db.session.execute(statement, rows[start:start + batch_size])
+
+
+def load_product_line_map():
+    """(category slug, product line slug) -> (product line id, name), plus the set of category slugs; two queries."""
+    categories = dict(db.session.query(Category.id, Category.slug))
+    product_lines = {
+        (categories[category_id], slug): (pl_id, name)
+        for pl_id, category_id, slug, name in db.session.query(
+            ProductLine.id, ProductLine.category_id, ProductLine.slug, ProductLine.name
+        )
+    }
+    return set(categories.values()), product_lines
+
+
+def _size_item_values(row, product_line_id, product_line_name, size_text, size_slug, price, now):
+    """Column values of an imported size item, same fields as the admin form fills."""
+    return {
+        'product_line_id': product_line_id,
+        'size_slug': size_slug,
+        'size_text': size_text,
+        'sort_key': SizeItem.compute_sort_key(size_text),
+        'full_name': f"{product_line_name} {size_text}",
+        'sku': row.get('sku', ''),
+        'price': price,
+        'currency': row.get('currency', 'RUB'),
+        'unit': row.get('unit', 'шт'),
+        'in_stock': row.get('in_stock', '1').lower() in ['1', 'true', 'yes'],
+        'image_path': row.get('image_path', ''),
+        'pipe_dxs': row.get('pipe_dxs', ''),
+        'pressure': row.get('pressure', ''),
+        'mass_per_m': row.get('mass_per_m', ''),
+        'min_bend_radius': row.get('min_bend_radius', ''),
+        'max_len_coil': row.get('max_len_coil', ''),
+        'max_len_drum': row.get('max_len_drum', ''),
+        'updated_at': now,
+    }
+
+
+def _load_size_item_state(keys):
+    """Current diffable columns of existing size items by (product_line_id, size_slug), in batches."""
+    keys = list(keys)
+    columns = [getattr(SizeItem, name) for name in SIZE_ITEM_DIFF_COLUMNS]
+    state = {}
+    for start in range(0, len(keys), SIZE_ITEM_BATCH_SIZE):
+        for row in db.session.execute(
+            select(SizeItem.id, SizeItem.product_line_id, SizeItem.size_slug, *columns)
+            .where(tuple_(SizeItem.product_line_id, SizeItem.size_slug).in_(keys[start:start + SIZE_ITEM_BATCH_SIZE]))
+        ):
+            state[(row.product_line_id, row.size_slug)] = row._mapping
+    return state
 
 
-def import_news_csv(file_content):
-    results = {'success': 0, 'errors': []}
+def _update_changed_size_items(updates, now):
+    """
+    ORM bulk UPDATE by primary key, one executemany per set of changed columns.
+
+    Untouched columns and rows are not written. Going through the mapper (not
+    the table) lets commit hooks see the change and invalidate caches.
+    """
+    for params in updates.values():
+        for start in range(0, len(params), SIZE_ITEM_BATCH_SIZE):
+            db.session.execute(update(SizeItem), [dict(p, updated_at=now) for p in params[start:start + SIZE_ITEM_BATCH_SIZE]])
+
+
+def _apply_size_item_rows(context, rows, results, dry_run=False):
+    """
+    Validate size item rows, matched on (product line, size_slug), and write the differences.
+
+    Rows are staged in memory and compared with the current items in bulk.
+    New items are inserted, changed items get an UPDATE of the differing
+    columns only (and updated_at), unchanged items are not written at all.
+    Existing items keep their discount and hide_price. If a size appears twice
+    the last row wins.
+    """
+    category_slugs, product_lines = context
+    staged = {}
+    now = datetime.utcnow()
     
+    for row_num, row in rows:
+        try:
+            category_slug = row.get('category_slug', '').strip()
+            product_slug = row.get('product_slug', '').strip()
+            size_text = row.get('size_text', '').strip()
+            size_slug = row.get('size_slug', '').strip()
+            
+            if not size_slug and size_text:
+                size_slug = size_text.replace('/', '_').replace(' ', '_')
+            
+            if not category_slug or not product_slug or not size_text or not size_slug:
+                results['errors'].append(f"Строка {row_num}: пустые обязательные поля")
+                continue
+            
+            if category_slug not in category_slugs:
+                results['errors'].append(f"Строка {row_num}: категория {category_slug} не найдена")
+                continue
+            
+            product_line = product_lines.get((category_slug, product_slug))
+            if not product_line:
+                results['errors'].append(f"Строка {row_num}: линейка {product_slug} не найдена")
+                continue
+            
+            price_str = row.get('price', '0').strip().replace(',', '.')
+            try:
+                price = float(price_str) if price_str else 0.0
+            except:
+                price = 0.0
+            
+            pl_id, pl_name = product_line
+            staged[(pl_id, size_slug)] = (row_num, f"{category_slug}/{product_slug}/{size_slug}",
+                                          _size_item_values(row, pl_id, pl_name, size_text, size_slug, price, now))
+            results['success'] += 1
+        except Exception as e:
+            results['errors'].append(f"Строка {row_num}: {str(e)}")
+    
+    state = _load_size_item_state(staged)
+    new_rows = []
+    updates = {}
+    touched_line_ids = set()
+    for key, (row_num, label, values) in staged.items():
+        current = state.get(key)
+        if current is None:
+            _record_change(results, row_num, label)
+            new_rows.append(values)
+            touched_line_ids.add(key[0])
+            continue
+        changed = diff_values(current, {name: values[name] for name in SIZE_ITEM_DIFF_COLUMNS})
+        _record_change(results, row_num, label, changed)
+        if changed:
+            params = {name: values[name] for name in changed}
+            params['id'] = current['id']
+            updates.setdefault(tuple(sorted(changed)), []).append(params)
+            touched_line_ids.add(key[0])
+    
+    if dry_run:
+        return
+    # Upsert rather than insert: an item may have been added since the state was read
+    bulk_upsert(SizeItem, new_rows, ('product_line_id', 'size_slug'),
+                SIZE_ITEM_UPDATE_COLUMNS, SIZE_ITEM_BATCH_SIZE)
+    _update_changed_size_items(updates, now)
+    results['product_line_ids'].update(touched_line_ids)
+
+
+# kind -> (prepare() -> context, apply_rows(context, rows, results[, dry_run])); apply_rows writes but does not commit
+IMPORTERS = {
+    'categories': (lambda: None, _apply_rows_one_by_one(_import_category_row)),
+    'product_lines': (lambda: None, _apply_rows_one_by_one(_import_product_line_row)),
+    'size_items': (load_product_line_map, _apply_size_item_rows),
+    'news': (_prepare_news_import, _apply_rows_one_by_one(_import_news_row)),
+}
+
+
+def prepare_import(kind):
+    """Lookup data an importer loads once per run (slug maps, existing slugs)."""
+    return IMPORTERS[kind][0]()
+
+
+def apply_import_rows(kind, context, rows, results, dry_run=False):
+    """
+    Apply a chunk of (row_num, row) pairs. Per-row problems go to results['errors']. Caller commits.
+
+    With dry_run (DRY_RUN_KINDS only) nothing is written; results get the diff.
+    """
+    if dry_run:
+        if kind not in DRY_RUN_KINDS:
+            raise ValueError(f'Dry run is not supported for {kind}')
+        IMPORTERS[kind][1](context, rows, results, dry_run=True)
+    else:
+        IMPORTERS[kind][1](context, rows, results)
+
+
+REDIRECT_CODES = (301, 302, 307, 308)
+REDIRECT_FROM_COLUMNS = ('old_url', 'from_path', 'from')
+REDIRECT_TO_COLUMNS = ('new_url', 'to_path', 'to')
+REDIRECT_BATCH_SIZE = 500
+
+
+def open_csv_stream(file_stream):
+    """
+    Wrap an uploaded binary file for line-by-line CSV reading without loading it whole.
+
+    Encoding is picked from the first 64 KB: UTF-8 if it decodes, otherwise Windows-1251.
+    """
+    if not file_stream.seekable():
+        file_stream = io.BytesIO(file_stream.read())
+    sample = file_stream.read(65536)
+    file_stream.seek(0)
     try:
-        stream = io.StringIO(decode_csv_content(file_content))
-        reader = csv.DictReader(stream, delimiter=';')
-        
-        existing_slugs = [n.slug for n in News.query.all()]
-        
-        for row_num, row in enumerate(reader, 2):
+        # A multibyte character may be cut at the end of the sample
+        sample.decode('utf-8-sig') if len(sample) < 65536 else sample[:-3].decode('utf-8-sig')
+        encoding = 'utf-8-sig'
+    except UnicodeDecodeError:
+        encoding = 'cp1251'
+    return io.TextIOWrapper(file_stream, encoding=encoding, errors='replace', newline='')
+
+
+def _normalize_redirect_path(value, is_target=False):
+    value = value.strip()
+    if not value:
+        return ''
+    if value.startswith(('http://', 'https://')):
+        if is_target:
+            return value
+        # Old site URLs in inventories are absolute; rules match on path only
+        value = urlsplit(value).path or '/'
+    if not value.startswith('/'):
+        value = '/' + value
+    if not is_target and not value.endswith('/'):
+        value = value + '/'
+    return value
+
+
+def _redirect_source(targets, path):
+    """Key of the rule the redirect hook would apply to path (same trailing slash fallback), or None."""
+    if path in targets:
+        return path
+    if not path.endswith('/') and path + '/' in targets:
+        return path + '/'
+    return None
+
+
+def _resolve_redirect_chain(targets, from_path):
+    """Return (final target, hops) for from_path, or (None, hops) if the chain loops."""
+    seen = {from_path}
+    current = targets[from_path]
+    hops = 0
+    while True:
+        source = _redirect_source(targets, current)
+        if source is None:
+            return current, hops
+        if source in seen:
+            return None, hops
+        seen.add(source)
+        current = targets[source]
+        hops += 1
+
+
+def import_redirects_csv(file_stream, collapse_chains=True):
+    """
+    Bulk import of exact redirect rules from CSV/TSV (url_inventory.csv format: old_url,new_url).
+
+    Optional columns: code, comment. The delimiter (comma, semicolon or tab) is detected
+    from the header. Rows are read as a stream and written in batches in one transaction.
+
+    - duplicate old URLs in the file: the first row wins
+    - an existing rule for the same path is updated, identical ones are left alone
+    - rules that would create a redirect loop (with each other or with existing rules) are skipped
+    - chains A -> B -> C are collapsed to A -> C when collapse_chains is set,
+      including existing rules that now point into an imported one
+
+    Wildcard rules are not followed when detecting chains.
+    """
+    results = {'created': 0, 'updated': 0, 'unchanged': 0, 'duplicates': 0,
+               'collapsed': 0, 'loops': 0, 'errors': []}
+
+    try:
+        stream = open_csv_stream(file_stream)
+        header_line = stream.readline()
+        try:
+            dialect = csv.Sniffer().sniff(header_line, delimiters=',;\t')
+        except csv.Error:
+            dialect = csv.excel
+        header = [name.strip().lower() for name in next(csv.reader([header_line], dialect), [])]
+
+        from_col = next((header.index(name) for name in REDIRECT_FROM_COLUMNS if name in header), None)
+        to_col = next((header.index(name) for name in REDIRECT_TO_COLUMNS if name in header), None)
+        if from_col is None or to_col is None:
+            # No recognised header: positional columns, the first line is data
+            from_col, to_col = 0, 1
+            code_col, comment_col = 2, 3
+            stream.seek(0)
+            first_row = 1
+        else:
+            code_col = header.index('code') if 'code' in header else None
+            comment_col = header.index('comment') if 'comment' in header else None
+            first_row = 2
+
+        def cell(row, index):
+            return row[index].strip() if index is not None and index < len(row) else ''
+
+        imported = {}
+        for row_num, row in enumerate(csv.reader(stream, dialect), first_row):
+            if not any(value.strip() for value in row):
+                continue
+            from_path = _normalize_redirect_path(cell(row, from_col))
+            to_path = _normalize_redirect_path(cell(row, to_col), is_target=True)
+            if not from_path or not to_path:
+                results['errors'].append(f"Строка {row_num}: пустой адрес")
+                continue
+            code = cell(row, code_col)
             try:
-                content = row.get('content', '').strip()
-                date_str = row.get('date', '').strip()
-                title = row.get('title', '').strip()
-                slug = row.get('slug', '').strip()
-                
-                if not content:
-                    results['errors'].append(f"Строка {row_num}: пустой контент")
+                code = int(code) if code else 301
+            except ValueError:
+                code = None
+            if code not in REDIRECT_CODES:
+                results['errors'].append(f"Строка {row_num}: недопустимый код {cell(row, code_col)}")
+                continue
+            if from_path in imported:
+                results['duplicates'] += 1
+                if imported[from_path][0] != to_path:
+                    results['errors'].append(f"Строка {row_num}: {from_path} уже встречался с другим адресом, оставлен первый")
+                continue
+            imported[from_path] = (to_path, code, cell(row, comment_col), row_num)
+
+        existing = {}
+        for rule_id, from_path, to_path, code, is_active in db.session.query(
+            RedirectRule.id, RedirectRule.from_path, RedirectRule.to_path, RedirectRule.code, RedirectRule.is_active
+        ).filter(RedirectRule.is_pattern == False).order_by(RedirectRule.id):
+            existing.setdefault(from_path, (rule_id, to_path, code, is_active))
+
+        targets = {from_path: to_path for from_path, (_, to_path, _, is_active) in existing.items() if is_active}
+        targets.update({from_path: entry[0] for from_path, entry in imported.items()})
+
+        for from_path, (to_path, code, comment, row_num) in list(imported.items()):
+            final, hops = _resolve_redirect_chain(targets, from_path)
+            if final is None:
+                results['loops'] += 1
+                results['errors'].append(f"Строка {row_num}: {from_path} -> {to_path} образует цикл редиректов, пропущено")
+                del imported[from_path]
+                targets.pop(from_path, None)
+                continue
+            if collapse_chains and hops:
+                imported[from_path] = (final, code, comment, row_num)
+                results['collapsed'] += 1
+
+        if collapse_chains:
+            # Existing rules that now end in an imported rule's source
+            for from_path, (rule_id, to_path, code, is_active) in existing.items():
+                if from_path in imported or not is_active or _redirect_source(imported, to_path) is None:
                     continue
-                
-                if not title:
-                    title = content[:50] + '...' if len(content) > 50 else content
-                
-                if not slug:
-                    slug = generate_slug(title)
-                    slug = make_unique_slug(slug, existing_slugs)
-                
-                try:
-                    if date_str:
-                        date = datetime.strptime(date_str, '%d.%m.%Y').date()
-                    else:
-                        date = datetime.utcnow().date()
-                except:
-                    date = datetime.utcnow().date()
-                
-                existing = News.query.filter_by(slug=slug).first()
-                if existing:
-                    existing.title = title
-                    existing.date = date
-                    existing.content_html = content
-                    existing.seo_title = row.get('seo_title', '')
-                    existing.seo_description = row.get('seo_description', '')
-                    existing.h1 = row.get('h1', '')
-                    existing.is_published = row.get('is_published', '1').lower() in ['1', 'true', 'yes']
-                else:
-                    news = News(
-                        title=title,
-                        slug=slug,
-                        date=date,
-                        content_html=content,
-                        seo_title=row.get('seo_title', ''),
-                        seo_description=row.get('seo_description', ''),
-                        h1=row.get('h1', ''),
-                        is_published=row.get('is_published', '1').lower() in ['1', 'true', 'yes']
-                    )
-                    db.session.add(news)
-                    existing_slugs.append(slug)
-                
-                results['success'] += 1
-            except Exception as e:
-                results['errors'].append(f"Строка {row_num}: {str(e)}")
-        
+                final, hops = _resolve_redirect_chain(targets, from_path)
+                if final is not None and hops:
+                    imported[from_path] = (final, code, '', None)
+                    results['collapsed'] += 1
+
+        pending_updates = {}
+        batch = 0
+        for from_path, (to_path, code, comment, row_num) in imported.items():
+            current = existing.get(from_path)
+            if current is None:
+                db.session.add(RedirectRule(from_path=from_path, to_path=to_path, code=code,
+                                            is_active=True, is_pattern=False, comment=comment))
+                results['created'] += 1
+                batch += 1
+            elif current[1:] == (to_path, code, True):
+                results['unchanged'] += 1
+            else:
+                pending_updates[current[0]] = (to_path, code, comment)
+            if batch >= REDIRECT_BATCH_SIZE:
+                db.session.flush()
+                batch = 0
+
+        update_ids = list(pending_updates)
+        for start in range(0, len(update_ids), REDIRECT_BATCH_SIZE):
+            for rule in RedirectRule.query.filter(RedirectRule.id.in_(update_ids[start:start + REDIRECT_BATCH_SIZE])):
+                to_path, code, comment = pending_updates[rule.id]
+                rule.to_path = to_path
+                rule.code = code
+                rule.is_active = True
+                if comment:
+                    rule.comment = comment
+                results['updated'] += 1
+            db.session.flush()
+
         db.session.commit()
     except Exception as e:
+        db.session.rollback()
         results['errors'].append(f"Ошибка парсинга CSV: {str(e)}")
-    
+
     return results
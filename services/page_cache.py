@@ -0,0 +1,282 @@
+import os
+import time
+import sqlite3
+import logging
+import threading
+from datetime import datetime, timezone
+from functools import wraps
+from collections import OrderedDict
+from flask import request, session, g, make_response
+from flask_wtf.csrf import generate_csrf
+from config import Config
+from services.commit_hooks import invalidate_on_commit
+from models import (Page, MenuItem, Category, ProductLine, SizeItem, News, Service, SiteSection, Setting,
+                    AccessoryBlock, DocumentFile, DocumentType, GALLERY_IMAGE_MODELS)
+
+logger = logging.getLogger(__name__)
+
+# Models rendered on cached pages; a commit touching any of them drops the whole cache.
+# Menu, hero and news blocks appear on every page, so per-page invalidation would not buy much.
+PAGE_CACHE_MODELS = (Category, ProductLine, SizeItem, AccessoryBlock, MenuItem, SiteSection,
+                     Page, News, Service, Setting, DocumentFile, DocumentType) + tuple(GALLERY_IMAGE_MODELS.values())
+
+# Stored in place of the per-session CSRF token, filled in on every hit
+CSRF_PLACEHOLDER = '__page_cache_csrf_token__'
+
+# Hit/miss counters of the shared backend are written in batches
+STATS_FLUSH_EVENTS = 50
+STATS_FLUSH_SECONDS = 10
+
+
+class MemoryBackend:
+    """In-process LRU. Each worker has its own copy, the TTL bounds staleness between them."""
+
+    name = 'memory'
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0}
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[4] < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[:4]
+
+    def set(self, key, status, mimetype, body, last_modified):
+        with self._lock:
+            self._entries[key] = (status, mimetype, body, last_modified, time.time() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def count(self, counter):
+        with self._lock:
+            self._stats[counter] += 1
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, entries=len(self._entries))
+
+
+class SQLiteBackend:
+    """Cache file shared by all workers on the host; clear() is seen by every process."""
+
+    name = 'sqlite'
+
+    def __init__(self, path, max_entries, ttl):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._local = threading.local()
+        self._pending = {'hits': 0, 'misses': 0}
+        self._pending_since = time.monotonic()
+        self._pending_lock = threading.Lock()
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            return conn
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        columns = [row[1] for row in conn.execute('PRAGMA table_info(page_cache)')]
+        if columns and 'last_modified' not in columns:
+            conn.execute('DROP TABLE page_cache')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS page_cache (
+                key TEXT PRIMARY KEY,
+                status INTEGER NOT NULL,
+                mimetype TEXT NOT NULL,
+                body BLOB NOT NULL,
+                last_modified REAL,
+                expires REAL NOT NULL,
+                used_at REAL NOT NULL
+            )
+        ''')
+        conn.execute('CREATE TABLE IF NOT EXISTS page_cache_stats (counter TEXT PRIMARY KEY, value INTEGER NOT NULL)')
+        self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        conn = self._connect()
+        row = conn.execute('SELECT status, mimetype, body, last_modified, expires FROM page_cache WHERE key = ?',
+                           (key,)).fetchone()
+        if row is None:
+            return None
+        now = time.time()
+        if row[4] < now:
+            conn.execute('DELETE FROM page_cache WHERE key = ?', (key,))
+            return None
+        conn.execute('UPDATE page_cache SET used_at = ? WHERE key = ?', (now, key))
+        return row[0], row[1], bytes(row[2]), row[3]
+
+    def set(self, key, status, mimetype, body, last_modified):
+        conn = self._connect()
+        now = time.time()
+        conn.execute(
+            'INSERT OR REPLACE INTO page_cache (key, status, mimetype, body, last_modified, expires, used_at) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (key, status, mimetype, body, last_modified, now + self.ttl, now)
+        )
+        conn.execute('''
+            DELETE FROM page_cache WHERE key IN (
+                SELECT key FROM page_cache ORDER BY used_at DESC LIMIT -1 OFFSET ?
+            )
+        ''', (self.max_entries,))
+
+    def clear(self):
+        self._connect().execute('DELETE FROM page_cache')
+
+    def count(self, counter):
+        with self._pending_lock:
+            self._pending[counter] += 1
+            due = (sum(self._pending.values()) >= STATS_FLUSH_EVENTS
+                   or time.monotonic() - self._pending_since >= STATS_FLUSH_SECONDS)
+        if due:
+            self._flush_stats()
+
+    def _flush_stats(self):
+        with self._pending_lock:
+            pending = self._pending
+            self._pending = {'hits': 0, 'misses': 0}
+            self._pending_since = time.monotonic()
+        conn = self._connect()
+        for counter, value in pending.items():
+            if value:
+                conn.execute('''
+                    INSERT INTO page_cache_stats (counter, value) VALUES (?, ?)
+                    ON CONFLICT(counter) DO UPDATE SET value = value + excluded.value
+                ''', (counter, value))
+
+    def stats(self):
+        self._flush_stats()
+        conn = self._connect()
+        stats = {'hits': 0, 'misses': 0}
+        stats.update(conn.execute('SELECT counter, value FROM page_cache_stats').fetchall())
+        stats['entries'] = conn.execute('SELECT COUNT(*) FROM page_cache').fetchone()[0]
+        return stats
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    """Configured cache backend, or None when PAGE_CACHE_BACKEND is 'none'."""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                name = Config.PAGE_CACHE_BACKEND
+                if name == 'sqlite':
+                    _backend = SQLiteBackend(Config.PAGE_CACHE_PATH, Config.PAGE_CACHE_MAX_ENTRIES, Config.PAGE_CACHE_TTL)
+                elif name == 'memory':
+                    _backend = MemoryBackend(Config.PAGE_CACHE_MAX_ENTRIES, Config.PAGE_CACHE_TTL)
+                else:
+                    _backend = False
+    return _backend or None
+
+
+def clear_page_cache():
+    backend = get_backend()
+    if backend:
+        try:
+            backend.clear()
+        except sqlite3.Error as e:
+            logger.error(f"Page cache clear failed: {e}")
+
+
+def get_page_cache_stats():
+    """Return dict with backend name, hits, misses, hit_rate (percent) and entries; None when disabled."""
+    backend = get_backend()
+    if not backend:
+        return None
+    try:
+        stats = backend.stats()
+    except sqlite3.Error as e:
+        logger.error(f"Page cache stats failed: {e}")
+        return None
+    total = stats['hits'] + stats['misses']
+    stats['backend'] = backend.name
+    stats['hit_rate'] = round(stats['hits'] * 100 / total) if total else 0
+    return stats
+
+
+def _cache_key(query_args):
+    params = '&'.join(f'{name}={value}' for name in query_args
+                      for value in request.args.getlist(name) if value)
+    return f'{request.path}?{params}' if params else request.path
+
+
+def cached_page(*query_args):
+    """
+    Serve a public view from the page cache.
+
+    Pages are keyed by path plus the listed query args (anything else, like utm tags,
+    is ignored). Only GET/HEAD without pending flash messages are cached, and only
+    200 HTML responses are stored, together with the Last-Modified time noted by the
+    view (services.http_cache.note_modified). The CSRF token in forms is replaced by a
+    placeholder in the stored copy and filled in per request.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            backend = get_backend()
+            if not backend or request.method not in ('GET', 'HEAD') or '_flashes' in session:
+                return view(*args, **kwargs)
+
+            key = _cache_key(query_args)
+            try:
+                entry = backend.get(key)
+            except sqlite3.Error as e:
+                logger.error(f"Page cache read failed: {e}")
+                return view(*args, **kwargs)
+
+            if entry is not None:
+                backend.count('hits')
+                status, mimetype, body, last_modified = entry
+                if last_modified is not None:
+                    g.last_modified = datetime.fromtimestamp(last_modified, timezone.utc)
+                if CSRF_PLACEHOLDER.encode() in body:
+                    body = body.replace(CSRF_PLACEHOLDER.encode(), generate_csrf().encode())
+                response = make_response(body, status)
+                response.mimetype = mimetype
+                response.headers['X-Page-Cache'] = 'HIT'
+                return response
+
+            backend.count('misses')
+            response = make_response(view(*args, **kwargs))
+            if response.status_code == 200 and response.mimetype == 'text/html' and not response.direct_passthrough:
+                body = response.get_data()
+                token = g.get('csrf_token')
+                if token:
+                    body = body.replace(token.encode(), CSRF_PLACEHOLDER.encode())
+                try:
+                    last_modified = g.get('last_modified')
+                    backend.set(key, response.status_code, response.mimetype, body,
+                                last_modified.timestamp() if last_modified else None)
+                except sqlite3.Error as e:
+                    logger.error(f"Page cache write failed: {e}")
+            response.headers['X-Page-Cache'] = 'MISS'
+            return response
+        return wrapper
+    return decorator
+
+
+invalidate_on_commit(PAGE_CACHE_MODELS, clear_page_cache)
@@ -0,0 +1,265 @@
+import os
+import time
+import sqlite3
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from config import Config
+from models import GALLERY_IMAGE_MODELS
+from services.watermark_cache import render_variant, get_watermark_settings, get_output_format, WIDTH_BUCKETS, AVIF_SUPPORTED
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 20
+MAX_ATTEMPTS = 3
+# Jobs left in 'running' state longer than this are considered lost (worker crashed)
+STALE_RUNNING_SECONDS = 600
+IDLE_WAIT_SECONDS = 60
+
+_worker_thread = None
+_worker_lock = threading.Lock()
+_wake_event = threading.Event()
+
+
+def _connect():
+    path = Config.PRERENDER_QUEUE_PATH
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30)
+    conn.execute('PRAGMA journal_mode=WAL')
+    columns = [row[1] for row in conn.execute('PRAGMA table_info(prerender_jobs)')]
+    if columns and 'engine' not in columns:
+        # Jobs are only render hints, an old-format queue can be dropped
+        conn.execute('DROP TABLE prerender_jobs')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS prerender_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            image_path TEXT NOT NULL,
+            watermark_path TEXT NOT NULL,
+            opacity REAL NOT NULL,
+            rotation INTEGER NOT NULL DEFAULT 0,
+            output_format TEXT NOT NULL,
+            width INTEGER NOT NULL DEFAULT 0,
+            engine TEXT NOT NULL DEFAULT 'pillow',
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            updated_at REAL NOT NULL,
+            UNIQUE (image_path, watermark_path, opacity, rotation, output_format, width)
+        )
+    ''')
+    return conn
+
+
+def _mp_context():
+    # Pools only run from the CLI. Spawn, not fork: a forked child inherits locks
+    # held by other threads of the parent (logging, DB pool) in a locked state.
+    return multiprocessing.get_context('spawn')
+
+
+def _render_job(image_path, watermark_path, opacity, rotation, output_format, width, engine):
+    """Process pool entry point: render one variant into the watermark cache."""
+    cached_path, _ = render_variant(image_path, watermark_path or None, opacity, rotation, output_format, width or None, engine)
+    return cached_path is not None
+
+
+def build_jobs(images):
+    """
+    Build render job tuples for gallery images using current watermark settings.
+
+    Every image gets its srcset width buckets in the source format, WebP and,
+    when Pillow can encode it, AVIF (the formats get_preferred_format serves);
+    watermarked images also get the full-size render.
+    """
+    watermark_path, opacity, engine = get_watermark_settings()
+
+    jobs = []
+    for img in images:
+        if not img or not img.image_path:
+            continue
+        image_watermark = '' if img.no_watermark or not watermark_path else watermark_path
+        widths = list(WIDTH_BUCKETS)
+        if image_watermark:
+            widths.append(0)
+        output_formats = {get_output_format(img.image_path), 'WEBP'}
+        if AVIF_SUPPORTED:
+            output_formats.add('AVIF')
+        for output_format in sorted(output_formats):
+            for width in widths:
+                jobs.append((img.image_path, image_watermark, opacity, int(img.rotation or 0), output_format, width, engine))
+    return jobs
+
+
+def enqueue_prerender(images):
+    """
+    Queue watermarked renders and srcset derivatives for newly added gallery images.
+
+    Must be called after the images are committed. Rendering happens in the
+    background thread of this process (or in `flask images process-queue`),
+    never in the request thread.
+    """
+    jobs = build_jobs(images)
+    if not jobs:
+        return 0
+
+    now = time.time()
+    try:
+        conn = _connect()
+        with conn:
+            conn.executemany('''
+                INSERT INTO prerender_jobs (image_path, watermark_path, opacity, rotation, output_format, width, engine, status, attempts, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, 'pending', 0, ?)
+                ON CONFLICT (image_path, watermark_path, opacity, rotation, output_format, width)
+                DO UPDATE SET engine = excluded.engine, status = 'pending', attempts = 0, updated_at = excluded.updated_at
+            ''', [job + (now,) for job in jobs])
+        conn.close()
+    except sqlite3.Error as e:
+        logger.error(f"Prerender enqueue failed: {e}")
+        return 0
+
+    ensure_worker()
+    _wake_event.set()
+    return len(jobs)
+
+
+def _claim_jobs(conn, limit):
+    now = time.time()
+    with conn:
+        conn.execute(
+            "UPDATE prerender_jobs SET status = 'pending' WHERE status = 'running' AND updated_at < ?",
+            (now - STALE_RUNNING_SECONDS,)
+        )
+        rows = conn.execute('''
+            SELECT id, image_path, watermark_path, opacity, rotation, output_format, width, engine
+            FROM prerender_jobs WHERE status = 'pending' ORDER BY id LIMIT ?
+        ''', (limit,)).fetchall()
+        if rows:
+            conn.executemany(
+                "UPDATE prerender_jobs SET status = 'running', attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                [(now, row[0]) for row in rows]
+            )
+    return rows
+
+
+def _finish_job(conn, job_id, success):
+    with conn:
+        if success:
+            conn.execute('DELETE FROM prerender_jobs WHERE id = ?', (job_id,))
+        else:
+            conn.execute('''
+                UPDATE prerender_jobs
+                SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, updated_at = ?
+                WHERE id = ?
+            ''', (MAX_ATTEMPTS, time.time(), job_id))
+
+
+def _render_rows(rows, executor):
+    """Yield (job_id, success) for claimed rows, rendered in the pool or, without one, in this thread."""
+    if executor is None:
+        for row in rows:
+            try:
+                success = _render_job(*row[1:])
+            except Exception as e:
+                logger.error(f"Prerender job {row[0]} failed: {e}")
+                success = False
+            yield row[0], success
+        return
+
+    futures = {executor.submit(_render_job, *row[1:]): row[0] for row in rows}
+    for future in as_completed(futures):
+        try:
+            success = future.result()
+        except Exception as e:
+            logger.error(f"Prerender job {futures[future]} failed: {e}")
+            success = False
+        yield futures[future], success
+
+
+def process_queue(max_workers=None, pooled=True):
+    """
+    Drain pending jobs.
+
+    pooled renders through a process pool started on the first claimed batch
+    and reused for the rest of the run (CLI). The in-process worker thread
+    renders one job at a time instead: a web worker is multithreaded and
+    must not start child processes.
+
+    Returns:
+        Tuple of (rendered, failed) counts
+    """
+    rendered = 0
+    failed = 0
+    conn = _connect()
+    executor = None
+    try:
+        while True:
+            rows = _claim_jobs(conn, BATCH_SIZE)
+            if not rows:
+                break
+            if pooled and executor is None:
+                executor = ProcessPoolExecutor(max_workers=max_workers or Config.PRERENDER_WORKERS, mp_context=_mp_context())
+            for job_id, success in _render_rows(rows, executor):
+                _finish_job(conn, job_id, success)
+                if success:
+                    rendered += 1
+                else:
+                    failed += 1
+    finally:
+        if executor is not None:
+            executor.shutdown()
+        conn.close()
+    return rendered, failed
+
+
+def _worker_loop():
+    while True:
+        _wake_event.clear()
+        try:
+            rendered, failed = process_queue(pooled=False)
+            if rendered or failed:
+                logger.info(f"Prerender: {rendered} rendered, {failed} failed")
+        except Exception as e:
+            logger.error(f"Prerender worker error: {e}")
+        _wake_event.wait(IDLE_WAIT_SECONDS)
+
+
+def ensure_worker():
+    """Start the background consumer thread for this process if it is not running."""
+    global _worker_thread
+    with _worker_lock:
+        if _worker_thread is None or not _worker_thread.is_alive():
+            _worker_thread = threading.Thread(target=_worker_loop, name='prerender-worker', daemon=True)
+            _worker_thread.start()
+
+
+def prerender_all(max_workers=None):
+    """
+    Render watermarked variants and srcset derivatives of every gallery image in parallel.
+
+    Returns:
+        Tuple of (rendered, failed) counts
+    """
+    images = []
+    for model in GALLERY_IMAGE_MODELS.values():
+        images.extend(model.query.all())
+    jobs = build_jobs(images)
+
+    rendered = 0
+    failed = 0
+    if not jobs:
+        return rendered, failed
+
+    with ProcessPoolExecutor(max_workers=max_workers or os.cpu_count(), mp_context=_mp_context()) as executor:
+        futures = [executor.submit(_render_job, *job) for job in jobs]
+        for future in as_completed(futures):
+            try:
+                success = future.result()
+            except Exception as e:
+                logger.error(f"Prerender failed: {e}")
+                success = False
+            if success:
+                rendered += 1
+            else:
+                failed += 1
+    return rendered, failed
@@ -0,0 +1,138 @@
+import re
+import json
+import logging
+from sqlalchemy import select
+from extensions import db
+from models import (Page, MenuItem, Category, ProductLine, SizeItem, SizePrice, News, DocumentFile, Service,
+                    ServiceImage, HomeGalleryImage, RedirectRule, ProductLineImage, AccessoryBlock,
+                    AccessoryImage, AccessoryCompatibility)
+
+logger = logging.getLogger(__name__)
+
+# Sample parameter values; plans do not depend on whether the rows exist
+SAMPLE_ID = 1
+SAMPLE_IDS = [1, 2, 3]
+
+
+def get_hot_queries():
+    """
+    Per-request lookups of the public site as (name, statement).
+
+    Mirrors the filters and ordering used in blueprints.public and
+    blueprints.redirects. Whole-table loads behind the in-process caches
+    (route index, site snapshot, redirect matcher) read every row by design
+    and are not listed.
+    """
+    return [
+        ('index: latest news',
+         select(News).where(News.is_published == True).order_by(News.date.desc()).limit(6)),
+        ('index/catalog: active categories',
+         select(Category).where(Category.is_active == True).order_by(Category.sort_order)),
+        ('index/services: active services',
+         select(Service).where(Service.is_active == True).order_by(Service.sort_order)),
+        ('services: gallery (selectinload)',
+         select(ServiceImage).where(ServiceImage.service_id.in_(SAMPLE_IDS))
+         .order_by(ServiceImage.sort_order, ServiceImage.id)),
+        ('index: home gallery',
+         select(HomeGalleryImage).order_by(HomeGalleryImage.sort_order)),
+        ('service_detail: by slug',
+         select(Service).where(Service.slug == 'sample', Service.is_active == True).limit(1)),
+        ('news_list: published news',
+         select(News).where(News.is_published == True).order_by(News.date.desc())),
+        ('news_detail: by slug',
+         select(News).where(News.slug == 'sample', News.is_published == True).limit(1)),
+        ('documentation: page by url',
+         select(Page).where(Page.url_path == '/documentation/').limit(1)),
+        ('documentation: files of type',
+         select(DocumentFile).where(DocumentFile.document_type_id == SAMPLE_ID).order_by(DocumentFile.sort_order)),
+        ('category: active product lines',
+         select(ProductLine).where(ProductLine.category_id == SAMPLE_ID, ProductLine.is_active == True)
+         .order_by(ProductLine.sort_order)),
+        ('category/product_line: gallery (selectinload)',
+         select(ProductLineImage).where(ProductLineImage.product_line_id.in_(SAMPLE_IDS))
+         .order_by(ProductLineImage.sort_order, ProductLineImage.id)),
+        ('product_line: size table with prices',
+         select(SizeItem, SizePrice).outerjoin(SizeItem.price_row)
+         .where(SizeItem.product_line_id == SAMPLE_ID).order_by(SizeItem.sort_key, SizeItem.id)),
+        ('product_line/size_item: active accessory blocks',
+         select(AccessoryBlock).where(AccessoryBlock.product_line_id == SAMPLE_ID, AccessoryBlock.is_active == True)
+         .order_by(AccessoryBlock.sort_order)),
+        ('product_line: accessory gallery (selectinload)',
+         select(AccessoryImage).where(AccessoryImage.accessory_block_id.in_(SAMPLE_IDS))
+         .order_by(AccessoryImage.sort_order, AccessoryImage.id)),
+        ('size_item: compatible accessory rows',
+         select(AccessoryCompatibility.accessory_block_id, AccessoryCompatibility.row_index)
+         .where(AccessoryCompatibility.size_item_id == SAMPLE_ID).order_by(AccessoryCompatibility.row_index)),
+        ('redirects: rule by source path',
+         select(RedirectRule).where(RedirectRule.from_path == '/sample/', RedirectRule.is_active == True,
+                                    RedirectRule.is_pattern == False).limit(1)),
+        ('menu: item by url',
+         select(MenuItem).where(MenuItem.url == '/sample/', MenuItem.is_active == True).limit(1)),
+    ]
+
+
+# SQLite: "SCAN news" is a table scan, "SCAN news USING INDEX ..." walks an index in order
+SQLITE_FULL_SCAN = re.compile(r'^SCAN (?:TABLE )?(\w+)(?: AS \w+)?$')
+
+
+def _explain_sqlite(conn, sql):
+    plan = [row[3] for row in conn.exec_driver_sql(f'EXPLAIN QUERY PLAN {sql}')]
+    full_scans = [m.group(1) for m in map(SQLITE_FULL_SCAN.match, plan) if m]
+    return plan, full_scans
+
+
+def _plan_nodes(node):
+    yield node
+    for child in node.get('Plans', []):
+        yield from _plan_nodes(child)
+
+
+def _explain_postgresql(conn, sql):
+    # Small tables make Seq Scan the cheapest plan even with a usable index;
+    # with seqscan disabled the planner still picks it only when no index applies
+    conn.exec_driver_sql('SET LOCAL enable_seqscan = off')
+    raw = conn.exec_driver_sql(f'EXPLAIN (FORMAT JSON) {sql}').scalar()
+    root = (raw if isinstance(raw, list) else json.loads(raw))[0]['Plan']
+    plan, full_scans = [], []
+    for node in _plan_nodes(root):
+        relation = node.get('Relation Name')
+        plan.append(f"{node['Node Type']}{' on ' + relation if relation else ''}"
+                    f"{' using ' + node['Index Name'] if node.get('Index Name') else ''}")
+        if node['Node Type'] == 'Seq Scan':
+            full_scans.append(relation)
+    return plan, full_scans
+
+
+EXPLAINERS = {
+    'sqlite': _explain_sqlite,
+    'postgresql': _explain_postgresql,
+}
+
+
+def explain_hot_queries():
+    """
+    EXPLAIN every hot query on the configured database.
+
+    Returns:
+        List of dicts with 'name', 'plan' (list of plan lines) and 'full_scans' (table names)
+
+    Raises:
+        ValueError: database dialect is not SQLite or PostgreSQL
+    """
+    dialect = db.engine.dialect
+    explainer = EXPLAINERS.get(dialect.name)
+    if explainer is None:
+        raise ValueError(f'EXPLAIN is not supported for {dialect.name}')
+
+    results = []
+    with db.engine.connect() as conn:
+        for name, statement in get_hot_queries():
+            sql = str(statement.compile(dialect=dialect, compile_kwargs={'literal_binds': True}))
+            transaction = conn.begin()
+            try:
+                plan, full_scans = explainer(conn, sql)
+            finally:
+                # Nothing to keep; also resets SET LOCAL
+                transaction.rollback()
+            results.append({'name': name, 'plan': plan, 'full_scans': full_scans})
+    return results
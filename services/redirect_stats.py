@@ -0,0 +1,95 @@
+import time
+import atexit
+import logging
+import threading
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import bindparam
+from extensions import db
+from models import RedirectRule
+
+logger = logging.getLogger(__name__)
+
+# Hits are counted in memory and written in one batch per interval,
+# so serving a redirect never waits on a DB write.
+FLUSH_INTERVAL_SECONDS = 30
+
+_hits = {}
+_hits_lock = threading.Lock()
+_flusher_thread = None
+_flusher_lock = threading.Lock()
+_app = None
+
+
+def record_hit(rule_id):
+    """Count one use of a redirect rule; written by the background flusher."""
+    now = datetime.utcnow()
+    with _hits_lock:
+        count, _ = _hits.get(rule_id, (0, None))
+        _hits[rule_id] = (count + 1, now)
+    if _flusher_thread is None or not _flusher_thread.is_alive():
+        # Also restarts the thread in worker processes forked after it was started
+        start_hit_flusher(current_app._get_current_object())
+
+
+def flush_hits():
+    """
+    Add buffered hits to redirect_rules in one executemany.
+
+    Goes through a separate connection so it neither joins the caller's session
+    transaction nor triggers commit hooks (the redirect matcher stays cached).
+    updated_at is kept as is: hit counters are not an edit of the rule.
+
+    Returns:
+        Number of rules updated
+    """
+    global _hits
+    with _hits_lock:
+        hits, _hits = _hits, {}
+    if not hits:
+        return 0
+
+    table = RedirectRule.__table__
+    statement = table.update().where(table.c.id == bindparam('rule_id')).values(
+        hit_count=table.c.hit_count + bindparam('hits'),
+        last_hit_at=bindparam('last_hit'),
+        updated_at=table.c.updated_at,
+    )
+    rows = [{'rule_id': rule_id, 'hits': count, 'last_hit': last_hit} for rule_id, (count, last_hit) in hits.items()]
+    try:
+        with db.engine.begin() as conn:
+            conn.execute(statement, rows)
+    except Exception as e:
+        logger.error(f"Redirect hit counters not saved: {e}")
+        with _hits_lock:
+            for rule_id, (count, last_hit) in hits.items():
+                pending, pending_last = _hits.get(rule_id, (0, None))
+                _hits[rule_id] = (pending + count, max(filter(None, (pending_last, last_hit))))
+        return 0
+    return len(rows)
+
+
+def _flush_loop():
+    while True:
+        time.sleep(FLUSH_INTERVAL_SECONDS)
+        with _app.app_context():
+            flush_hits()
+
+
+def _flush_at_exit():
+    if _app is not None:
+        with _app.app_context():
+            flush_hits()
+
+
+def start_hit_flusher(app):
+    """Start the background flusher for this process (idempotent)."""
+    global _flusher_thread, _app
+    with _flusher_lock:
+        if _flusher_thread is not None and _flusher_thread.is_alive():
+            return
+        if _app is None:
+            atexit.register(_flush_at_exit)
+        _app = app
+        _flusher_thread = threading.Thread(target=_flush_loop, name='redirect-hits', daemon=True)
+        _flusher_thread.start()
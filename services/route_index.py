@@ -0,0 +1,86 @@
+import time
+import logging
+import threading
+from extensions import db
+from config import RESERVED_SLUGS
+from models import Page, Category, ProductLine, SizeItem
+from services.commit_hooks import invalidate_on_commit
+
+logger = logging.getLogger(__name__)
+
+# Rebuilt locally after commits touching these models; the TTL bounds how long
+# other worker processes keep answering from an index built before the commit.
+ROUTE_INDEX_TTL = 60
+ROUTE_INDEX_MODELS = (Page, Category, ProductLine, SizeItem)
+
+_index = None
+_expires = 0.0
+_lock = threading.Lock()
+
+
+def build_route_index():
+    """
+    Map every URL served by public.static_page to (kind, id).
+
+    kind is 'page', 'category', 'product_line' or 'size_item'. Published pages
+    win over catalog entries with the same path, as in the original lookup order.
+    """
+    routes = {}
+
+    categories = {}
+    for category_id, slug in db.session.query(Category.id, Category.slug).filter(Category.is_active == True):
+        if slug in RESERVED_SLUGS:
+            continue
+        categories[category_id] = slug
+        routes[f'/{slug}/'] = ('category', category_id)
+
+    product_lines = {}
+    for pl_id, category_id, slug in db.session.query(
+        ProductLine.id, ProductLine.category_id, ProductLine.slug
+    ).filter(ProductLine.is_active == True):
+        category_slug = categories.get(category_id)
+        if category_slug is None:
+            continue
+        path = f'/{category_slug}/{slug}/'
+        product_lines[pl_id] = path
+        routes[path] = ('product_line', pl_id)
+
+    for size_item_id, pl_id, size_slug in db.session.query(SizeItem.id, SizeItem.product_line_id, SizeItem.size_slug):
+        pl_path = product_lines.get(pl_id)
+        if pl_path is not None:
+            routes[f'{pl_path}{size_slug}/'] = ('size_item', size_item_id)
+
+    # Descending id so the oldest page wins on duplicate url_path, like Query.first()
+    for page_id, url_path in db.session.query(Page.id, Page.url_path).filter(
+        Page.is_published == True
+    ).order_by(Page.id.desc()):
+        routes[url_path] = ('page', page_id)
+
+    return routes
+
+
+def rebuild_route_index():
+    global _index, _expires
+    routes = build_route_index()
+    with _lock:
+        _index = routes
+        _expires = time.monotonic() + ROUTE_INDEX_TTL
+    logger.info(f"Route index built: {len(routes)} paths")
+    return routes
+
+
+def invalidate_route_index():
+    global _index
+    with _lock:
+        _index = None
+
+
+def resolve_path(url_path):
+    """Return (kind, id) for a normalized path like '/category/line/', or None if nothing is served there."""
+    index = _index
+    if index is None or _expires < time.monotonic():
+        index = rebuild_route_index()
+    return index.get(url_path)
+
+
+invalidate_on_commit(ROUTE_INDEX_MODELS, invalidate_route_index)
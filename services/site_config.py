@@ -0,0 +1,91 @@
+import time
+import logging
+import threading
+from types import SimpleNamespace
+from dataclasses import dataclass
+from sqlalchemy import inspect
+from models import MenuItem, Setting, SiteSection
+from services.commit_hooks import invalidate_on_commit
+
+logger = logging.getLogger(__name__)
+
+# Dropped locally on commits touching menu, settings or sections; the TTL bounds
+# how long other worker processes keep serving a snapshot taken before the commit.
+SNAPSHOT_TTL = 30
+
+_snapshot = None
+_expires = 0.0
+_version = 0
+_lock = threading.Lock()
+
+
+@dataclass(frozen=True, slots=True)
+class SiteSnapshot:
+    version: int
+    menu_items: tuple
+    menu_by_url: dict
+    settings: dict
+    sections: dict
+
+
+def _freeze(obj):
+    """Plain read-only copy of a row's columns, safe to share between requests and sessions."""
+    return SimpleNamespace(**{attr.key: getattr(obj, attr.key) for attr in inspect(obj).mapper.column_attrs})
+
+
+def load_snapshot():
+    """Read active menu items, all settings and all site sections in three queries."""
+    global _snapshot, _expires, _version
+    menu_items = [_freeze(item) for item in MenuItem.query.filter_by(is_active=True).order_by(MenuItem.sort_order).all()]
+    menu_by_url = {}
+    for item in sorted(menu_items, key=lambda item: item.id):
+        menu_by_url.setdefault(item.url, item)
+
+    with _lock:
+        _version += 1
+        snapshot = SiteSnapshot(
+            version=_version,
+            menu_items=tuple(menu_items),
+            menu_by_url=menu_by_url,
+            settings={setting.key: setting.value for setting in Setting.query.all()},
+            sections={section.section_key: _freeze(section) for section in SiteSection.query.all()},
+        )
+        _snapshot = snapshot
+        _expires = time.monotonic() + SNAPSHOT_TTL
+    return snapshot
+
+
+def invalidate_snapshot():
+    global _snapshot
+    with _lock:
+        _snapshot = None
+
+
+def get_site_snapshot():
+    snapshot = _snapshot
+    if snapshot is None or _expires < time.monotonic():
+        snapshot = load_snapshot()
+    return snapshot
+
+
+def get_setting(key, default=None):
+    """Value of a Setting row, default when the row is missing."""
+    return get_site_snapshot().settings.get(key, default)
+
+
+def get_menu_items():
+    """Active menu items in display order."""
+    return get_site_snapshot().menu_items
+
+
+def get_menu_item_for_url(url):
+    """Active menu item pointing to url, or None."""
+    return get_site_snapshot().menu_by_url.get(url)
+
+
+def get_section(section_key):
+    """SiteSection columns for section_key, or None if the section was never saved."""
+    return get_site_snapshot().sections.get(section_key)
+
+
+invalidate_on_commit((MenuItem, Setting, SiteSection), invalidate_snapshot)
@@ -0,0 +1,206 @@
+import os
+import shutil
+import hashlib
+import logging
+import tempfile
+from xml.sax.saxutils import escape
+from sqlalchemy import select, func
+from extensions import db
+from config import Config
+from models import Page, Category, ProductLine, SizeItem, News
+from services.seo import get_canonical_url
+from services.commit_hooks import invalidate_on_commit
+
+logger = logging.getLogger(__name__)
+
+# Protocol limit per sitemap file
+SHARD_SIZE = 50000
+# Bump when the XML layout changes so cached shards are regenerated
+SITEMAP_VERSION = 'v1'
+XMLNS = 'http://www.sitemaps.org/schemas/sitemap/0.9'
+
+
+def get_cache_dir():
+    return os.path.abspath(Config.SITEMAP_CACHE_DIR)
+
+
+def get_sitemap_state():
+    """
+    Signature and URL count of the sitemap in one query.
+
+    The signature covers max(updated_at) where the table has it, plus row count and
+    max(id) of every table the sitemap reads, so inserts and deletes change it too.
+    Edits made through the app (slug renames on tables without updated_at) also
+    purge the cache on commit.
+
+    Returns:
+        (signature, url_count, last_modified)
+    """
+    def scalar(expression, *criteria, joins=()):
+        query = select(expression)
+        for target in joins:
+            query = query.join(target)
+        return query.where(*criteria).scalar_subquery()
+
+    line_joins = (ProductLine.category,)
+    item_joins = (SizeItem.product_line, ProductLine.category)
+    row = db.session.execute(select(
+        scalar(func.max(Page.updated_at)),
+        scalar(func.max(SizeItem.updated_at)),
+        scalar(func.count(Page.id)), scalar(func.max(Page.id)),
+        scalar(func.count(Category.id)), scalar(func.max(Category.id)),
+        scalar(func.count(ProductLine.id)), scalar(func.max(ProductLine.id)),
+        scalar(func.count(SizeItem.id)), scalar(func.max(SizeItem.id)),
+        scalar(func.count(News.id)), scalar(func.max(News.id)), scalar(func.max(News.date)),
+        # URL count: published pages, active catalog entries, published news (+3 section URLs)
+        scalar(func.count(Page.id), Page.is_published == True),
+        scalar(func.count(Category.id), Category.is_active == True),
+        scalar(func.count(ProductLine.id), ProductLine.is_active == True, Category.is_active == True, joins=line_joins),
+        scalar(func.count(SizeItem.id), ProductLine.is_active == True, Category.is_active == True, joins=item_joins),
+        scalar(func.count(News.id), News.is_published == True),
+    )).one()
+
+    url_count = 3 + sum(value or 0 for value in row[13:])
+    signature = hashlib.md5(f'{SITEMAP_VERSION}:{Config.SITE_URL}:{tuple(row)}'.encode()).hexdigest()[:16]
+    last_modified = max((value for value in row[:2] if value is not None), default=None)
+    return signature, url_count, last_modified
+
+
+def _sitemap_sections():
+    """
+    (rows, row -> (loc, lastmod, priority)) for each part of the sitemap in output order.
+
+    rows is a select, or a list for the fixed section URLs. Categories, product
+    lines and size items come from one joined query each instead of walking the
+    relationships per category and per product line.
+    """
+    return [
+        (select(Page.url_path, Page.updated_at).where(Page.is_published == True).order_by(Page.id),
+         lambda row: (get_canonical_url(row.url_path), row.updated_at, '0.8')),
+        ([('/', '1.0'), ('/catalog/', '0.9'), ('/news/', '0.7')],
+         lambda row: (get_canonical_url(row[0]), None, row[1])),
+        (select(Category.slug).where(Category.is_active == True).order_by(Category.id),
+         lambda row: (get_canonical_url(f'/{row.slug}/'), None, '0.8')),
+        (select(Category.slug.label('category_slug'), ProductLine.slug).join(ProductLine.category)
+         .where(Category.is_active == True, ProductLine.is_active == True)
+         .order_by(Category.id, ProductLine.id),
+         lambda row: (get_canonical_url(f'/{row.category_slug}/{row.slug}/'), None, '0.7')),
+        (select(Category.slug.label('category_slug'), ProductLine.slug.label('pl_slug'),
+                SizeItem.size_slug, SizeItem.updated_at)
+         .join(SizeItem.product_line).join(ProductLine.category)
+         .where(Category.is_active == True, ProductLine.is_active == True)
+         .order_by(Category.id, ProductLine.id, SizeItem.id)
+         .execution_options(yield_per=1000),
+         lambda row: (get_canonical_url(f'/{row.category_slug}/{row.pl_slug}/{row.size_slug}/'), row.updated_at, '0.6')),
+        (select(News.slug, News.date).where(News.is_published == True).order_by(News.id),
+         lambda row: (get_canonical_url(f'/news/{row.slug}/'), row.date, '0.5')),
+    ]
+
+
+def iter_sitemap_urls(offset=0, limit=None):
+    """
+    Yield (loc, lastmod, priority) for public URLs, skipping the first offset and stopping after limit.
+
+    Sections that end before offset are only counted; the section where the
+    range starts is read with OFFSET/LIMIT, so a shard does not fetch the URLs
+    of the shards before it.
+    """
+    for rows, to_url in _sitemap_sections():
+        if limit is not None and limit <= 0:
+            return
+        if offset:
+            count = len(rows) if isinstance(rows, list) else db.session.execute(
+                select(func.count()).select_from(rows.subquery())).scalar()
+            if offset >= count:
+                offset -= count
+                continue
+        if isinstance(rows, list):
+            rows = rows[offset:] if limit is None else rows[offset:offset + limit]
+        else:
+            if offset:
+                rows = rows.offset(offset)
+            if limit is not None:
+                rows = rows.limit(limit)
+            rows = db.session.execute(rows)
+        offset = 0
+        for row in rows:
+            if limit is not None:
+                limit -= 1
+            yield to_url(row)
+
+
+def _format_lastmod(value):
+    return value.strftime('%Y-%m-%d') if value else None
+
+
+def iter_shard_xml(shard):
+    """Yield the urlset XML of a 1-based shard in chunks."""
+    yield f'<?xml version="1.0" encoding="UTF-8"?>\n<urlset xmlns="{XMLNS}">\n'
+    for loc, lastmod, priority in iter_sitemap_urls(offset=(shard - 1) * SHARD_SIZE, limit=SHARD_SIZE):
+        lastmod = _format_lastmod(lastmod)
+        yield ('    <url>\n'
+               f'        <loc>{escape(loc)}</loc>\n'
+               + (f'        <lastmod>{lastmod}</lastmod>\n' if lastmod else '')
+               + f'        <priority>{priority}</priority>\n'
+               '    </url>\n')
+    yield '</urlset>\n'
+
+
+def render_index_xml(shard_count, last_modified):
+    lastmod = _format_lastmod(last_modified)
+    entries = ''.join(
+        '    <sitemap>\n'
+        f'        <loc>{escape(get_canonical_url(f"/sitemap-{shard}.xml"))}</loc>\n'
+        + (f'        <lastmod>{lastmod}</lastmod>\n' if lastmod else '')
+        + '    </sitemap>\n'
+        for shard in range(1, shard_count + 1)
+    )
+    return f'<?xml version="1.0" encoding="UTF-8"?>\n<sitemapindex xmlns="{XMLNS}">\n{entries}</sitemapindex>\n'
+
+
+def shard_count(url_count):
+    return max(1, -(-url_count // SHARD_SIZE))
+
+
+def get_cached_path(signature, name):
+    """Path of a cached sitemap file for the current signature, or None if not rendered yet."""
+    path = os.path.join(get_cache_dir(), signature, name)
+    return path if os.path.exists(path) else None
+
+
+def stream_and_cache(signature, name, chunks):
+    """
+    Yield encoded chunks to the client while writing them to the cache.
+
+    The file appears under its final name only after the last chunk, so a
+    client disconnect or error never leaves a truncated shard behind.
+    Older signatures are removed once a new one is written.
+    """
+    cache_dir = get_cache_dir()
+    target_dir = os.path.join(cache_dir, signature)
+    os.makedirs(target_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=target_dir, suffix='.tmp')
+    completed = False
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            for chunk in chunks:
+                data = chunk.encode('utf-8')
+                f.write(data)
+                yield data
+        os.replace(tmp_path, os.path.join(target_dir, name))
+        completed = True
+    finally:
+        if not completed and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    for entry in os.listdir(cache_dir):
+        if entry != signature:
+            shutil.rmtree(os.path.join(cache_dir, entry), ignore_errors=True)
+
+
+def purge_cache():
+    shutil.rmtree(get_cache_dir(), ignore_errors=True)
+
+
+# The cache directory is shared by workers, so purging it reaches all of them
+invalidate_on_commit((Page, Category, ProductLine, SizeItem, News), purge_cache)
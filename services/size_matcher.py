@@ -1,7 +1,40 @@
 import re
+import json
+import hashlib
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Optional
 from bs4 import BeautifulSoup
 
+# Bump when compile_accessory_table output changes; stale indexes fall back to parsing
+TABLE_INDEX_VERSION = 1
 
+
+# Precompiled patterns for parse_size_spec / normalize_table_size
+OUTER_DIAMETER_RE = re.compile(r'^(\d+)')
+FULL_SIZE_RE = re.compile(r'^(\d+(?:/\d+)?)')
+SEGMENT_SPLIT_RE = re.compile(r'\+|\s+')
+SDR_RE = re.compile(r'SDR[\d,\.]+', re.IGNORECASE)
+NXDXT_RE = re.compile(r'^(\d+)x(\d+)(?:x[\d,\.]+)?$', re.IGNORECASE)
+DXT_RE = re.compile(r'^(\d+)(?:x[\d,\.]+)?$')
+TABLE_SLASH_SIZE_RE = re.compile(r'^(\d+)/(\d+)')
+TABLE_SIZE_RE = re.compile(r'^(\d+)')
+
+SIZE_SPEC_CACHE_SIZE = 4096
+
+
+@dataclass(frozen=True, slots=True)
+class SizeSpec:
+    """Parsed size specification of a size item."""
+    inner_diameters: frozenset = frozenset()
+    outer_diameter: Optional[int] = None
+    full_size: Optional[str] = None
+
+
+EMPTY_SIZE_SPEC = SizeSpec()
+
+
+@lru_cache(maxsize=SIZE_SPEC_CACHE_SIZE)
 def parse_size_spec(size_str):
     """
     Parse size specification string and extract inner diameters and outer diameter.
@@ -15,11 +48,13 @@ def parse_size_spec(size_str):
     - "2x40x3,7+40x5,5+32x4,4/160" -> inner: [40, 32], outer: 160
     - "32+32 SDR11 32+25 SDR7,4/145" -> inner: [32, 25], outer: 145
     
+    Results are memoised by the raw string, SizeSpec is immutable so sharing is safe.
+    
     Returns:
-        dict with 'inner_diameters' (set of ints) and 'outer_diameter' (int or None)
+        SizeSpec with inner_diameters (frozenset of ints), outer_diameter and full_size
     """
     if not size_str:
-        return {'inner_diameters': set(), 'outer_diameter': None, 'full_size': None}
+        return EMPTY_SIZE_SPEC
     
     size_str = size_str.strip()
     
@@ -29,10 +64,10 @@ def parse_size_spec(size_str):
         before_slash = parts[0].strip()
         after_slash = parts[1].strip()
         
-        outer_match = re.match(r'^(\d+)', after_slash)
+        outer_match = OUTER_DIAMETER_RE.match(after_slash)
         outer_diameter = int(outer_match.group(1)) if outer_match else None
         
-        full_size_match = re.match(r'^(\d+(?:/\d+)?)', size_str)
+        full_size_match = FULL_SIZE_RE.match(size_str)
         full_size = full_size_match.group(1) if full_size_match else None
     else:
         before_slash = size_str
@@ -41,33 +76,24 @@ def parse_size_spec(size_str):
     
     inner_diameters = set()
     
-    segments = re.split(r'\+|\s+', before_slash)
-    
-    for segment in segments:
+    for segment in SEGMENT_SPLIT_RE.split(before_slash):
         segment = segment.strip()
         if not segment:
             continue
         
-        segment = re.sub(r'SDR[\d,\.]+', '', segment, flags=re.IGNORECASE).strip()
+        segment = SDR_RE.sub('', segment).strip()
         segment = segment.replace('х', 'x')
         
-        nxdxt_match = re.match(r'^(\d+)x(\d+)(?:x[\d,\.]+)?$', segment, re.IGNORECASE)
+        nxdxt_match = NXDXT_RE.match(segment)
         if nxdxt_match:
-            diameter = int(nxdxt_match.group(2))
-            inner_diameters.add(diameter)
+            inner_diameters.add(int(nxdxt_match.group(2)))
             continue
         
-        dxt_match = re.match(r'^(\d+)(?:x[\d,\.]+)?$', segment)
+        dxt_match = DXT_RE.match(segment)
         if dxt_match:
-            diameter = int(dxt_match.group(1))
-            inner_diameters.add(diameter)
-            continue
+            inner_diameters.add(int(dxt_match.group(1)))
     
-    return {
-        'inner_diameters': inner_diameters,
-        'outer_diameter': outer_diameter,
-        'full_size': full_size
-    }
+    return SizeSpec(frozenset(inner_diameters), outer_diameter, full_size)
 
 
 def normalize_table_size(cell_value):
@@ -87,7 +113,7 @@ def normalize_table_size(cell_value):
     cell_value = str(cell_value).strip()
     
     if '/' in cell_value:
-        match = re.match(r'^(\d+)/(\d+)', cell_value)
+        match = TABLE_SLASH_SIZE_RE.match(cell_value)
         if match:
             inner = int(match.group(1))
             outer = int(match.group(2))
@@ -99,7 +125,7 @@ def normalize_table_size(cell_value):
                 'outer': outer
             }
     
-    match = re.match(r'^(\d+)', cell_value)
+    match = TABLE_SIZE_RE.match(cell_value)
     if match:
         val = int(match.group(1))
         return {
@@ -113,21 +139,13 @@ def normalize_table_size(cell_value):
     return None
 
 
-def filter_accessory_table(table_html, size_spec, use_outer_diameter=False):
+def _parse_accessory_table(table_html):
     """
-    Filter HTML table rows based on size specification matching.
+    Parse accessory table HTML into (soup, table, header_row, data_rows).
     
-    Args:
-        table_html: HTML string containing a table
-        size_spec: dict from parse_size_spec()
-        use_outer_diameter: if True, match against outer diameter instead of inner
-        
     Returns:
-        Filtered HTML table string or None if no matches
+        Tuple or None if there is no <table>
     """
-    if not table_html or not size_spec:
-        return None
-    
     soup = BeautifulSoup(table_html, 'html.parser')
     table = soup.find('table')
     
@@ -154,61 +172,230 @@ def filter_accessory_table(table_html, size_spec, use_outer_diameter=False):
         else:
             data_rows = all_rows[1:] if all_rows else []
     
+    return soup, table, header_row, data_rows
+
+
+def _build_match_table(soup, table, header_row, rows):
+    new_table = soup.new_tag('table')
+    
+    for attr, value in table.attrs.items():
+        new_table[attr] = value
+    
+    if 'class' not in new_table.attrs:
+        new_table['class'] = []
+    if 'accessory-match-table' not in new_table.get('class', []):
+        new_table['class'] = list(new_table.get('class', [])) + ['accessory-match-table']
+    
+    if header_row:
+        new_thead = soup.new_tag('thead')
+        new_thead.append(header_row.__copy__())
+        new_table.append(new_thead)
+    
+    new_tbody = soup.new_tag('tbody')
+    for row in rows:
+        new_tbody.append(row.__copy__())
+    new_table.append(new_tbody)
+    
+    return new_table
+
+
+def _first_cell_size(row):
+    cells = row.find_all(['td', 'th'])
+    if not cells:
+        return None
+    return normalize_table_size(cells[0].get_text(strip=True))
+
+
+def filter_accessory_table(table_html, size_spec, use_outer_diameter=False):
+    """
+    Filter HTML table rows based on size specification matching.
+    
+    Reference implementation of the compiled lookup in match_compiled_table,
+    parses the HTML on every call.
+    
+    Args:
+        table_html: HTML string containing a table
+        size_spec: SizeSpec from parse_size_spec()
+        use_outer_diameter: if True, match against outer diameter instead of inner
+        
+    Returns:
+        Filtered HTML table string or None if no matches
+    """
+    if not table_html or not size_spec:
+        return None
+    
+    parsed = _parse_accessory_table(table_html)
+    if not parsed:
+        return None
+    soup, table, header_row, data_rows = parsed
+    
     matched_rows = []
     
     for row in data_rows:
-        cells = row.find_all(['td', 'th'])
-        if not cells:
-            continue
-        
-        first_cell_value = cells[0].get_text(strip=True)
-        normalized = normalize_table_size(first_cell_value)
+        normalized = _first_cell_size(row)
         
         if not normalized:
             continue
         
         if normalized['has_slash']:
-            if size_spec['full_size'] and normalized['full'] == size_spec['full_size']:
+            if size_spec.full_size and normalized['full'] == size_spec.full_size:
                 matched_rows.append(row)
-            elif use_outer_diameter and size_spec['outer_diameter']:
-                if normalized['outer'] == size_spec['outer_diameter']:
+            elif use_outer_diameter and size_spec.outer_diameter:
+                if normalized['outer'] == size_spec.outer_diameter:
                     matched_rows.append(row)
-            elif not use_outer_diameter and normalized['inner'] in size_spec['inner_diameters']:
+            elif not use_outer_diameter and normalized['inner'] in size_spec.inner_diameters:
                 matched_rows.append(row)
         else:
             cell_value = normalized['value']
             
             if use_outer_diameter:
-                if size_spec['outer_diameter'] and cell_value == size_spec['outer_diameter']:
+                if size_spec.outer_diameter and cell_value == size_spec.outer_diameter:
                     matched_rows.append(row)
             else:
-                if cell_value in size_spec['inner_diameters']:
+                if cell_value in size_spec.inner_diameters:
                     matched_rows.append(row)
     
     if not matched_rows:
         return None
     
-    new_table = soup.new_tag('table')
+    return str(_build_match_table(soup, table, header_row, matched_rows))
+
+
+def _table_checksum(table_html):
+    return hashlib.md5((table_html or '').encode()).hexdigest()
+
+
+def compile_accessory_table(table_html):
+    """
+    Compile accessory table into a JSON row index for match_compiled_table.
     
-    for attr, value in table.attrs.items():
-        new_table[attr] = value
+    The index keeps the pre-rendered table shell (attributes, header, <tbody>)
+    and every sized row as HTML, plus row numbers keyed by the first cell size:
+    'full' ("32/75"), 'outer' and 'inner' for rows with a slash, 'plain' for bare
+    diameters. Matching a size item is then a few dict lookups.
     
-    if 'class' not in new_table.attrs:
-        new_table['class'] = []
-    if 'accessory-match-table' not in new_table.get('class', []):
-        new_table['class'] = list(new_table.get('class', [])) + ['accessory-match-table']
+    Returns:
+        JSON string (never None, so compiled blocks can be told from new ones)
+    """
+    index = {
+        'version': TABLE_INDEX_VERSION,
+        'checksum': _table_checksum(table_html),
+        'prefix': '',
+        'suffix': '',
+        'rows': [],
+        'full': {},
+        'outer': {},
+        'inner': {},
+        'plain': {},
+    }
     
-    if header_row:
-        new_thead = soup.new_tag('thead')
-        new_thead.append(header_row.__copy__())
-        new_table.append(new_thead)
+    parsed = _parse_accessory_table(table_html) if table_html else None
+    if parsed:
+        soup, table, header_row, data_rows = parsed
+        
+        shell = str(_build_match_table(soup, table, header_row, []))
+        split_at = shell.rindex('</tbody>')
+        index['prefix'] = shell[:split_at]
+        index['suffix'] = shell[split_at:]
+        
+        for row in data_rows:
+            normalized = _first_cell_size(row)
+            if not normalized:
+                continue
+            
+            row_number = len(index['rows'])
+            index['rows'].append(str(row.__copy__()))
+            if normalized['has_slash']:
+                index['full'].setdefault(normalized['full'], []).append(row_number)
+                index['outer'].setdefault(str(normalized['outer']), []).append(row_number)
+                index['inner'].setdefault(str(normalized['inner']), []).append(row_number)
+            else:
+                index['plain'].setdefault(str(normalized['value']), []).append(row_number)
     
-    new_tbody = soup.new_tag('tbody')
-    for row in matched_rows:
-        new_tbody.append(row.__copy__())
-    new_table.append(new_tbody)
+    return json.dumps(index, ensure_ascii=False)
+
+
+@lru_cache(maxsize=256)
+def _load_table_index(table_index):
+    return json.loads(table_index)
+
+
+def load_table_index(table_html, table_index):
+    """Return parsed index if it was compiled from this table_html, else None."""
+    if not table_index:
+        return None
+    try:
+        index = _load_table_index(table_index)
+    except ValueError:
+        return None
+    if index.get('version') != TABLE_INDEX_VERSION or index.get('checksum') != _table_checksum(table_html):
+        return None
+    return index
+
+
+def match_compiled_rows(index, size_spec, use_outer_diameter=False):
+    """
+    Row numbers of a compiled table that fit the size, in table order.
+    
+    Same matching rules as filter_accessory_table.
+    """
+    if not index or not size_spec:
+        return []
+    
+    matched = set()
+    if size_spec.full_size:
+        matched.update(index['full'].get(size_spec.full_size, ()))
+    
+    if use_outer_diameter:
+        if size_spec.outer_diameter:
+            outer = str(size_spec.outer_diameter)
+            matched.update(index['outer'].get(outer, ()))
+            matched.update(index['plain'].get(outer, ()))
+    else:
+        for diameter in size_spec.inner_diameters:
+            inner = str(diameter)
+            matched.update(index['inner'].get(inner, ()))
+            matched.update(index['plain'].get(inner, ()))
+    
+    return sorted(matched)
+
+
+def render_compiled_rows(index, row_numbers):
+    """Assemble the filtered table HTML from compiled rows, None if there are none."""
+    if not row_numbers:
+        return None
+    rows = index['rows']
+    return index['prefix'] + ''.join(rows[i] for i in row_numbers) + index['suffix']
+
+
+def match_compiled_table(index, size_spec, use_outer_diameter=False):
+    """
+    Same result as filter_accessory_table, computed from a compiled index.
+    
+    Returns:
+        Filtered HTML table string or None if no matches
+    """
+    return render_compiled_rows(index, match_compiled_rows(index, size_spec, use_outer_diameter))
+
+
+def compile_accessory_blocks(blocks, only_missing=False):
+    """
+    Store compiled table index on accessory blocks (caller commits).
     
-    return str(new_table)
+    Args:
+        blocks: iterable of AccessoryBlock model instances
+        only_missing: skip blocks that already have a current index
+        
+    Returns:
+        Number of blocks compiled
+    """
+    compiled = 0
+    for block in blocks:
+        if only_missing and load_table_index(block.table_html, block.table_index):
+            continue
+        block.table_index = compile_accessory_table(block.table_html)
+        compiled += 1
+    return compiled
 
 
 def get_matching_accessories(size_item, accessory_blocks):
@@ -238,7 +425,7 @@ def get_matching_accessories(size_item, accessory_blocks):
     
     size_spec = parse_size_spec(size_value)
     
-    if not size_spec['inner_diameters'] and not size_spec['outer_diameter']:
+    if not size_spec.inner_diameters and not size_spec.outer_diameter:
         return []
     
     results = []
@@ -247,11 +434,15 @@ def get_matching_accessories(size_item, accessory_blocks):
         if not block.is_active or not block.table_html:
             continue
         
-        filtered = filter_accessory_table(
-            block.table_html,
-            size_spec,
-            use_outer_diameter=block.use_outer_diameter
-        )
+        index = load_table_index(block.table_html, getattr(block, 'table_index', None))
+        if index:
+            filtered = match_compiled_table(index, size_spec, use_outer_diameter=block.use_outer_diameter)
+        else:
+            filtered = filter_accessory_table(
+                block.table_html,
+                size_spec,
+                use_outer_diameter=block.use_outer_diameter
+            )
         
         if filtered:
             results.append({
@@ -0,0 +1,123 @@
+import logging
+from types import SimpleNamespace
+from extensions import db
+from models import ProductLine, SizeItem, SizePrice
+
+logger = logging.getLogger(__name__)
+
+
+def compute_price(size_item, product_line):
+    """
+    Effective discount, hide flag and display price of a size item.
+
+    Same rules as SizeItem.get_effective_discount / get_effective_hide_price /
+    get_display_price, with the product line passed in instead of loaded per item.
+    """
+    discount = size_item.discount_percent
+    if discount is None:
+        discount = (product_line.discount_percent or 0.0) if product_line else 0.0
+    hide_price = size_item.hide_price
+    if hide_price is None:
+        hide_price = bool(product_line.hide_price) if product_line else False
+
+    if size_item.price is None or size_item.price == 0:
+        display_price = 0.0
+    elif discount > 0:
+        display_price = round(size_item.price * (1 - discount / 100), 2)
+    else:
+        display_price = round(size_item.price, 2)
+
+    return {
+        'size_item_id': size_item.id,
+        'product_line_id': size_item.product_line_id,
+        'effective_discount': discount,
+        'hide_price': hide_price,
+        'display_price': display_price,
+    }
+
+
+def _write_rows(size_items, lines_by_id):
+    rows = [compute_price(si, lines_by_id.get(si.product_line_id)) for si in size_items]
+    if rows:
+        db.session.execute(SizePrice.__table__.insert(), rows)
+    return len(rows)
+
+
+def rebuild_size_prices(product_line_ids=None):
+    """
+    Recompute the price table for the given product lines (all if None).
+
+    Caller commits.
+
+    Returns:
+        Number of price rows written
+    """
+    delete_query = SizePrice.query
+    lines_query = ProductLine.query
+    items_query = SizeItem.query
+    if product_line_ids is not None:
+        product_line_ids = list(product_line_ids)
+        if not product_line_ids:
+            return 0
+        delete_query = delete_query.filter(SizePrice.product_line_id.in_(product_line_ids))
+        lines_query = lines_query.filter(ProductLine.id.in_(product_line_ids))
+        items_query = items_query.filter(SizeItem.product_line_id.in_(product_line_ids))
+
+    delete_query.delete(synchronize_session=False)
+    lines_by_id = {pl.id: pl for pl in lines_query}
+    return _write_rows(items_query.all(), lines_by_id)
+
+
+def refresh_size_items(size_items):
+    """Recompute prices of changed size items. Caller commits."""
+    size_items = [si for si in size_items if si and si.id]
+    if not size_items:
+        return 0
+
+    # Flush so a moved item is not inserted under its old product_line_id
+    db.session.flush()
+    SizePrice.query.filter(
+        SizePrice.size_item_id.in_([si.id for si in size_items])
+    ).delete(synchronize_session=False)
+
+    line_ids = {si.product_line_id for si in size_items}
+    lines_by_id = {pl.id: pl for pl in ProductLine.query.filter(ProductLine.id.in_(line_ids))}
+    return _write_rows(size_items, lines_by_id)
+
+
+def load_line_table(product_line):
+    """
+    Size items of a product line in size order with their prices, in one query.
+
+    Ordering uses the (product_line_id, sort_key) index. Price rows missing from
+    the table or left from another line (data changed outside the admin) are
+    computed on the fly so the page is never wrong.
+
+    Returns:
+        (size_items, prices) where prices maps size_item_id to an object with
+        effective_discount, hide_price and display_price
+    """
+    rows = db.session.query(SizeItem, SizePrice).outerjoin(SizeItem.price_row).filter(
+        SizeItem.product_line_id == product_line.id
+    ).order_by(SizeItem.sort_key, SizeItem.id).all()
+
+    size_items = []
+    prices = {}
+    for size_item, price in rows:
+        size_items.append(size_item)
+        if price is None or price.product_line_id != product_line.id:
+            price = SimpleNamespace(**compute_price(size_item, product_line))
+        prices[size_item.id] = price
+    return size_items, prices
+
+
+def ensure_size_prices():
+    """Build the price table on first start (table created empty by create_all)."""
+    if SizePrice.query.first() is not None:
+        return 0
+    if SizeItem.query.first() is None:
+        return 0
+    written = rebuild_size_prices()
+    db.session.commit()
+    logger.info(f"Size price table built: {written} rows")
+    return written
@@ -1,24 +1,13 @@
 import requests
 import logging
-from models import Setting
+from services.site_config import get_setting
 
 logger = logging.getLogger(__name__)
 
 
 def get_telegram_settings():
     """Get Telegram bot token and chat ID from database settings."""
-    token = None
-    chat_id = None
-    
-    token_setting = Setting.query.filter_by(key='TELEGRAM_TOKEN').first()
-    if token_setting:
-        token = token_setting.value
-    
-    chat_id_setting = Setting.query.filter_by(key='TELEGRAM_CHAT_ID').first()
-    if chat_id_setting:
-        chat_id = chat_id_setting.value
-    
-    return token, chat_id
+    return get_setting('TELEGRAM_TOKEN'), get_setting('TELEGRAM_CHAT_ID')
 
 
 def send_lead_to_telegram(name, phone, email, message, page_url='', utm_params=None):
@@ -0,0 +1,341 @@
+import os
+import time
+import shutil
+import hashlib
+import logging
+import threading
+from PIL import features
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from config import Config
+from models import Setting, GALLERY_IMAGE_MODELS
+from services.site_config import get_setting
+from services.image_utils import (get_watermarked_image_bytes, get_resized_image_bytes,
+                                  WATERMARK_ENGINES, DEFAULT_WATERMARK_ENGINE)
+
+logger = logging.getLogger(__name__)
+
+# Bump when the rendering algorithm changes so stale renders are not served.
+RENDER_VERSION = 'v2'
+
+CONTENT_TYPES = {
+    'JPEG': 'image/jpeg',
+    'PNG': 'image/png',
+    'WEBP': 'image/webp',
+    'AVIF': 'image/avif',
+}
+
+EXTENSIONS = {
+    'JPEG': 'jpg',
+    'PNG': 'png',
+    'WEBP': 'webp',
+    'AVIF': 'avif',
+}
+
+AVIF_SUPPORTED = features.check('avif')
+
+# Responsive derivative widths (srcset); the largest matches image_uploader.MAX_SIZE
+WIDTH_BUCKETS = (320, 640, 1024, 1920)
+
+# Validators of recently served /wm/ responses, checked before any DB or file access.
+# Cleared locally on commits touching gallery images or settings; the TTL bounds
+# staleness across worker processes that did not see the commit.
+ETAG_MEMO_TTL = 60
+ETAG_MEMO_MAX_ENTRIES = 10000
+
+_etag_memo = {}
+_etag_memo_lock = threading.Lock()
+
+# Running estimate of the cache size in this process: set by each full scan in
+# evict_lru and grown by our own writes, so the directory is only walked when
+# the estimate crosses the limit. Writes of other processes are seen at the next
+# scan, so the cache may overshoot the limit by their share of the eviction slack.
+_cache_bytes = None
+_cache_bytes_lock = threading.Lock()
+
+
+def get_cache_dir():
+    return os.path.abspath(Config.WATERMARK_CACHE_DIR)
+
+
+def get_watermark_settings():
+    """
+    Return (watermark_path, opacity, engine) from settings.
+
+    Path is None when watermark is off; engine is one of WATERMARK_ENGINES.
+    """
+    watermark_path = get_setting('WATERMARK_IMAGE') or None
+    opacity = float(get_setting('WATERMARK_OPACITY')) if get_setting('WATERMARK_OPACITY') else 1.0
+    engine = get_setting('WATERMARK_ENGINE')
+    if engine not in WATERMARK_ENGINES:
+        engine = DEFAULT_WATERMARK_ENGINE
+    
+    return watermark_path, opacity, engine
+
+
+def get_output_format(image_path):
+    """Pick output format from the source file extension."""
+    ext = os.path.splitext(image_path)[1].lower()
+    if ext in ('.jpg', '.jpeg'):
+        return 'JPEG'
+    elif ext == '.png':
+        return 'PNG'
+    elif ext == '.webp':
+        return 'WEBP'
+    return 'JPEG'
+
+
+def get_preferred_format(accept_mimetypes):
+    """
+    Return the most compact format the client explicitly accepts, or None.
+
+    AVIF (when the installed Pillow can encode it), then WebP.
+    Wildcards like */* do not count, browsers list modern formats explicitly.
+    """
+    accepted = {value.lower() for value, quality in accept_mimetypes if quality > 0}
+    if AVIF_SUPPORTED and 'image/avif' in accepted:
+        return 'AVIF'
+    if 'image/webp' in accepted:
+        return 'WEBP'
+    return None
+
+
+def remember_validators(memo_key, etag, last_modified):
+    """Store ETag and Last-Modified of a served variant for conditional requests."""
+    if not etag:
+        return
+    with _etag_memo_lock:
+        if len(_etag_memo) >= ETAG_MEMO_MAX_ENTRIES:
+            _etag_memo.clear()
+        _etag_memo[memo_key] = (etag, last_modified, time.monotonic() + ETAG_MEMO_TTL)
+
+
+def lookup_validators(memo_key):
+    """Return (etag, last_modified) remembered for a variant, or None if unknown or expired."""
+    entry = _etag_memo.get(memo_key)
+    if not entry:
+        return None
+    etag, last_modified, expires = entry
+    if expires < time.monotonic():
+        with _etag_memo_lock:
+            _etag_memo.pop(memo_key, None)
+        return None
+    return etag, last_modified
+
+
+def forget_validators():
+    """Drop all remembered validators (images or watermark settings changed)."""
+    with _etag_memo_lock:
+        _etag_memo.clear()
+
+
+_VALIDATOR_MODELS = tuple(GALLERY_IMAGE_MODELS.values()) + (Setting,)
+
+
+@event.listens_for(Session, 'after_flush')
+def _forget_validators_on_change(session, flush_context):
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, _VALIDATOR_MODELS):
+            forget_validators()
+            return
+
+
+def snap_width(width):
+    """Snap requested width to the nearest bucket that is not smaller; None for full size."""
+    try:
+        width = int(width)
+    except (TypeError, ValueError):
+        return None
+    if width <= 0:
+        return None
+    for bucket in WIDTH_BUCKETS:
+        if width <= bucket:
+            return bucket
+    return WIDTH_BUCKETS[-1]
+
+
+def build_cache_key(image_path, watermark_path, opacity, rotation, output_format, width=None):
+    """
+    Build content-addressed cache key for a rendered image variant.
+
+    The key covers everything the output depends on: source file path, mtime and size,
+    watermark file path and mtime (or no watermark), opacity, rotation, output format
+    and width bucket.
+
+    Returns:
+        Hex digest string, or None if source or watermark file is missing
+    """
+    img_full_path = image_path.lstrip('/')
+
+    try:
+        img_stat = os.stat(img_full_path)
+        if watermark_path:
+            wm_full_path = watermark_path.lstrip('/')
+            wm_part = f'{wm_full_path}|{os.stat(wm_full_path).st_mtime_ns}|{float(opacity):.3f}'
+        else:
+            wm_part = '-'
+    except OSError:
+        return None
+
+    parts = [
+        RENDER_VERSION,
+        img_full_path, str(img_stat.st_mtime_ns), str(img_stat.st_size),
+        wm_part,
+        str(int(rotation or 0)),
+        output_format.upper(),
+        str(width or 0),
+    ]
+    return hashlib.sha256('|'.join(parts).encode()).hexdigest()
+
+
+def _cache_path(cache_key, output_format):
+    ext = EXTENSIONS.get(output_format.upper(), 'jpg')
+    return os.path.join(get_cache_dir(), cache_key[:2], f'{cache_key}.{ext}')
+
+
+def get_cached_path(cache_key, output_format):
+    """Return path of cached render or None. Marks entry as recently used."""
+    path = _cache_path(cache_key, output_format)
+    try:
+        stat = os.stat(path)
+        # atime is the LRU clock, mtime stays the render input mtime for Last-Modified
+        os.utime(path, (time.time(), stat.st_mtime))
+    except OSError:
+        return None
+    return path
+
+
+def store_render(cache_key, output_format, data, source_mtime=None):
+    """Atomically write rendered bytes into the cache and enforce the size limit."""
+    global _cache_bytes
+    path = _cache_path(cache_key, output_format)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        if source_mtime:
+            os.utime(tmp_path, (time.time(), source_mtime))
+        try:
+            replaced_size = os.path.getsize(path)
+        except OSError:
+            replaced_size = 0
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logger.error(f"Watermark cache write failed: {e}")
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        return None
+
+    with _cache_bytes_lock:
+        if _cache_bytes is not None:
+            _cache_bytes += len(data) - replaced_size
+        over_limit = _cache_bytes is None or _cache_bytes > Config.WATERMARK_CACHE_MAX_BYTES
+    if over_limit:
+        evict_lru(Config.WATERMARK_CACHE_MAX_BYTES)
+    return path
+
+
+def evict_lru(max_bytes):
+    """Remove least recently used renders until cache fits into max_bytes. Walks the whole cache."""
+    global _cache_bytes
+    cache_dir = get_cache_dir()
+    if not os.path.isdir(cache_dir):
+        with _cache_bytes_lock:
+            _cache_bytes = 0
+        return 0
+
+    entries = []
+    total = 0
+    for root, _, files in os.walk(cache_dir):
+        for name in files:
+            path = os.path.join(root, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_atime, stat.st_size, path))
+            total += stat.st_size
+
+    if total <= max_bytes:
+        with _cache_bytes_lock:
+            _cache_bytes = total
+        return 0
+
+    # Free a bit more than needed so every write does not trigger eviction
+    target = int(max_bytes * 0.9)
+    removed = 0
+    entries.sort()
+    for _, size, path in entries:
+        if total <= target:
+            break
+        try:
+            os.remove(path)
+            total -= size
+            removed += 1
+        except OSError:
+            continue
+    with _cache_bytes_lock:
+        _cache_bytes = total
+    return removed
+
+
+def purge_cache():
+    """Drop all cached renders (watermark image was replaced or removed)."""
+    global _cache_bytes
+    forget_validators()
+    cache_dir = get_cache_dir()
+    if os.path.isdir(cache_dir):
+        shutil.rmtree(cache_dir, ignore_errors=True)
+    with _cache_bytes_lock:
+        _cache_bytes = 0
+
+
+def render_variant(image_path, watermark_path=None, opacity=1.0, rotation=0, output_format=None, width=None, engine=None):
+    """
+    Return cached image variant, rendering and storing it on miss.
+
+    Args:
+        image_path: Path to the original image
+        watermark_path: Path to the watermark image, None for a plain resized derivative
+        opacity: Opacity of the watermark (0.1 - 1.0)
+        rotation: Image rotation in degrees (part of the cache key)
+        output_format: 'JPEG', 'PNG', 'WEBP' or 'AVIF'; derived from extension if None
+        width: Width bucket from WIDTH_BUCKETS, None for full size
+        engine: Watermark compositing engine (not part of the key, engines render identically)
+
+    Returns:
+        Tuple of (cache_path, cache_key) or (None, None) on error
+    """
+    if output_format is None:
+        output_format = get_output_format(image_path)
+
+    cache_key = build_cache_key(image_path, watermark_path, opacity, rotation, output_format, width)
+    if not cache_key:
+        return None, None
+
+    cached_path = get_cached_path(cache_key, output_format)
+    if cached_path:
+        return cached_path, cache_key
+
+    if watermark_path:
+        image_bytes, _ = get_watermarked_image_bytes(image_path, watermark_path, output_format, opacity,
+                                                     max_width=width, engine=engine)
+    else:
+        image_bytes, _ = get_resized_image_bytes(image_path, output_format, max_width=width)
+    if not image_bytes:
+        return None, None
+
+    try:
+        source_mtime = os.path.getmtime(image_path.lstrip('/'))
+        if watermark_path:
+            source_mtime = max(source_mtime, os.path.getmtime(watermark_path.lstrip('/')))
+    except OSError:
+        source_mtime = None
+
+    cached_path = store_render(cache_key, output_format, image_bytes, source_mtime)
+    if not cached_path:
+        return None, None
+    return cached_path, cache_key
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""Micro-benchmark for watermark rendering on uploaded product images.
+
+Usage: python tools/bench_watermark.py [images_dir] [watermark_path] [repeats]
+Run from the project root.
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.image_utils import apply_watermark, _load_watermark_tile
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp')
+
+
+def bench(images, watermark_path, repeats, cold):
+    timings = []
+    for image_path in images:
+        best = None
+        for _ in range(repeats):
+            if cold:
+                _load_watermark_tile.cache_clear()
+            start = time.perf_counter()
+            apply_watermark(image_path, watermark_path, opacity=0.5)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        timings.append(best)
+    return timings
+
+
+def main():
+    images_dir = sys.argv[1] if len(sys.argv) > 1 else 'static/uploads/products'
+    watermark_path = sys.argv[2] if len(sys.argv) > 2 else 'static/uploads/watermark/watermark.png'
+    repeats = int(sys.argv[3]) if len(sys.argv) > 3 else 3
+    
+    images = sorted(
+        os.path.join(images_dir, name) for name in os.listdir(images_dir)
+        if name.lower().endswith(IMAGE_EXTENSIONS)
+    )
+    if not images:
+        print(f"Нет изображений в {images_dir}")
+        return
+    
+    cold = bench(images, watermark_path, repeats, cold=True)
+    # Warm up tile cache once, then measure per-image composite only
+    bench(images, watermark_path, 1, cold=False)
+    warm = bench(images, watermark_path, repeats, cold=False)
+    
+    print(f"{'image':<45} {'no cache, ms':>13} {'tile cache, ms':>15}")
+    for image_path, c, w in zip(images, cold, warm):
+        print(f"{os.path.basename(image_path):<45} {c * 1000:>13.1f} {w * 1000:>15.1f}")
+    print(f"{'TOTAL':<45} {sum(cold) * 1000:>13.1f} {sum(warm) * 1000:>15.1f}")
+    print(f"Ускорение: {sum(cold) / sum(warm):.2f}x")
+
+
+if __name__ == '__main__':
+    main()
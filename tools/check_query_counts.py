@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""Check that catalog pages run a fixed number of SQL queries.
+
+Renders the home page, the services list, every active category and every
+active product line with the test client and counts SQL statements per
+request. Pages of the same kind must issue the same number of queries no
+matter how many product lines, images or accessory blocks they show;
+a count that grows with the content means an N+1 came back. Product lines
+with accessory blocks are a separate kind: loading block galleries is one
+extra query, whatever the number of blocks.
+
+Usage: python tools/check_query_counts.py
+Run from the project root with DATABASE_URL pointing at the catalog.
+"""
+import os
+import sys
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Count what the views do, not what the page cache saves
+os.environ['PAGE_CACHE_BACKEND'] = 'none'
+
+from sqlalchemy import event
+
+
+def main():
+    from app import app
+    from extensions import db
+    from models import Category, ProductLine
+
+    counter = {'queries': 0}
+
+    with app.app_context():
+        @event.listens_for(db.engine, 'before_cursor_execute')
+        def count_query(*args):
+            counter['queries'] += 1
+
+        pages = [('index', '/'), ('services', '/services/')]
+        for category in Category.query.filter_by(is_active=True).all():
+            pages.append(('category', f'/{category.slug}/'))
+            for pl in ProductLine.query.filter_by(category_id=category.id, is_active=True).all():
+                # selectinload issues its query only when there are blocks to load images for
+                has_blocks = pl.accessory_blocks.filter_by(is_active=True).count() > 0
+                pages.append(('product_line+acc' if has_blocks else 'product_line', f'/{category.slug}/{pl.slug}/'))
+
+    client = app.test_client()
+    counts = defaultdict(dict)
+    for kind, url in pages:
+        client.get(url)  # warm up menu/settings lookups that are cached per process
+        counter['queries'] = 0
+        response = client.get(url)
+        if response.status_code != 200:
+            print(f"  {url}: HTTP {response.status_code}")
+            continue
+        counts[kind][url] = counter['queries']
+
+    failed = False
+    for kind, by_url in counts.items():
+        distinct = sorted(set(by_url.values()))
+        status = 'OK' if len(distinct) == 1 else 'РАЗНОЕ ЧИСЛО ЗАПРОСОВ'
+        print(f"{kind:<18} страниц: {len(by_url):>3}  запросов на страницу: {', '.join(map(str, distinct)):<10} {status}")
+        if len(distinct) > 1:
+            failed = True
+            for url, queries in sorted(by_url.items(), key=lambda item: item[1]):
+                print(f"    {queries:>4}  {url}")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
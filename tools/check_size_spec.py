@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""Check parse_size_spec against the original dict-based implementation.
+
+The corpus is every SizeItem.size_text in the database plus randomly
+generated variants of them (spacing, case, Cyrillic "х", SDR suffixes,
+extra segments). Exits with code 1 on the first mismatches.
+
+Usage: python tools/check_size_spec.py [random_cases] [seed]
+Run from the project root with DATABASE_URL pointing at the catalog.
+"""
+import os
+import re
+import sys
+import random
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def legacy_parse_size_spec(size_str):
+    """parse_size_spec as it was before memoisation, kept verbatim for comparison."""
+    if not size_str:
+        return {'inner_diameters': set(), 'outer_diameter': None, 'full_size': None}
+
+    size_str = size_str.strip()
+
+    parts = size_str.rsplit('/', 1)
+
+    if len(parts) == 2:
+        before_slash = parts[0].strip()
+        after_slash = parts[1].strip()
+
+        outer_match = re.match(r'^(\d+)', after_slash)
+        outer_diameter = int(outer_match.group(1)) if outer_match else None
+
+        full_size_match = re.match(r'^(\d+(?:/\d+)?)', size_str)
+        full_size = full_size_match.group(1) if full_size_match else None
+    else:
+        before_slash = size_str
+        outer_diameter = None
+        full_size = None
+
+    inner_diameters = set()
+
+    segments = re.split(r'\+|\s+', before_slash)
+
+    for segment in segments:
+        segment = segment.strip()
+        if not segment:
+            continue
+
+        segment = re.sub(r'SDR[\d,\.]+', '', segment, flags=re.IGNORECASE).strip()
+        segment = segment.replace('х', 'x')
+
+        nxdxt_match = re.match(r'^(\d+)x(\d+)(?:x[\d,\.]+)?$', segment, re.IGNORECASE)
+        if nxdxt_match:
+            diameter = int(nxdxt_match.group(2))
+            inner_diameters.add(diameter)
+            continue
+
+        dxt_match = re.match(r'^(\d+)(?:x[\d,\.]+)?$', segment)
+        if dxt_match:
+            diameter = int(dxt_match.group(1))
+            inner_diameters.add(diameter)
+            continue
+
+    return {
+        'inner_diameters': inner_diameters,
+        'outer_diameter': outer_diameter,
+        'full_size': full_size
+    }
+
+
+def mutate(rng, size_text):
+    """Random but plausible variation of a real size string."""
+    text = size_text
+    choice = rng.randrange(8)
+    if choice == 0:
+        text = text.replace('x', 'х')
+    elif choice == 1:
+        text = text.upper() if rng.random() < 0.5 else text.lower()
+    elif choice == 2:
+        text = text.replace('/', ' / ') if rng.random() < 0.5 else f'  {text}  '
+    elif choice == 3:
+        text = f'{text} SDR{rng.choice(["11", "7,4", "17.6"])}'
+    elif choice == 4:
+        inner, _, outer = text.rpartition('/')
+        text = f'{inner}+{rng.randint(1, 3)}x{rng.randint(16, 125)}x{rng.randint(1, 9)},{rng.randint(0, 9)}/{outer}'
+    elif choice == 5:
+        text = text.replace('+', ' + ')
+    elif choice == 6:
+        text = text + rng.choice([' Плюс', ' Thermo', '/', 'x', ''])
+    else:
+        text = ''.join(ch for ch in text if rng.random() > 0.1)
+    return text
+
+
+def main():
+    random_cases = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    seed = int(sys.argv[2]) if len(sys.argv) > 2 else 0
+
+    from app import app
+    from models import SizeItem
+    from services.size_matcher import parse_size_spec
+
+    with app.app_context():
+        corpus = sorted({item.size_text for item in SizeItem.query.all() if item.size_text is not None})
+
+    rng = random.Random(seed)
+    cases = list(corpus) + ['', None]
+    if corpus:
+        cases += [mutate(rng, rng.choice(corpus)) for _ in range(random_cases)]
+
+    mismatches = []
+    for size_text in cases:
+        expected = legacy_parse_size_spec(size_text)
+        spec = parse_size_spec(size_text)
+        actual = {
+            'inner_diameters': set(spec.inner_diameters),
+            'outer_diameter': spec.outer_diameter,
+            'full_size': spec.full_size,
+        }
+        if actual != expected:
+            mismatches.append((size_text, expected, actual))
+
+    print(f"Размеров в базе: {len(corpus)}, проверено строк: {len(cases)}, расхождений: {len(mismatches)}")
+    for size_text, expected, actual in mismatches[:20]:
+        print(f"  {size_text!r}: было {expected}, стало {actual}")
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == '__main__':
+    main()